@@ -7,82 +7,150 @@ import argparse
 import logging
 import json
 
-from moviepy.editor import VideoFileClip
-from operations import (
-    add_subtitles,
-    add_titles,
-    audio_generator,
-    denoise_video,
-    generate_transcript,
-    generate_video_base,
-    save_joined_video,
-    save_separated_video,
-    save_video,
-    set_horizontal,
-    set_vertical,
-    trim_by_silence,
-    video_translation,
-    generate_avatar_video,
-    generate_transcript_divided,
-)
+import operations
 from config_loader import config_data
-from utils import get_audio, get_video_data, str2bool
+from utils import get_audio, get_video_data, str2bool, str2target
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Dictionary for functions in the "video_edit" command
-functions_dict = {
-    "trim_by_silence": trim_by_silence,
-    "denoise": denoise_video,
-    "transcript": generate_transcript,
-    "transcript_divided": generate_transcript_divided,
-    "subtitles": add_subtitles,
-    "save_separated_video": save_separated_video,
-    "save_join": save_joined_video,
-    "save_video": save_video,
-    "set_vertical": set_vertical,
-    "set_horizontal": set_horizontal,
-}
+functions_dict = operations.OperationRegistry(
+    {
+        "trim_by_silence": "trim_by_silence",
+        "denoise": "denoise_video",
+        "transcript": "generate_transcript",
+        "transcript_divided": "generate_transcript_divided",
+        "subtitles": "add_subtitles",
+        "save_separated_video": "save_separated_video",
+        "save_join": "save_joined_video",
+        "save_video": "save_video",
+        "set_vertical": "set_vertical",
+        "set_horizontal": "set_horizontal",
+    }
+)
 
 
 def video_edit_command(args):
     """Executes a sequence of operations for video editing."""
+    if args.fuse or args.explain:
+        plan = operations.build_plan(args.pipeline)
+        if args.explain:
+            print(plan.explain())
+            return
+        if not plan.fusible:
+            logger.info(
+                "Pipeline cannot be fused (%s), running it with MoviePy.",
+                plan.fallback_reason,
+            )
     for input_file in args.input_file:
         kwargs = {
             "video_path": input_file,
             "clip_interval": args.clip_interval,
             "sound_threshold": args.sound_threshold,
             "discard_silence": args.discard_silence,
+            "refine_boundaries": args.refine_boundaries,
+            "min_silence": args.min_silence,
+            "hysteresis": args.hysteresis,
+            "render_workers": args.render_workers,
+            "export_parts": args.export_parts,
+            "transcribe_workers": args.transcribe_workers,
+            "cpu_threads": args.cpu_threads,
+            "vad": args.vad,
+            "draft_model": args.draft_model,
+            "transcript_formats": args.transcript_formats,
+            "denoise_model": args.denoise_model,
+            "denoise_quantize": args.denoise_quantize,
+            "denoise_threads": args.denoise_threads,
             "config_data": config_data,
         }
         kwargs = get_video_data(**kwargs)
+        if args.fuse and plan.fusible:
+            operations.execute_plan(plan, kwargs, functions_dict)
+            continue
         for step in args.pipeline:
             if step not in functions_dict:
                 raise ValueError(
                     f"Function {step} not found. \
                         Available options: {', '.join(functions_dict.keys())}"
                 )
-            logger.info("Applying %s to %s", step, input_file)
-            kwargs = functions_dict[step](**kwargs)
+        if args.pipeline_workers > 1 and not args.resume:
+            operations.run_pipeline_graph(
+                args.pipeline, kwargs, functions_dict, args.pipeline_workers
+            )
+            continue
+        run = operations.PipelineRun(
+            args.pipeline, kwargs, args.run_dir, args.resume, args.keep_edited
+        )
+        run.run(functions_dict)
 
 
 def separate_audio_command(args):
     """Separates audio from video files."""
+    # Not moviepy.editor, which also imports the effects and preview modules
+    from moviepy.video.io.VideoFileClip import VideoFileClip
+
     for file in args.files:
         clip = VideoFileClip(file)
         audio_path = get_audio(clip, file[:-4])
         logger.info("Audio saved to: %s", audio_path)
 
 
+def split_str_command(args):
+    """Rewrites SRT files with a new number of words (and duration) per subtitle."""
+    for file in args.files:
+        output_path = operations.resegment_subtitles(
+            file, args.words_per_subtitle, args.max_duration, args.format
+        )
+        logger.info("Subtitles saved to: %s", output_path)
+
+
+def tune_command(args):
+    """Benchmarks Whisper settings on a sample and saves the best per model."""
+    best = operations.tune_whisper(
+        args.file,
+        args.models,
+        args.sample_start,
+        args.sample_seconds,
+        args.compute_types,
+        args.threads,
+        args.num_workers,
+        args.beam_sizes,
+    )
+    for model_size, settings in best.items():
+        logger.info("Best settings for '%s': %s", model_size, settings)
+
+
+def denoise_check_command(args):
+    """Compares denoiser variants to full-precision dns64 on a sample."""
+    candidates = [
+        (model_name, quantize)
+        for model_name in args.models
+        for quantize in (False, True)
+        if model_name != "dns64" or quantize
+    ]
+    operations.check_denoisers(
+        args.file,
+        candidates,
+        args.sample_start,
+        args.sample_seconds,
+        args.threads,
+        args.repeats,
+    )
+
+
 def voice_command(args):
     """Performs voice operations: video translation or audio generation."""
-    if args.operation == "video_translation":
+    if args.operation == "video_translation" and args.targets:
+        logger.info("Starting multi-target video translation...")
+        targets = dict(args.targets)
+        operations.video_translation_multi(args.video_path, targets, args.language)
+    elif args.operation == "video_translation":
         logger.info("Starting video translation...")
-        video_translation(args.video_path, args.translate, args.language)
+        operations.video_translation(args.video_path, args.translate, args.language)
     elif args.operation == "audio_generator":
         logger.info("Starting audio generation...")
-        audio_generator(args.video_path, args.voice)
+        operations.audio_generator(args.video_path, args.voice, args.target)
     else:
         logger.error("Invalid operation. Use --help for more information.")
 
@@ -90,8 +158,8 @@ def voice_command(args):
 def generator_command(args):
     """Generates a base video or adds titles to a short video."""
     tools = {
-        "base": generate_video_base,
-        "add_titles": add_titles,
+        "base": operations.generate_video_base,
+        "add_titles": operations.add_titles,
     }
     for file in args.files:
         if args.tool not in tools:
@@ -105,20 +173,24 @@ def generator_command(args):
 
 
 def video_gen_avatar_command(args):
-    """Generates a video with avatars based on emotions."""
+    """Generates a video with avatars based on emotions, one output per input file."""
 
     config = None
     with open(args.config, "r", encoding="utf-8") as f:
         config = json.load(f)
     print(config)
 
-    for file in args.files:
-        generate_avatar_video(file, config)
+    operations.generate_avatar_videos_batch(
+        args.files,
+        config,
+        cpu_budget=args.cpu_budget,
+        threads_per_render=args.threads_per_render,
+    )
 
 
-def main():
+def main(argv=None):
     """
-    Main function to parse arguments
+    Main function to parse arguments (argv defaults to the command line)
     """
     parser = argparse.ArgumentParser(
         description="Combined program for video editing and processing"
@@ -157,6 +229,120 @@ def main():
         nargs="?",
         help="Discard silent clips",
     )
+    parser_edit.add_argument(
+        "-r",
+        "--refine_boundaries",
+        const=True,
+        default=False,
+        type=str2bool,
+        nargs="?",
+        help="Place silence cuts at millisecond precision around coarse transitions",
+    )
+    parser_edit.add_argument(
+        "--min_silence",
+        type=float,
+        default=0.3,
+        help="Shortest silence cut with --refine_boundaries, in seconds",
+    )
+    parser_edit.add_argument(
+        "--hysteresis",
+        type=float,
+        default=0.7,
+        help="With --refine_boundaries speech ends below sound_threshold * hysteresis",
+    )
+    parser_edit.add_argument(
+        "--render_workers",
+        type=int,
+        default=1,
+        help="Processes generating frames when saving (1 renders in this process)",
+    )
+    parser_edit.add_argument(
+        "--export_parts",
+        type=int,
+        default=1,
+        help="Time ranges encoded in parallel by save_video/save_join (1 disables)",
+    )
+    parser_edit.add_argument(
+        "--transcribe_workers",
+        type=int,
+        default=1,
+        help="Processes transcribing chunks of long files split at silences",
+    )
+    parser_edit.add_argument(
+        "--cpu_threads",
+        type=int,
+        default=0,
+        help="Whisper threads per transcription worker (0: cores / workers)",
+    )
+    parser_edit.add_argument(
+        "--vad",
+        choices=["none", "silence", "whisper"],
+        default="none",
+        help="Skip non-speech when transcribing: silence map or faster-whisper VAD",
+    )
+    parser_edit.add_argument(
+        "--draft_model",
+        type=str,
+        default=None,
+        help="Cascade: transcribe with this model, redo low-confidence segments",
+    )
+    parser_edit.add_argument(
+        "--transcript_formats",
+        nargs="+",
+        choices=["vtt", "jsonl"],
+        default=[],
+        help="Transcript files written next to the SRT, streamed as Whisper decodes",
+    )
+    parser_edit.add_argument(
+        "--denoise_model",
+        choices=operations.DENOISE_MODELS,
+        default="dns64",
+        help="Denoiser model, dns48 and master64 are lighter",
+    )
+    parser_edit.add_argument(
+        "--denoise_quantize",
+        type=str2bool,
+        default=False,
+        help="Run the denoiser with int8 dynamic quantization (CPU)",
+    )
+    parser_edit.add_argument(
+        "--denoise_threads",
+        type=int,
+        default=None,
+        help="torch threads used by the denoiser (default: torch's choice)",
+    )
+    parser_edit.add_argument(
+        "--pipeline_workers",
+        type=int,
+        default=1,
+        help="Run independent pipeline steps concurrently in this many threads",
+    )
+    parser_edit.add_argument(
+        "--resume",
+        action="store_true",
+        help="Restore the steps of the previous run whose inputs did not change",
+    )
+    parser_edit.add_argument(
+        "--run_dir",
+        type=str,
+        default=".video_edit_runs",
+        help="Directory of the run manifests used by --resume",
+    )
+    parser_edit.add_argument(
+        "--keep_edited",
+        action="store_true",
+        help="With --resume, keep step outputs edited since the run (e.g. an SRT)",
+    )
+    parser_edit.add_argument(
+        "--fuse",
+        action="store_true",
+        help="Compile the pipeline into ffmpeg filtergraphs when every step allows it",
+    )
+    parser_edit.add_argument(
+        "--explain",
+        action="store_true",
+        help="Print how the pipeline would run (fused or MoviePy) and exit",
+    )
     parser_edit.set_defaults(func=video_edit_command)
 
     # Subcommand for separate_audio
@@ -166,6 +352,88 @@ def main():
     parser_separate.add_argument("files", type=str, nargs="+", help="Video file(s)")
     parser_separate.set_defaults(func=separate_audio_command)
 
+    # Subcommand for split_str
+    parser_split = subparsers.add_parser(
+        "split_str", help="Split SRT files by words per subtitle"
+    )
+    parser_split.add_argument("files", type=str, nargs="+", help="SRT file(s)")
+    parser_split.add_argument(
+        "words_per_subtitle", type=int, help="Maximum words per subtitle"
+    )
+    parser_split.add_argument(
+        "--max_duration",
+        type=float,
+        default=None,
+        help="Maximum duration of a subtitle in seconds",
+    )
+    parser_split.add_argument(
+        "--format", choices=["srt", "vtt"], default="srt", help="Output format"
+    )
+    parser_split.set_defaults(func=split_str_command)
+
+    # Subcommand for tune
+    parser_tune = subparsers.add_parser(
+        "tune", help="Benchmark Whisper settings on this machine and save the best"
+    )
+    parser_tune.add_argument("file", type=str, help="Audio or video sample")
+    parser_tune.add_argument(
+        "--models", type=str, nargs="+", default=["turbo"], help="Model sizes"
+    )
+    parser_tune.add_argument(
+        "--sample_start", type=float, default=0.0, help="Sample start in seconds"
+    )
+    parser_tune.add_argument(
+        "--sample_seconds", type=float, default=30, help="Sample length in seconds"
+    )
+    parser_tune.add_argument(
+        "--compute_types",
+        type=str,
+        nargs="+",
+        default=["int8", "float32"],
+        help="CTranslate2 compute types to try",
+    )
+    parser_tune.add_argument(
+        "--threads",
+        type=int,
+        nargs="+",
+        default=None,
+        help="cpu_threads values to try (default: 1/4, 1/2 and all the cores)",
+    )
+    parser_tune.add_argument(
+        "--num_workers", type=int, nargs="+", default=[1], help="num_workers to try"
+    )
+    parser_tune.add_argument(
+        "--beam_sizes", type=int, nargs="+", default=[1, 5], help="Beam sizes to try"
+    )
+    parser_tune.set_defaults(func=tune_command)
+
+    # Subcommand for denoise_check
+    parser_denoise = subparsers.add_parser(
+        "denoise_check",
+        help="Report speedup and SNR of the denoiser variants against dns64",
+    )
+    parser_denoise.add_argument("file", type=str, help="Audio or video sample")
+    parser_denoise.add_argument(
+        "--models",
+        choices=operations.DENOISE_MODELS,
+        nargs="+",
+        default=list(operations.DENOISE_MODELS),
+        help="Models to check, each one in fp32 and int8",
+    )
+    parser_denoise.add_argument(
+        "--sample_start", type=float, default=0.0, help="Sample start in seconds"
+    )
+    parser_denoise.add_argument(
+        "--sample_seconds", type=float, default=20, help="Sample length in seconds"
+    )
+    parser_denoise.add_argument(
+        "--threads", type=int, default=None, help="torch threads"
+    )
+    parser_denoise.add_argument(
+        "--repeats", type=int, default=3, help="Timed runs per model (median)"
+    )
+    parser_denoise.set_defaults(func=denoise_check_command)
+
     # Subcommand for voice operations
     parser_voice = subparsers.add_parser(
         "voice", help="Voice operations: translation or audio generation"
@@ -197,6 +465,19 @@ def main():
         default="en",
         help="Language for translation (default: en)",
     )
+    parser_voice.add_argument(
+        "--targets",
+        type=str2target,
+        nargs="+",
+        default=None,
+        help="Multi-target translation: code=model pairs, e.g. pt=Helsinki-NLP/...",
+    )
+    parser_voice.add_argument(
+        "--target",
+        type=str,
+        default=None,
+        help="audio_generator: target code of a multi-target translation",
+    )
     parser_voice.set_defaults(func=voice_command)
 
     # Subcommand for generator (short video)
@@ -219,9 +500,22 @@ def main():
     parser_avatar.add_argument(
         "config", type=str, help="Path to the configuration file"
     )
+    parser_avatar.add_argument(
+        "--cpu_budget",
+        type=int,
+        default=None,
+        help="CPUs the batch may use to render inputs in parallel (default: all)",
+    )
+    parser_avatar.add_argument(
+        "--threads_per_render",
+        type=int,
+        default=2,
+        help="Encoder threads per render, the number of parallel renders is "
+        "cpu_budget / threads_per_render",
+    )
     parser_avatar.set_defaults(func=video_gen_avatar_command)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     args.func(args)
 
 
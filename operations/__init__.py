@@ -1,11 +1,112 @@
-from .denoise import *
-from .save import *
-from .set_orientation import *
-from .subtitles import *
-from .transcript import *
-from .trim import *
-from .translation import video_translation, audio_generator
-from .shorts import generate_video_base, add_titles
-from .avatar_video_generation import (
-    create_avatar_video_from_audio as generate_avatar_video,
+"""
+Video operations. Submodules are imported on first use (PEP 562), so the CLI
+only pays for torch, faster_whisper, transformers, kokoro or MoviePy when a
+step needs them.
+"""
+
+import importlib
+from collections.abc import Mapping
+
+# Public names by submodule
+_EXPORTS = {
+    ".denoise": (
+        "DENOISE_MODELS",
+        "DEFAULT_DENOISE_MODEL",
+        "load_denoiser",
+        "set_denoise_threads",
+        "denoise_waveform",
+        "denoise_video",
+        "set_denoised_audio",
+        "snr_db",
+        "check_denoisers",
+    ),
+    ".save": (
+        "write_clip",
+        "remux_video",
+        "save_video",
+        "save_joined_video",
+        "save_separated_video",
+    ),
+    ".set_orientation": ("set_vertical", "set_horizontal"),
+    ".subtitles": ("add_subtitles",),
+    ".transcript": (
+        "MODEL_SIZE",
+        "MIN_MODEL_SIZE",
+        "get_transcript_source",
+        "get_transcribe_options",
+        "get_transcript_formats",
+        "generate_transcript",
+        "generate_transcript_divided",
+    ),
+    ".trim": (
+        "DEFAULT_MIN_SILENCE",
+        "DEFAULT_HYSTERESIS",
+        "get_clip_loudness_index",
+        "compute_kept_ranges",
+        "classify_with_hysteresis",
+        "refine_boundary",
+        "detect_speech_ranges",
+        "compute_refined_kept_ranges",
+        "get_kept_ranges",
+        "trim_by_silence",
+        "set_kept_ranges",
+    ),
+    ".translation": ("video_translation", "video_translation_multi", "audio_generator"),
+    ".shorts": ("generate_video_base", "add_titles"),
+    ".planner": ("build_plan", "execute_plan"),
+    ".pipeline_graph": ("describe_graph", "run_pipeline_graph"),
+    ".checkpoint": ("PipelineRun",),
+    ".word_store": ("resegment_subtitles",),
+    ".whisper_tuning": ("tune_whisper",),
+}
+
+# name: (submodule, attribute)
+_LAZY_ATTRIBUTES = {
+    name: (module, name) for module, names in _EXPORTS.items() for name in names
+}
+_LAZY_ATTRIBUTES.update(
+    {
+        "generate_avatar_video": (
+            ".avatar_video_generation",
+            "create_avatar_video_from_audio",
+        ),
+        "generate_avatar_videos_batch": (
+            ".avatar_video_generation",
+            "create_avatar_videos_batch",
+        ),
+    }
 )
+
+__all__ = sorted(_LAZY_ATTRIBUTES) + ["OperationRegistry"]
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attribute = _LAZY_ATTRIBUTES[name]
+    value = getattr(importlib.import_module(module_name, __name__), attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+
+class OperationRegistry(Mapping):
+    """
+    Mapping of step names to operations, each one imported when first looked up.
+    """
+
+    def __init__(self, operations):
+        # step name: public name in this package
+        self._operations = dict(operations)
+
+    def __getitem__(self, step):
+        return __getattr__(self._operations[step])
+
+    def __iter__(self):
+        return iter(self._operations)
+
+    def __len__(self):
+        return len(self._operations)
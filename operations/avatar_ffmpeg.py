@@ -0,0 +1,311 @@
+"""
+Module to render the avatar video with a single native ffmpeg job.
+
+The segment timeline is compiled into an ffmpeg filtergraph: every emotion avatar
+is opened once (-stream_loop) and split into one trimmed branch per timeline
+entry, the entries are joined with concat and the volume-driven shake becomes
+per-frame crop offsets sent from a generated command file. The original audio is
+muxed in, no frame goes through Python.
+
+The branches of an emotion trim consecutive ranges of its looped stream, so an
+emotion plays on from where its previous entry stopped and split never buffers
+more than the current entry.
+"""
+
+import logging
+import math
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from moviepy.config import get_setting
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SHAKE_SEED = 0  # fixed seed, the same timeline always renders the same shake
+# Shorter entries are merged into a neighbour, concat loses one-frame inputs
+MIN_ENTRY_FRAMES = 2
+
+
+def build_render_timeline(
+    segments: Sequence[Any],
+    default_emotion: str,
+    total_duration: float,
+    global_avg_volume: float,
+    shake_factor: float,
+    fps: int,
+) -> List[Tuple[str, int, np.ndarray]]:
+    """
+    Turn the segments into a gapless timeline of (emotion, frame count, per-frame
+    shake intensity). Gaps are filled with the default emotion and no shake.
+    Frame counts come from rounded boundaries, so the timeline does not drift, and
+    entries shorter than MIN_ENTRY_FRAMES are merged into the previous entry (the
+    next one at the start).
+    """
+    timeline: List[Tuple[str, int, np.ndarray]] = []
+    total_frames = int(round(total_duration * fps))
+    cursor = 0
+
+    def add(emotion: str, end_frame: int, intensity: Any) -> None:
+        nonlocal cursor
+        end_frame = min(end_frame, total_frames)
+        frames = end_frame - cursor
+        if frames <= 0:
+            return
+        intensity = np.asarray(intensity, dtype=float)
+        if intensity.ndim:
+            positions = np.linspace(0, len(intensity) - 1, frames).round().astype(int)
+            intensity = intensity[positions]
+        else:
+            intensity = np.full(frames, float(intensity))
+        timeline.append((emotion, frames, intensity))
+        cursor = end_frame
+
+    for seg in segments:
+        add(default_emotion, int(round(seg.start * fps)), 0.0)
+        if global_avg_volume <= 0:
+            intensity = 0.0
+        elif seg.envelope is not None:
+            intensity = seg.envelope / global_avg_volume * shake_factor
+        else:
+            intensity = seg.volume / global_avg_volume * shake_factor
+        add(seg.emotion, int(round(seg.end * fps)), intensity)
+    add(default_emotion, total_frames, 0.0)
+    timeline = merge_short_entries(timeline)
+    assert sum(frames for _, frames, _ in timeline) == total_frames
+    return timeline
+
+
+def merge_short_entries(
+    timeline: List[Tuple[str, int, np.ndarray]],
+) -> List[Tuple[str, int, np.ndarray]]:
+    """
+    Merge the entries shorter than MIN_ENTRY_FRAMES into a neighbour, keeping
+    their frames and shake.
+    """
+    merged: List[Tuple[str, int, np.ndarray]] = []
+    pending: Optional[Tuple[int, np.ndarray]] = None  # short entries at the start
+    for emotion, frames, intensity in timeline:
+        if pending is not None:
+            frames += pending[0]
+            intensity = np.concatenate([pending[1], intensity])
+            pending = None
+        if frames >= MIN_ENTRY_FRAMES:
+            merged.append((emotion, frames, intensity))
+        elif merged:
+            last_emotion, last_frames, last_intensity = merged[-1]
+            merged[-1] = (
+                last_emotion,
+                last_frames + frames,
+                np.concatenate([last_intensity, intensity]),
+            )
+        else:
+            pending = (frames, intensity)
+    if pending is not None:  # the whole timeline is shorter than an entry
+        merged.append((timeline[-1][0], pending[0], pending[1]))
+    return merged
+
+
+def write_shake_commands(
+    path: Path, intensity: np.ndarray, margin: int, fps: int
+) -> None:
+    """
+    Write the sendcmd file with one crop offset per frame. A crop at (margin - dx,
+    margin - dy) of the wrap-padded frame equals np.roll(frame, (dy, dx)), the same
+    shift apply_shake does in the MoviePy path.
+    """
+    rng = np.random.default_rng(SHAKE_SEED)
+    dx = np.trunc(rng.uniform(-intensity, intensity)).astype(int)
+    dy = np.trunc(rng.uniform(-intensity, intensity)).astype(int)
+    times = np.maximum(np.arange(len(intensity)) - 0.5, 0) / fps
+    with path.open("w", encoding="utf-8") as f:
+        for t, x, y in zip(times, margin - dx, margin - dy):
+            f.write(f"{t:.6f} crop x {x}, crop y {y};\n")
+
+
+def escape_filter_path(path: Path) -> str:
+    """
+    Escape a file path to use it as a filter option value.
+    """
+    return str(path).replace("\\", "/").replace("'", "'\\''")
+
+
+def build_ffmpeg_command(
+    timeline: List[Tuple[str, int, np.ndarray]],
+    avatar_map: Dict[str, str],
+    audio_path: Path,
+    output_path: Path,
+    size: Tuple[int, int],
+    fps: int,
+    work_dir: Path,
+    threads: Optional[int] = None,
+) -> List[str]:
+    """
+    Compile the timeline into the ffmpeg command line (filtergraph in a script file).
+    """
+    width, height = size
+    total_frames = sum(frames for _, frames, _ in timeline)
+    intensity = np.concatenate([values for _, _, values in timeline])
+    max_shift = min(width, height) // 2 - 1
+    intensity = np.clip(intensity, 0, max_shift)
+    margin = max(1, int(math.ceil(intensity.max()))) if len(intensity) else 1
+
+    commands_path = work_dir / "shake_commands.txt"
+    write_shake_commands(commands_path, intensity, margin, fps)
+
+    # One input per emotion, in order of first use
+    emotions = list(dict.fromkeys(emotion for emotion, _, _ in timeline))
+    entries: Dict[str, List[int]] = {emotion: [] for emotion in emotions}
+    for i, (emotion, _, _) in enumerate(timeline):
+        entries[emotion].append(i)
+
+    command = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error"]
+    filters = [f"color=c=black:s={width}x{height}:r={fps}[bg]"]
+    for input_index, emotion in enumerate(emotions):
+        command += ["-stream_loop", "-1", "-i", str(avatar_map[emotion])]
+        outputs = "".join(f"[s{i}]" for i in entries[emotion])
+        filters.append(
+            f"[{input_index}:v]fps={fps},scale={width}:{height},setsar=1,"
+            f"format=rgba,split={len(entries[emotion])}{outputs}"
+        )
+        start_frame = 0
+        for i in entries[emotion]:
+            end_frame = start_frame + timeline[i][1]
+            filters.append(
+                f"[s{i}]trim=start_frame={start_frame}:end_frame={end_frame},"
+                f"setpts=PTS-STARTPTS[v{i}]"
+            )
+            start_frame = end_frame
+    command += ["-i", str(audio_path)]
+    inputs = "".join(f"[v{i}]" for i in range(len(timeline)))
+    # Timestamps from the frame number, concat may overlap entries by a frame
+    filters.append(
+        f"{inputs}concat=n={len(timeline)}:v=1:a=0,setpts=N/({fps}*TB)[avatar]"
+    )
+    filters.append(
+        "[bg][avatar]overlay=eof_action=pass:format=auto,"
+        f"pad={width + 2 * margin}:{height + 2 * margin}:{margin}:{margin},"
+        f"fillborders=left={margin}:right={margin}:top={margin}:bottom={margin}"
+        ":mode=wrap,"
+        f"sendcmd=f='{escape_filter_path(commands_path)}',"
+        f"crop={width}:{height}:{margin}:{margin},format=yuv420p[out]"
+    )
+    script_path = work_dir / "filtergraph.txt"
+    script_path.write_text(";\n".join(filters), encoding="utf-8")
+
+    command += [
+        "-filter_complex_script",
+        str(script_path),
+        "-map",
+        "[out]",
+        "-map",
+        f"{len(emotions)}:a:0?",
+        "-frames:v",
+        str(total_frames),
+        "-c:v",
+        "libx264",
+        "-preset",
+        "medium",
+        "-c:a",
+        "aac",
+    ]
+    if threads:
+        command += ["-threads", str(threads)]
+    command.append(str(output_path))
+    return command
+
+
+def count_video_frames(path: Path) -> int:
+    """
+    Number of video frames in path: packets listed by ffmpeg's framecrc muxer,
+    without decoding.
+    """
+    result = subprocess.run(
+        [
+            get_setting("FFMPEG_BINARY"),
+            "-nostdin",
+            "-loglevel",
+            "error",
+            "-i",
+            str(path),
+            "-map",
+            "0:v:0",
+            "-c",
+            "copy",
+            "-f",
+            "framecrc",
+            "-",
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    return sum(
+        1 for line in result.stdout.splitlines() if line and not line.startswith("#")
+    )
+
+
+def render_avatar_video_ffmpeg(
+    segments: Sequence[Any],
+    avatar_map: Dict[str, str],
+    default_emotion: str,
+    audio_path: Path,
+    output_path: Path,
+    total_duration: float,
+    global_avg_volume: float,
+    shake_factor: float,
+    size: Tuple[int, int],
+    fps: int,
+    threads: Optional[int] = None,
+) -> Path:
+    """
+    Render the avatar video with one ffmpeg process.
+
+    Args:
+        segments (Sequence[Any]): Sorted segments (SegmentData or SegmentTable rows).
+        avatar_map (Dict[str, str]): Emotion key -> avatar file, only existing files.
+        default_emotion (str): Emotion used for gaps and unknown emotions.
+        audio_path (Path): Original audio (or video) to mux in.
+        output_path (Path): Where to write the video.
+        total_duration (float): Length of the audio in seconds.
+        global_avg_volume (float): Average volume across all segments.
+        shake_factor (float): Factor controlling shake intensity relative to volume.
+        size (Tuple[int, int]): Output (width, height), the default avatar size.
+        fps (int): Output frame rate.
+        threads (Optional[int]): Threads for the encoder.
+
+    Returns:
+        Path: The output path.
+    """
+    timeline = build_render_timeline(
+        segments, default_emotion, total_duration, global_avg_volume, shake_factor, fps
+    )
+    timeline = [
+        (emotion if emotion in avatar_map else default_emotion, frames, intensity)
+        for emotion, frames, intensity in timeline
+    ]
+    work_dir = Path(tempfile.mkdtemp(prefix="avatar_ffmpeg_"))
+    try:
+        command = build_ffmpeg_command(
+            timeline, avatar_map, audio_path, output_path, size, fps, work_dir, threads
+        )
+        logger.info(
+            "Rendering %d timeline entries with ffmpeg into '%s'...",
+            len(timeline),
+            output_path,
+        )
+        subprocess.run(command, check=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    expected_frames = sum(frames for _, frames, _ in timeline)
+    frames = count_video_frames(output_path)
+    if frames != expected_frames:
+        raise RuntimeError(
+            f"Rendered {frames} frames into '{output_path}', expected "
+            f"{expected_frames}."
+        )
+    return output_path
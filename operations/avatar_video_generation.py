@@ -5,37 +5,47 @@ Module for video generation with an avatar from audio
 import logging
 import os
 import json
+import threading
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from dotenv import load_dotenv
 import numpy as np
 
 from openai import OpenAI
-from faster_whisper import WhisperModel
 from pydub import AudioSegment
 from moviepy.editor import VideoFileClip, AudioFileClip, CompositeVideoClip
 
-from utils import apply_shake, get_subclip_volume_segment
+from utils import LoudnessIndex, apply_shake, load_or_build_loudness_index
+from .avatar_ffmpeg import render_avatar_video_ffmpeg
+from .parallel_render import write_videofile_parallel
+from .segment_table import SegmentData, SegmentTable
+from .transcript_store import transcribe_segments
 
 
-CACHE_SUFFIX = "_segments.json"
+CACHE_SUFFIX = "_segments.npz"
+LEGACY_CACHE_SUFFIX = "_segments.json"
+OUTPUT_SUFFIX = "_avatar.mp4"
+DEFAULT_RENDERER = "moviepy"  # or "ffmpeg", see avatar_ffmpeg.py
+DEFAULT_THREADS_PER_RENDER = 2  # ffmpeg encoder threads given to each batch render
 DEFAULT_FPS = 24  # fallback framerate if clip.fps is missing
+MAX_PENDING_SEGMENTS = 32  # bound on segments queued between Whisper and classifiers
+DEFAULT_MIN_SEGMENT_LENGTH = 0.5  # seconds, shorter segments/gaps are merged
+ENVELOPE_WINDOW = 0.2  # seconds of audio averaged for each envelope frame
 
 load_dotenv()
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "GPT-4.1")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
 WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "large-v3")  # can be adjusted
+# Stored transcripts from at least this model are reused (text only feeds emotions)
+WHISPER_MIN_MODEL_SIZE = os.getenv("WHISPER_MIN_MODEL_SIZE", "small")
+# Optional cascade: draft everything with this model, redo low-confidence segments
+WHISPER_DRAFT_MODEL_SIZE = os.getenv("WHISPER_DRAFT_MODEL_SIZE") or None
 
-# Validate essential environment variables early
-if not OPENAI_API_KEY:
-    raise RuntimeError("Missing OPENAI_API_KEY in environment variables.")
-
-# Initialize OpenAI client
-_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
 
 # Set up logging
 logging.basicConfig(
@@ -46,39 +56,15 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class SegmentData:
-    """
-    Simple container for a single transcript segment's metadata.
-    """
-
-    def __init__(self, start: float, end: float, emotion: str, volume: float):
-        self.start = start
-        self.end = end
-        self.emotion = emotion
-        self.volume = volume
-
-    def to_dict(self) -> Dict[str, Any]:
-        """
-        Transform SegmentData to Dict
-        """
-        return {
-            "start": self.start,
-            "end": self.end,
-            "emotion": self.emotion,
-            "volume": self.volume,
-        }
-
-    @staticmethod
-    def from_dict(data: Dict[str, Any]) -> "SegmentData":
-        """
-        Transform dict to SegmentData
-        """
-        return SegmentData(
-            start=data["start"],
-            end=data["end"],
-            emotion=data["emotion"],
-            volume=data["volume"],
-        )
+@lru_cache(maxsize=None)
+def get_openai_client() -> OpenAI:
+    """
+    OpenAI client, created on first use so the key is only required when
+    emotions have to be classified (cached segments need no API calls).
+    """
+    if not OPENAI_API_KEY:
+        raise RuntimeError("Missing OPENAI_API_KEY in environment variables.")
+    return OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
 
 
 def build_emotion_system_prompt(emotion_keys: List[str]) -> str:
@@ -113,8 +99,9 @@ def classify_emotion(text: str, emotion_map: Dict[str, str]) -> str:
     logger.debug("Emotion classification prompt: %s", prompt)
     logger.debug("User text for classification: %s", text)
 
+    client = get_openai_client()
     try:
-        response = _client.chat.completions.create(
+        response = client.chat.completions.create(
             model=OPENAI_MODEL,
             messages=[
                 {"role": "system", "content": prompt},
@@ -145,22 +132,23 @@ def classify_emotion(text: str, emotion_map: Dict[str, str]) -> str:
         return default_emotion
 
 
-def compute_segment_volume(audio: AudioSegment, start: float, end: float) -> float:
+def compute_segment_volume(
+    loudness_index: LoudnessIndex, start: float, end: float
+) -> float:
     """
-    Compute the average loudness/volume of a subclip using pydub.
-    Delegates to get_subclip_volume_segment helper.
+    Compute the RMS loudness/volume of a subclip from the prefix-sum loudness index.
+    No samples are copied, the lookup is O(1) per segment.
 
     Args:
-        audio (AudioSegment): Full audio loaded via pydub.
+        loudness_index (LoudnessIndex): Energy index of the full audio.
         start (float): Start time in seconds.
         end (float): End time in seconds.
 
     Returns:
         float: A volume metric (higher means louder).
     """
-    duration = end - start
     try:
-        volume_value = get_subclip_volume_segment(audio, start, duration)
+        volume_value = loudness_index.rms(start, end)
         logger.debug(
             "Computed volume %.4f for segment [%.2f, %.2f].", volume_value, start, end
         )
@@ -176,7 +164,7 @@ def compute_segment_volume(audio: AudioSegment, start: float, end: float) -> flo
 
 
 def process_transcript_segment(
-    seg: Any, pydub_audio: AudioSegment, emotion_map: Dict[str, str]
+    seg: Any, loudness_index: LoudnessIndex, emotion_map: Dict[str, str]
 ) -> SegmentData:
     """
     Given a Whisper transcript segment (with .start, .end, .text),
@@ -184,7 +172,7 @@ def process_transcript_segment(
 
     Args:
         seg (Any): A segment object returned by Whisper, expected to have .start, .end, .text.
-        pydub_audio (AudioSegment): The full audio loaded so we can measure volume.
+        loudness_index (LoudnessIndex): Energy index of the full audio to measure volume.
         emotion_map (Dict[str, str]): Mapping of emotion label -> avatar file path.
 
     Returns:
@@ -200,7 +188,7 @@ def process_transcript_segment(
     chosen_emotion = classify_emotion(text, emotion_map)
 
     # Measure volume for this segment
-    volume = compute_segment_volume(pydub_audio, start, end)
+    volume = compute_segment_volume(loudness_index, start, end)
 
     logger.info(
         "Segment [%.2f-%.2f] | Text: '%s' | Emotion: '%s' | Volume: %.4f",
@@ -214,30 +202,47 @@ def process_transcript_segment(
     return SegmentData(start=start, end=end, emotion=chosen_emotion, volume=volume)
 
 
+def load_loudness_index(audio_path: Path) -> LoudnessIndex:
+    """
+    Return the loudness index of the audio file, stored next to the segment cache.
+    The audio is decoded with pydub only when no valid index exists yet.
+    """
+
+    def build_index() -> LoudnessIndex:
+        logger.info("Building loudness index from '%s' via pydub...", audio_path)
+        return LoudnessIndex.from_audio_segment(AudioSegment.from_file(str(audio_path)))
+
+    return load_or_build_loudness_index(audio_path, build_index)
+
+
 def get_cache_path(audio_path: Path) -> Path:
     """
-    Given an audio file path, return the corresponding JSON cache path.
+    Given an audio file path, return the corresponding binary cache path.
     """
     return audio_path.with_name(audio_path.stem + CACHE_SUFFIX)
 
 
-def load_cached_segments(cache_path: Path) -> Optional[Tuple[List[SegmentData], float]]:
+def load_cached_segments(cache_path: Path) -> Optional[Tuple[SegmentTable, float]]:
     """
-    If the cache JSON exists, load and return the segments list and global average volume.
+    If the binary cache exists, load and return the segment table and global average
+    volume. A legacy JSON cache next to it is still accepted.
 
     Returns:
-        Tuple[List[SegmentData], float] or None if cache is missing or invalid.
+        Tuple[SegmentTable, float] or None if cache is missing or invalid.
     """
-    if not cache_path.exists():
+    legacy_path = cache_path.with_name(
+        cache_path.name.replace(CACHE_SUFFIX, LEGACY_CACHE_SUFFIX)
+    )
+    if not cache_path.exists() and not legacy_path.exists():
         logger.info("No cache file found at '%s'. Will generate segments.", cache_path)
         return None
 
     try:
-        with cache_path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        raw_segments = data.get("segments", [])
-        avg_volume = float(data.get("global_avg_volume", 0.0))
-        segments = [SegmentData.from_dict(item) for item in raw_segments]
+        if cache_path.exists():
+            segments, avg_volume = SegmentTable.load(cache_path)
+        else:
+            with legacy_path.open("r", encoding="utf-8") as f:
+                segments, avg_volume = SegmentTable.from_json_data(json.load(f))
         logger.info(
             "Loaded %d segments and global_avg_volume=%.4f from cache.",
             len(segments),
@@ -251,92 +256,151 @@ def load_cached_segments(cache_path: Path) -> Optional[Tuple[List[SegmentData],
         return None
 
 
+def migrate_legacy_segments(
+    audio_path: Path, cache_path: Path, segments: Sequence[Any]
+) -> Optional[Tuple[SegmentTable, float]]:
+    """
+    Re-measure the volumes of a legacy JSON cache, which stores pydub integer RMS,
+    on the normalized scale of the loudness index (the one of the shake envelopes)
+    and save them to the binary cache. None when the audio cannot be measured.
+    """
+    try:
+        loudness_index = load_loudness_index(audio_path)
+    except Exception as e:
+        logger.error(
+            "Failed to load audio to migrate the legacy cache: %s. Ignoring cache.", e
+        )
+        return None
+    migrated = [
+        SegmentData(
+            start=seg.start,
+            end=seg.end,
+            emotion=seg.emotion,
+            volume=compute_segment_volume(loudness_index, seg.start, seg.end),
+        )
+        for seg in segments
+    ]
+    volumes = [seg.volume for seg in migrated]
+    global_avg_volume = float(np.mean(volumes)) if volumes else 0.0
+    logger.info(
+        "Migrated %d legacy cached segments, global_avg_volume=%.4f.",
+        len(migrated),
+        global_avg_volume,
+    )
+    table = save_cached_segments(cache_path, migrated, global_avg_volume)
+    return table, global_avg_volume
+
+
 def save_cached_segments(
-    cache_path: Path, segments: List[SegmentData], global_avg_volume: float
-) -> None:
+    cache_path: Path, segments: Sequence[Any], global_avg_volume: float
+) -> SegmentTable:
     """
-    Save the list of segments (converted to dicts) and global_avg_volume to the JSON cache.
+    Save the segments and global_avg_volume to the binary cache.
+    Use export_segments_json(cache_path) to get a human readable copy.
 
     Args:
         cache_path (Path): Where to write the cache file.
-        segments (List[SegmentData]): The computed segments data.
+        segments (Sequence[Any]): The computed segments data.
         global_avg_volume (float): The average volume across segments.
+
+    Returns:
+        SegmentTable: The table that was written.
     """
+    table = SegmentTable.from_segments(segments)
     try:
-        cache_data = {
-            "segments": [seg.to_dict() for seg in segments],
-            "global_avg_volume": global_avg_volume,
-        }
-        with cache_path.open("w", encoding="utf-8") as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=2)
+        table.save(cache_path, global_avg_volume)
         logger.info("Saved segments to cache at '%s'.", cache_path)
     except Exception as e:
         logger.error("Failed to save cache to '%s': %s", cache_path, e)
+    return table
 
 
-def transcribe_audio_whisper(audio_path: Path, model_size: str) -> List[Any]:
+def transcribe_audio_whisper(
+    audio_path: Path, model_size: str, min_model_size: Optional[str] = None
+) -> Iterable[Any]:
     """
-    Use faster_whisper.WhisperModel to transcribe the audio file into a list of segments.
+    Get the transcript segments of the audio file from the shared transcript store,
+    transcribing it with faster_whisper only if no good enough transcript exists.
+
+    The returned iterator is lazy: Whisper decodes the next segment only when the
+    consumer asks for it, so callers can start working on early segments while
+    the rest of the file is still being transcribed.
 
     Args:
         audio_path (Path): Path to the audio or video file.
         model_size (str): Model size for Whisper (e.g. "tiny", "base", "small", etc.).
+        min_model_size (Optional[str]): Lowest model whose stored transcript is reused.
 
     Returns:
-        List[Any]: A list of transcript segment objects (each having .start, .end, .text).
+        Iterable[Any]: Transcript segment objects (each having .start, .end, .text).
     """
-    logger.info("Loading Whisper model (size='%s') for transcription...", model_size)
-    whisper_model = WhisperModel(model_size, num_workers=4, compute_type="int8")
-    try:
-        result, _ = whisper_model.transcribe(str(audio_path), multilingual=True)
-        logger.info("Transcription complete. Obtained segments.")
-        return result
-    finally:
-        # Ensure we free WhisperModel resources immediately
-        del whisper_model
+    logger.info("Streaming transcript of '%s' (model '%s')...", audio_path, model_size)
+    return transcribe_segments(
+        str(audio_path),
+        model_size,
+        min_model_size,
+        draft_model_size=WHISPER_DRAFT_MODEL_SIZE,
+    )
 
 
 def classify_and_measure_all(
-    transcript_segments: List[Any],
-    pydub_audio: AudioSegment,
+    transcript_segments: Iterable[Any],
+    loudness_index: LoudnessIndex,
     emotion_map: Dict[str, str],
     max_workers: Optional[int] = None,
+    max_pending: int = MAX_PENDING_SEGMENTS,
 ) -> List[SegmentData]:
     """
-    In parallel, classify emotion and measure volume for each Whisper transcript segment.
+    Classify emotion and measure volume for each Whisper transcript segment,
+    submitting every segment to the thread pool as soon as Whisper yields it.
+
+    Transcription (the producer) and classification (the consumers) overlap, so
+    the total time is close to the slowest of the two instead of their sum.
+    At most ``max_pending`` segments are in flight; when the queue is full the
+    producer waits for a classifier to finish before decoding more audio.
 
     Args:
-        transcript_segments (List[Any]): List of Whisper transcript objects.
-        pydub_audio (AudioSegment): Full audio for volume computation.
+        transcript_segments (Iterable[Any]): Whisper transcript objects, possibly lazy.
+        loudness_index (LoudnessIndex): Energy index of the full audio for volume.
         emotion_map (Dict[str, str]): Mapping from emotion key -> avatar path.
         max_workers (Optional[int]): Number of threads for parallel execution.
+        max_pending (int): Maximum number of segments queued or being processed.
 
     Returns:
         List[SegmentData]: Ordered list of computed SegmentData.
     """
-    logger.info("Starting parallel processing transcript segments...")
+    logger.info("Starting streamed processing of transcript segments...")
     segments: List[SegmentData] = []
+    pending_slots = threading.BoundedSemaphore(max(1, max_pending))
+    futures = {}
+
+    def release_slot(_future) -> None:
+        pending_slots.release()
 
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(
-                process_transcript_segment, seg, pydub_audio, emotion_map
-            ): seg
-            for seg in transcript_segments
-        }
-        for future in as_completed(futures):
-            try:
-                seg_data = future.result()
-                segments.append(seg_data)
-            except Exception as e:
-                # If one segment fails, log the error but continue
-                seg_obj = futures[future]
-                logger.error(
-                    "Segment [%.2f-%.2f] processing failed: %s",
-                    seg_obj.start,
-                    seg_obj.end,
-                    e,
-                )
+        for seg in transcript_segments:
+            pending_slots.acquire()
+            future = executor.submit(
+                process_transcript_segment, seg, loudness_index, emotion_map
+            )
+            future.add_done_callback(release_slot)
+            futures[future] = seg
+        logger.info(
+            "Transcription finished with %d segments. Waiting for classifiers...",
+            len(futures),
+        )
+
+    for future, seg_obj in futures.items():
+        try:
+            segments.append(future.result())
+        except Exception as e:
+            # If one segment fails, log the error but continue
+            logger.error(
+                "Segment [%.2f-%.2f] processing failed: %s",
+                seg_obj.start,
+                seg_obj.end,
+                e,
+            )
 
     # Sort by start time, just in case
     segments.sort(key=lambda s: s.start)
@@ -406,21 +470,23 @@ def generate_segment_data(
     audio_path: Path,
     emotion_map: Dict[str, str],
     max_workers: Optional[int] = None,
-) -> Tuple[List[SegmentData], float]:
+) -> Tuple[SegmentTable, float]:
     """
-    Main orchestration function: generate (or load from cache) the list of SegmentData
-    dictionaries, each containing start, end, emotion, and volume.
+    Main orchestration function: generate (or load from cache) the segment table,
+    each row containing start, end, emotion, and volume.
     Also return the global average volume.
 
     Steps:
       1. Check if cache exists. If so, load and return cached data.
       2. Otherwise:
-         a. Load audio via pydub for volume measurement.
-         b. Transcribe via WhisperModel.
-         c. In parallel, process each segment to classify emotion and measure volume.
+         a. Load (or build from pydub audio) the loudness index stored next to
+            the segment cache.
+         b. Start a lazy transcription via WhisperModel.
+         c. Stream each segment into the thread pool to classify emotion and
+            measure volume while Whisper keeps decoding.
          d. Compute global average volume.
          e. Append a tail segment if total segment durations < full audio duration.
-         f. Save everything to cache JSON and return.
+         f. Save everything to the binary cache and return the table.
 
     Args:
         audio_path (Path): Path to the audio file (or video file with audio).
@@ -428,29 +494,32 @@ def generate_segment_data(
         max_workers (Optional[int]): Number of parallel threads.
 
     Returns:
-        Tuple[List[SegmentData], float]: (List of SegmentData, global average volume).
+        Tuple[SegmentTable, float]: (Segment table, global average volume).
     """
     cache_path = get_cache_path(audio_path)
     cached = load_cached_segments(cache_path)
+    if cached and not cache_path.exists():
+        cached = migrate_legacy_segments(audio_path, cache_path, cached[0])
     if cached:
         return cached  # (segments, global_avg_volume)
 
-    # 2.a. Load full audio via pydub for volume measurement
-    logger.info("Loading full audio via pydub from '%s'...", audio_path)
+    # 2.a. Load the loudness index, decoding the audio with pydub only if needed
     try:
-        pydub_audio = AudioSegment.from_file(str(audio_path))
+        loudness_index = load_loudness_index(audio_path)
     except Exception as e:
         logger.error(
             "Failed to load audio with pydub: %s. Aborting segment generation.", e
         )
-        return [], 0.0
+        return SegmentTable.from_segments([]), 0.0
 
-    # 2.b. Transcribe via Whisper
-    transcript_segments = transcribe_audio_whisper(audio_path, WHISPER_MODEL_SIZE)
+    # 2.b. Transcribe via Whisper (lazy, consumed by the step below)
+    transcript_segments = transcribe_audio_whisper(
+        audio_path, WHISPER_MODEL_SIZE, WHISPER_MIN_MODEL_SIZE
+    )
 
-    # 2.c. Parallel classification + volume
+    # 2.c. Streamed classification + volume, overlapping with transcription
     segments = classify_and_measure_all(
-        transcript_segments, pydub_audio, emotion_map, max_workers
+        transcript_segments, loudness_index, emotion_map, max_workers
     )
 
     # 2.d. Compute global average volume
@@ -459,17 +528,99 @@ def generate_segment_data(
     logger.info("Global average volume computed: %.4f", global_avg_volume)
 
     # 2.e. If the transcription times do not cover the entire audio, append a tail
-    # First we need total audio duration; we can get it from pydub_audio.duration_seconds
-    total_duration = pydub_audio.duration_seconds
+    # The loudness index knows the total audio duration
+    total_duration = loudness_index.duration
     default_emotion = list(emotion_map.keys())[0]
     segments = append_tail_segment_if_needed(
         segments, total_duration, default_emotion, global_avg_volume
     )
 
     # 2.f. Save to cache
-    save_cached_segments(cache_path, segments, global_avg_volume)
+    table = save_cached_segments(cache_path, segments, global_avg_volume)
+
+    return table, global_avg_volume
+
 
-    return segments, global_avg_volume
+def compact_segments(
+    segments: Sequence[Any],
+    min_segment_length: float = DEFAULT_MIN_SEGMENT_LENGTH,
+    loudness_index: Optional[LoudnessIndex] = None,
+    fps: int = DEFAULT_FPS,
+) -> Tuple[List[SegmentData], int]:
+    """
+    Timeline-compaction pass run before building avatar subclips.
+
+    Consecutive segments with the same emotion are merged into one, segments shorter
+    than min_segment_length are absorbed by the previous one, and gaps shorter than
+    min_segment_length are covered by extending the previous segment. Each merged
+    segment carries a per-frame volume envelope so the shake still follows the voice.
+
+    Args:
+        segments (Sequence[Any]): Sorted segments (SegmentData or SegmentTable rows).
+        min_segment_length (float): Minimum duration (seconds) of a segment or gap.
+        loudness_index (Optional[LoudnessIndex]): Used to sample the envelope; when
+            missing the envelope is built from the merged segments' volumes.
+        fps (int): Sampling rate of the envelope.
+
+    Returns:
+        Tuple[List[SegmentData], int]: (compacted segments, number of clips removed).
+    """
+    if not segments:
+        return [], 0
+
+    runs: List[List[Any]] = [[segments[0]]]
+    for seg in segments[1:]:
+        previous = runs[-1][-1]
+        short_gap = seg.start - previous.end < min_segment_length
+        too_short = seg.end - seg.start < min_segment_length
+        if short_gap and (seg.emotion == runs[-1][0].emotion or too_short):
+            runs[-1].append(seg)
+        else:
+            runs.append([seg])
+
+    compacted: List[SegmentData] = []
+    for i, run in enumerate(runs):
+        start = run[0].start
+        end = run[-1].end
+        # Cover a short gap up to the next run instead of adding a default clip
+        if i + 1 < len(runs) and runs[i + 1][0].start - end < min_segment_length:
+            end = runs[i + 1][0].start
+
+        frame_times = start + np.arange(max(1, int(round((end - start) * fps)))) / fps
+        if loudness_index is not None:
+            envelope = loudness_index.rms_many(
+                frame_times - ENVELOPE_WINDOW / 2, frame_times + ENVELOPE_WINDOW / 2
+            )
+        else:
+            part_ends = np.array([seg.end for seg in run])
+            part_index = np.searchsorted(part_ends, frame_times).clip(max=len(run) - 1)
+            envelope = np.array([seg.volume for seg in run])[part_index]
+
+        durations = np.array([seg.end - seg.start for seg in run])
+        volumes = np.array([seg.volume for seg in run])
+        volume = (
+            float(np.average(volumes, weights=durations))
+            if durations.sum() > 0
+            else float(volumes.mean())
+        )
+        compacted.append(
+            SegmentData(
+                start=start,
+                end=end,
+                emotion=run[0].emotion,
+                volume=volume,
+                envelope=envelope,
+            )
+        )
+
+    removed = len(segments) - len(compacted)
+    logger.info(
+        "Timeline compaction merged %d segments into %d (%d clips removed).",
+        len(segments),
+        len(compacted),
+        removed,
+    )
+    return compacted, removed
 
 
 def load_avatar_clips(avatar_map: Dict[str, str]) -> Dict[str, VideoFileClip]:
@@ -520,6 +671,8 @@ def build_avatar_subclips(
     """
     For each segment, create a looped (and shaken) avatar subclip at the correct timestamp.
     Also fill any gaps with the default avatar loop.
+    Segments with a volume envelope (see compact_segments) shake frame by frame,
+    the others use one intensity for the whole segment.
 
     Args:
         segments (List[SegmentData]): Sorted list of segment data.
@@ -573,7 +726,9 @@ def build_avatar_subclips(
         )
 
         # Compute shake intensity (0 if global_avg_volume is zero)
-        if global_avg_volume > 0:
+        if global_avg_volume > 0 and seg.envelope is not None:
+            intensity = (seg.envelope / global_avg_volume) * shake_factor
+        elif global_avg_volume > 0:
             intensity = (volume / global_avg_volume) * shake_factor
         else:
             intensity = 0.0
@@ -583,10 +738,10 @@ def build_avatar_subclips(
             emotion,
             volume,
             global_avg_volume,
-            intensity,
+            float(np.mean(intensity)),
         )
         shaken_clip = (
-            apply_shake(avatar_loop, intensity)
+            apply_shake(avatar_loop, intensity, fps=DEFAULT_FPS)
             .set_duration(duration)
             .set_fps(base_fps)
             .set_start(start)
@@ -606,26 +761,99 @@ def build_avatar_subclips(
     return subclips
 
 
+def compose_avatar_video(
+    segments: Sequence[Any],
+    default_clip: VideoFileClip,
+    preloaded_clips: Dict[str, VideoFileClip],
+    global_avg_volume: float,
+    shake_factor: float,
+    audio_clip: AudioFileClip,
+    total_duration: float,
+) -> CompositeVideoClip:
+    """
+    MoviePy render path: build the timed subclips, cover the tail with the default
+    avatar and composite everything with the original audio.
+
+    Returns:
+        CompositeVideoClip: The final video, sized as the default clip.
+    """
+    logger.info("Building avatar subclips for %d segments...", len(segments))
+    subclips = build_avatar_subclips(
+        segments, default_clip, preloaded_clips, global_avg_volume, shake_factor
+    )
+
+    # Check if final tail clip needed (if last segment end < total_duration)
+    last_end_time = segments[-1].end
+    if last_end_time < total_duration:
+        gap = total_duration - last_end_time
+        default_fps = getattr(default_clip, "fps", DEFAULT_FPS) or DEFAULT_FPS
+        logger.info(
+            "Adding final default avatar loop to cover gap [%.2f-%.2f].",
+            last_end_time,
+            total_duration,
+        )
+        final_tail = (
+            default_clip.loop(duration=gap)
+            .set_duration(gap)
+            .set_fps(default_fps)
+            .set_start(last_end_time)
+        )
+        subclips.append(final_tail)
+
+    # Composite all subclips into one video, sized as the default clip
+    width, height = default_clip.w, default_clip.h
+    logger.info(
+        "Compositing %d subclips into final video of size (%d x %d).",
+        len(subclips),
+        width,
+        height,
+    )
+    final_video = CompositeVideoClip(subclips, size=(width, height))
+    return final_video.set_audio(audio_clip).set_duration(total_duration)
+
+
+def get_avatar_output_path(audio_path: Path) -> Path:
+    """
+    Given an input file path, return the path of its avatar video.
+    """
+    return audio_path.with_name(audio_path.stem + OUTPUT_SUFFIX)
+
+
 def create_avatar_video_from_audio(
     audio_path_str: str,
     config: Dict[str, Any],
     max_workers: Optional[int] = None,
-) -> None:
+    output_path_str: Optional[str] = None,
+    preloaded_clips: Optional[Dict[str, VideoFileClip]] = None,
+    threads: Optional[int] = None,
+) -> Optional[Path]:
     """
     High-level function to generate the avatar video:
       1. Load audio (video or audio file).
       2. Generate or load segment data (transcription, emotion, volume).
-      3. Preload avatar clips.
-      4. Build a list of timed subclips (avatar loops and default gaps).
-      5. Composite all subclips and attach the original audio.
-      6. Export the final video as 'output_video.mp4'.
+      3. Preload avatar clips (unless they were already loaded by the caller).
+      4. Merge same-emotion runs of the timeline.
+      5. Render the timeline with the configured backend: MoviePy (timed subclips
+         composited with the original audio) or a single native ffmpeg job.
+      6. Export the final video as '<input stem>_avatar.mp4' (or output_path_str).
 
     Args:
         audio_path_str (str): Path to the input audio or video file.
         config (Dict[str, Any]): A configuration dictionary that must contain:
             - 'avatars': Dict[str, str] mapping emotion keys -> avatar file paths.
             - 'shake_factor': float representing maximum shake intensity scale.
+            It may also contain 'min_segment_length' (seconds) for the compaction pass
+            and 'renderer' ("moviepy" or "ffmpeg") to pick the render backend.
+            With the MoviePy backend, 'render_workers' > 1 generates the frames
+            in that many processes.
         max_workers (Optional[int]): Number of threads to use for segment processing.
+        output_path_str (Optional[str]): Where to write the video.
+        preloaded_clips (Optional[Dict[str, VideoFileClip]]): Avatar clips shared
+            between several renders; they are not closed by this function.
+        threads (Optional[int]): Threads for the ffmpeg encoder.
+
+    Returns:
+        Optional[Path]: The written video, None when the generation failed.
     """
     audio_path = Path(audio_path_str)
     logger.info("Starting avatar video generation for '%s'.", audio_path)
@@ -668,7 +896,9 @@ def create_avatar_video_from_audio(
         return
 
     # 3. Preload avatar clips
-    preloaded_clips = load_avatar_clips(emotion_map)
+    owns_clips = preloaded_clips is None
+    if owns_clips:
+        preloaded_clips = load_avatar_clips(emotion_map)
     default_emotion = list(emotion_map.keys())[0]
     if default_emotion not in preloaded_clips:
         logger.error(
@@ -680,69 +910,89 @@ def create_avatar_video_from_audio(
     default_clip = preloaded_clips[default_emotion]
     shake_factor = config.get("shake_factor", 0.1)
 
-    # 4. Build all subclips
-    logger.info("Building avatar subclips for %d segments...")
-    subclips = build_avatar_subclips(
-        segments, default_clip, preloaded_clips, global_avg_volume, shake_factor
-    )
-
-    # 4.a. Check if final tail clip needed (if last segment end < total_duration)
-    last_end_time = segments[-1].end
-    if last_end_time < total_duration:
-        gap = total_duration - last_end_time
-        default_fps = getattr(default_clip, "fps", DEFAULT_FPS) or DEFAULT_FPS
-        logger.info(
-            "Adding final default avatar loop to cover gap [%.2f-%.2f].",
-            last_end_time,
-            total_duration,
-        )
-        final_tail = (
-            default_clip.loop(duration=gap)
-            .set_duration(gap)
-            .set_fps(default_fps)
-            .set_start(last_end_time)
+    # 4. Merge same-emotion runs to reduce the number of clips
+    try:
+        loudness_index = load_loudness_index(audio_path)
+    except Exception as e:
+        logger.error(
+            "Failed to load the loudness index: %s. Shaking with segment volumes.", e
         )
-        subclips.append(final_tail)
-
-    # 5. Composite all subclips into one video, sized as the default clip
-    width, height = default_clip.w, default_clip.h
-    logger.info(
-        "Compositing %d subclips into final video of size (%d x %d).",
-        len(subclips),
-        width,
-        height,
+        loudness_index = None
+    segments, _ = compact_segments(
+        segments,
+        config.get("min_segment_length", DEFAULT_MIN_SEGMENT_LENGTH),
+        loudness_index,
     )
-    final_video = CompositeVideoClip(subclips, size=(width, height))
-    final_video = final_video.set_audio(audio_clip).set_duration(total_duration)
 
-    # 6. Export the final video
-    output_path = Path("output_video.mp4")
+    # 5. Render with the configured backend and export the final video
+    output_path = (
+        Path(output_path_str) if output_path_str else get_avatar_output_path(audio_path)
+    )
+    renderer = config.get("renderer", DEFAULT_RENDERER)
+    final_video = None
+    written_path = None
     try:
-        logger.info("Writing final video to '%s'...", output_path)
-        final_video.write_videofile(
-            str(output_path),
-            codec="libx264",
-            audio_codec="aac",
-            fps=DEFAULT_FPS,
-            preset="medium",
-            verbose=False,
-            logger=None,
-        )
+        if renderer == "ffmpeg":
+            render_avatar_video_ffmpeg(
+                segments,
+                {emotion: emotion_map[emotion] for emotion in preloaded_clips},
+                default_emotion,
+                audio_path,
+                output_path,
+                total_duration,
+                global_avg_volume,
+                shake_factor,
+                (default_clip.w, default_clip.h),
+                DEFAULT_FPS,
+                threads,
+            )
+        else:
+            final_video = compose_avatar_video(
+                segments,
+                default_clip,
+                preloaded_clips,
+                global_avg_volume,
+                shake_factor,
+                audio_clip,
+                total_duration,
+            )
+            logger.info("Writing final video to '%s'...", output_path)
+            if config.get("render_workers", 1) > 1:
+                write_videofile_parallel(
+                    final_video,
+                    str(output_path),
+                    DEFAULT_FPS,
+                    workers=config["render_workers"],
+                    threads=threads,
+                )
+            else:
+                final_video.write_videofile(
+                    str(output_path),
+                    codec="libx264",
+                    audio_codec="aac",
+                    fps=DEFAULT_FPS,
+                    preset="medium",
+                    threads=threads,
+                    verbose=False,
+                    logger=None,
+                )
         logger.info("Successfully saved avatar video as '%s'.", output_path)
+        written_path = output_path
     except Exception as e:
         logger.error("Failed to write final video '%s': %s", output_path, e)
     finally:
-        # 7. Release resources: close all loaded clips
+        # 6. Release resources: close all loaded clips
         logger.info("Releasing resources for avatar clips and final video.")
-        for clip in preloaded_clips.values():
+        for clip in preloaded_clips.values() if owns_clips else []:
             try:
                 clip.close()
             except Exception as e:
                 logger.warning("Error closing avatar clip: %s", e)
-        try:
-            final_video.close()
-        except Exception:
-            pass
+        if final_video is not None:
+            try:
+                final_video.close()
+            except Exception:
+                pass
         try:
             audio_clip.close()
         except Exception:
@@ -752,3 +1002,119 @@ def create_avatar_video_from_audio(
                 video_reader.close()
             except Exception:
                 pass
+    return written_path
+
+
+# Avatar clips loaded once per batch worker process
+_worker_avatar_clips: Dict[str, VideoFileClip] = {}
+
+
+def _init_batch_worker(config: Dict[str, Any]) -> None:
+    """
+    Process pool initializer: load every avatar once for all renders of the worker.
+    """
+    _worker_avatar_clips.update(load_avatar_clips(config.get("avatars", {})))
+
+
+def _render_batch_item(
+    audio_path_str: str, config: Dict[str, Any], output_path_str: str, threads: int
+) -> Optional[Path]:
+    """
+    Render one input of a batch inside a worker process.
+    """
+    return create_avatar_video_from_audio(
+        audio_path_str,
+        config,
+        output_path_str=output_path_str,
+        preloaded_clips=_worker_avatar_clips,
+        threads=threads,
+    )
+
+
+def create_avatar_videos_batch(
+    audio_paths: List[str],
+    config: Dict[str, Any],
+    cpu_budget: Optional[int] = None,
+    threads_per_render: int = DEFAULT_THREADS_PER_RENDER,
+    max_workers: Optional[int] = None,
+) -> List[Path]:
+    """
+    Generate avatar videos for several inputs, each written to '<stem>_avatar.mp4'.
+
+    Segment data (transcription + emotions) is generated first, one input at a time,
+    so only one Whisper model is in memory. The renders then run in parallel worker
+    processes, as many as fit in cpu_budget with threads_per_render encoder threads
+    each. Every worker loads the avatar clips once and reuses them for all its inputs.
+
+    Args:
+        audio_paths (List[str]): Input audio or video files.
+        config (Dict[str, Any]): Avatar configuration (see create_avatar_video_from_audio).
+        cpu_budget (Optional[int]): Total CPUs the batch may use (default: all).
+        threads_per_render (int): Encoder threads given to each render.
+        max_workers (Optional[int]): Threads used for segment processing.
+
+    Returns:
+        List[Path]: Paths of the videos that were written, in input order. Failed
+            inputs are logged and left out.
+    """
+    emotion_map: Dict[str, str] = config.get("avatars", {})
+    if not emotion_map:
+        logger.error("No 'avatars' mapping provided in config. Cannot proceed.")
+        return []
+
+    for audio_path_str in audio_paths:
+        generate_segment_data(Path(audio_path_str), emotion_map, max_workers)
+
+    outputs = [get_avatar_output_path(Path(path)) for path in audio_paths]
+    written: List[Path] = []
+    cpu_budget = cpu_budget or os.cpu_count() or 1
+    threads_per_render = max(1, threads_per_render)
+    workers = max(1, min(len(audio_paths), cpu_budget // threads_per_render))
+    threads = max(threads_per_render, cpu_budget // workers)
+    logger.info(
+        "Rendering %d avatar videos with %d worker(s), %d threads each.",
+        len(audio_paths),
+        workers,
+        threads,
+    )
+
+    if workers == 1:
+        preloaded_clips = load_avatar_clips(emotion_map)
+        try:
+            for audio_path_str, output_path in zip(audio_paths, outputs):
+                written_path = create_avatar_video_from_audio(
+                    audio_path_str,
+                    config,
+                    max_workers,
+                    output_path_str=str(output_path),
+                    preloaded_clips=preloaded_clips,
+                    threads=threads,
+                )
+                if written_path is not None:
+                    written.append(written_path)
+        finally:
+            for clip in preloaded_clips.values():
+                clip.close()
+        return written
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_batch_worker, initargs=(config,)
+    ) as executor:
+        futures = [
+            executor.submit(
+                _render_batch_item, audio_path_str, config, str(output_path), threads
+            )
+            for audio_path_str, output_path in zip(audio_paths, outputs)
+        ]
+        for audio_path_str, future in zip(audio_paths, futures):
+            try:
+                written_path = future.result()
+            except Exception as e:
+                logger.error("Avatar render of '%s' failed: %s", audio_path_str, e)
+                continue
+            if written_path is None:
+                logger.error("Avatar render of '%s' failed.", audio_path_str)
+                continue
+            logger.info("Finished avatar video '%s'.", written_path)
+            written.append(written_path)
+    return written
@@ -0,0 +1,326 @@
+"""
+Module to checkpoint video_edit pipelines and resume them.
+
+After every step the run manifest ('<run_dir>/<filename>.json') records the step,
+a key and the step outputs: the files it wrote (path and fingerprint) and the
+plain values (e.g. the kept ranges). Clips are not stored, they are rebuilt from
+those outputs. The key chains the source fingerprint, the parameters of every
+step up to this one (STEP_PARAMETERS, only the options the step reads) and the
+outputs of the steps before it, so changing a trim option keeps the denoise and
+transcript steps before it.
+
+With resume, the steps whose key matches the manifest and whose output files
+still have the recorded fingerprint are restored instead of run. The first step
+whose inputs changed or whose output is missing or was rewritten (e.g. by a
+--fuse or --pipeline_workers run, which keep no manifest) runs again, and so
+does everything after it. Cheap steps without outputs to store (set_vertical,
+subtitles...) always run. With keep_edited, an output edited by hand (e.g. a
+corrected SRT) is kept instead, and the steps after it see a new key and run
+again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from utils import file_fingerprint
+
+from .denoise import set_denoised_audio
+from .trim import set_kept_ranges
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 2
+DEFAULT_RUN_DIR = ".video_edit_runs"
+# kwargs that change how fast a step runs, not what it produces
+RUNTIME_KEYS = {
+    "render_workers",
+    "export_parts",
+    "transcribe_workers",
+    "cpu_threads",
+    "denoise_threads",
+}
+
+
+class Checkpoint:
+    """
+    Outputs of a step stored in the manifest and how to restore them.
+    """
+
+    __slots__ = ("files", "values", "restore")
+
+    def __init__(
+        self,
+        files: Sequence[str] = (),
+        values: Sequence[str] = (),
+        restore: Optional[Callable[[dict, dict], dict]] = None,
+    ):
+        self.files = tuple(files)
+        self.values = tuple(values)
+        self.restore = restore or restore_outputs
+
+    def save(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Outputs of the step in kwargs, as stored in the manifest.
+        """
+        return {
+            "files": {
+                key: {
+                    "path": kwargs[key],
+                    "fingerprint": file_fingerprint(kwargs[key]),
+                }
+                for key in self.files
+                if kwargs.get(key) and os.path.exists(kwargs[key])
+            },
+            "values": {key: kwargs[key] for key in self.values if key in kwargs},
+        }
+
+
+def restore_outputs(kwargs: Dict[str, Any], outputs: Dict[str, Any]) -> dict:
+    """
+    Put the stored file paths and values back in kwargs.
+    """
+    kwargs.update({key: item["path"] for key, item in outputs["files"].items()})
+    kwargs.update(outputs["values"])
+    return kwargs
+
+
+def restore_denoise(kwargs: Dict[str, Any], outputs: Dict[str, Any]) -> dict:
+    """
+    Use the stored denoised track as the clip audio.
+    """
+    return set_denoised_audio(kwargs, outputs["files"]["audio_file_name"]["path"])
+
+
+def restore_trim(kwargs: Dict[str, Any], outputs: Dict[str, Any]) -> dict:
+    """
+    Subclip the stored kept ranges.
+    """
+    kept_ranges = [tuple(kept_range) for kept_range in outputs["values"]["kept_ranges"]]
+    return set_kept_ranges(kwargs, kept_ranges)
+
+
+CHECKPOINTS = {
+    "denoise": Checkpoint(files=["audio_file_name"], restore=restore_denoise),
+    "transcript": Checkpoint(files=["transcript_file_name"]),
+    "transcript_divided": Checkpoint(files=["transcript_file_name"]),
+    "trim_by_silence": Checkpoint(values=["kept_ranges"], restore=restore_trim),
+    "save_video": Checkpoint(files=["clips_name"]),
+    "save_join": Checkpoint(files=["clips_name"]),
+}
+
+
+def select_parameters(*keys: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Parameters function of a step reading the given kwargs.
+    """
+
+    def parameters(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: kwargs.get(key) for key in keys}
+
+    return parameters
+
+
+def transcript_parameters(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parameters of the transcript steps, the silence options only count with
+    vad="silence" (see get_transcribe_options).
+    """
+    parameters = select_parameters("vad", "draft_model", "transcript_formats")(kwargs)
+    if kwargs.get("draft_model"):
+        parameters["cascade_thresholds"] = kwargs.get("config_data", {}).get(
+            "cascade_thresholds"
+        )
+    if kwargs.get("vad") == "silence":
+        parameters.update(
+            select_parameters(
+                "clip_interval", "sound_threshold", "min_silence", "hysteresis"
+            )(kwargs)
+        )
+    return parameters
+
+
+def subtitles_parameters(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parameters of the subtitles step: its config.json settings.
+    """
+    config_data = kwargs.get("config_data", {})
+    return {
+        key: config_data.get(key)
+        for key in ("subtitles_clip_config", "subtitles_position")
+    }
+
+
+# Options that change what each step produces, steps missing here use them all
+STEP_PARAMETERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "denoise": select_parameters("denoise_model", "denoise_quantize"),
+    "transcript": transcript_parameters,
+    "transcript_divided": transcript_parameters,
+    "trim_by_silence": select_parameters(
+        "clip_interval",
+        "sound_threshold",
+        "discard_silence",
+        "refine_boundaries",
+        "min_silence",
+        "hysteresis",
+    ),
+    "subtitles": subtitles_parameters,
+    "set_vertical": select_parameters(),
+    "set_horizontal": select_parameters(),
+    "save_video": select_parameters(),
+    "save_join": select_parameters(),
+    "save_separated_video": select_parameters(),
+}
+
+
+def hash_json(value: Any) -> str:
+    """
+    sha256 of the JSON representation of value.
+    """
+    data = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_run_parameters(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Every option and config value that may change the result of a run.
+    """
+    parameters = {}
+    for key, value in kwargs.items():
+        if key in RUNTIME_KEYS:
+            continue
+        try:
+            json.dumps(value)
+        except TypeError:
+            continue
+        parameters[key] = value
+    return parameters
+
+
+def get_step_parameters(step: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The options that change what step produces.
+    """
+    return STEP_PARAMETERS.get(step, get_run_parameters)(kwargs)
+
+
+class PipelineRun:
+    """
+    A linear video_edit run recorded in a manifest.
+    """
+
+    def __init__(
+        self,
+        pipeline: Sequence[str],
+        kwargs: Dict[str, Any],
+        run_dir: str = DEFAULT_RUN_DIR,
+        resume: bool = False,
+        keep_edited: bool = False,
+    ):
+        self.pipeline = list(pipeline)
+        self.keep_edited = keep_edited
+        self.kwargs = kwargs
+        self.manifest_path = Path(run_dir) / f"{kwargs['filename']}.json"
+        self.previous = self.load_steps() if resume else []
+        self.steps: List[Dict[str, Any]] = []
+
+    def load_steps(self) -> List[Dict[str, Any]]:
+        """
+        Steps of the previous run, empty if there is none.
+        """
+        if not self.manifest_path.exists():
+            return []
+        try:
+            with self.manifest_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to load run manifest '%s': %s", self.manifest_path, e)
+            return []
+        if data.get("version") != MANIFEST_VERSION:
+            return []
+        return data.get("steps", [])
+
+    def save(self) -> None:
+        """
+        Write the manifest of the steps run so far.
+        """
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": MANIFEST_VERSION,
+            "video_path": self.kwargs["video_path"],
+            "pipeline": self.pipeline,
+            "steps": self.steps,
+        }
+        temp_path = self.manifest_path.with_suffix(".json.tmp")
+        with temp_path.open("w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, default=str)
+        os.replace(temp_path, self.manifest_path)
+
+    def get_restorable(self, index: int, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Stored outputs of step index if it can be restored.
+        """
+        if index >= len(self.previous):
+            return None
+        record = self.previous[index]
+        if record.get("key") != key or record.get("step") != self.pipeline[index]:
+            return None
+        outputs = record.get("outputs")
+        if outputs is None:
+            return None
+        checkpoint = CHECKPOINTS[self.pipeline[index]]
+        files = outputs["files"]
+        if any(name not in files for name in checkpoint.files) or not all(
+            os.path.exists(item["path"]) for item in files.values()
+        ):
+            return None
+        if not self.keep_edited and any(
+            list(file_fingerprint(item["path"])) != list(item["fingerprint"])
+            for item in files.values()
+        ):
+            return None
+        if any(name not in outputs["values"] for name in checkpoint.values):
+            return None
+        return outputs
+
+    def run(self, functions_dict: Dict[str, Callable]) -> Dict[str, Any]:
+        """
+        Run (or restore) every step, updating the manifest after each one.
+        """
+        kwargs = self.kwargs
+        key = hash_json(
+            {
+                "filename": kwargs["filename"],
+                "source_fingerprint": file_fingerprint(kwargs["video_path"]),
+            }
+        )
+        resuming = bool(self.previous)
+        for index, step in enumerate(self.pipeline):
+            key = hash_json([key, step, get_step_parameters(step, kwargs)])
+            checkpoint = CHECKPOINTS.get(step)
+            outputs = None
+            if resuming and checkpoint is not None:
+                outputs = self.get_restorable(index, key)
+                resuming = outputs is not None
+            if outputs is not None:
+                logger.info(
+                    "Restoring %s of %s from the run manifest",
+                    step,
+                    kwargs["video_path"],
+                )
+                kwargs = checkpoint.restore(kwargs, outputs)
+                # Outputs edited since the previous run change the next keys
+                outputs = checkpoint.save(kwargs)
+            else:
+                logger.info("Applying %s to %s", step, kwargs["video_path"])
+                kwargs = functions_dict[step](**kwargs)
+                if checkpoint is not None:
+                    outputs = checkpoint.save(kwargs)
+            self.steps.append({"step": step, "key": key, "outputs": outputs})
+            self.save()
+            key = hash_json([key, outputs])
+        return kwargs
@@ -1,14 +1,33 @@
 """
 Module to denoise audio in a video file using the DNS64 model.
+
+On CPU the model can be dynamically quantized (int8 weights for the LSTM and
+linear layers) and run with an explicit number of torch threads. The lighter
+dns48 and master64 variants are also available. check_denoisers compares the
+variants against full-precision dns64 on a sample (speedup and SNR).
 """
 
-from moviepy import editor
+import logging
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
 from utils import get_audio
 
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
-def denoise_video(**kwargs):
+DENOISE_MODELS = ("dns64", "dns48", "master64")
+DEFAULT_DENOISE_MODEL = "dns64"
+DEFAULT_CHECK_SECONDS = 20
+DEFAULT_CHECK_REPEATS = 3
+SAMPLE_RATE = 16000  # rate of every pretrained denoiser
+
+
+def import_denoiser_libraries():
     """
-    Denoise the audio of a video file using the DNS64 model.
+    Import torch, torchaudio and denoiser, which are optional dependencies.
     """
     try:
         import torch
@@ -19,6 +38,57 @@ def denoise_video(**kwargs):
         raise ImportError(
             "Please install the required libraries: torch, torchaudio, denoiser"
         ) from e
+    return torch, torchaudio, pretrained, convert_audio
+
+
+@lru_cache(maxsize=None)
+def load_denoiser(
+    model_name: str = DEFAULT_DENOISE_MODEL,
+    quantize: bool = False,
+    device: str = "cpu",
+):
+    """
+    Load a pretrained denoiser once per process. quantize applies torch dynamic
+    int8 quantization to its LSTM and linear layers (CPU only).
+    """
+    if model_name not in DENOISE_MODELS:
+        raise ValueError(f"Unknown denoise model '{model_name}'.")
+    torch, _, pretrained, _ = import_denoiser_libraries()
+    model = getattr(pretrained, model_name)().to(device)
+    model.eval()
+    if quantize and device == "cpu":
+        model = torch.quantization.quantize_dynamic(
+            model, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8
+        )
+    elif quantize:
+        logger.info("Quantization is CPU only, running '%s' in fp32.", model_name)
+    return model
+
+
+def set_denoise_threads(threads: Optional[int]) -> None:
+    """
+    Set the torch intra-op threads used by the denoiser, None keeps torch's default.
+    """
+    if threads:
+        torch = import_denoiser_libraries()[0]
+        torch.set_num_threads(threads)
+
+
+def denoise_waveform(model, wav):
+    """
+    Denoise a (channels, samples) waveform already at the model rate.
+    """
+    torch = import_denoiser_libraries()[0]
+    with torch.no_grad():
+        return model(wav[None])[0]
+
+
+def denoise_video(**kwargs):
+    """
+    Denoise the audio of a video file using the DNS64 model (or the
+    denoise_model variant, optionally quantized).
+    """
+    torch, torchaudio, _, convert_audio = import_denoiser_libraries()
 
     input_video_file_clip, filename = (
         kwargs["input_video_file_clip"],
@@ -27,14 +97,98 @@ def denoise_video(**kwargs):
     audio_file_name = get_audio(input_video_file_clip, filename)
     if not audio_file_name:
         return kwargs
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = pretrained.dns64().to(device)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    set_denoise_threads(kwargs.get("denoise_threads"))
+    model = load_denoiser(
+        kwargs.get("denoise_model") or DEFAULT_DENOISE_MODEL,
+        bool(kwargs.get("denoise_quantize")),
+        device,
+    )
     wav, source = torchaudio.load(audio_file_name)
     wav = convert_audio(wav.to(device), source, model.sample_rate, model.chin)
-    with torch.no_grad():
-        denoised = model(wav[None])[0]
+    denoised = denoise_waveform(model, wav)
     denoised_file_name = f"{filename}_denoised.wav"
     torchaudio.save(denoised_file_name, denoised.cpu(), model.sample_rate)
-    input_video_file_clip.audio = editor.AudioFileClip(denoised_file_name)
-    kwargs["input_video_file_clip"] = input_video_file_clip
+    return set_denoised_audio(kwargs, denoised_file_name)
+
+
+def set_denoised_audio(kwargs, denoised_file_name: str):
+    """
+    Replace the clip audio with the denoised track.
+    """
+    from moviepy.editor import AudioFileClip
+
+    # A new clip, the clip received may still be used by other steps
+    kwargs["input_video_file_clip"] = kwargs["input_video_file_clip"].set_audio(
+        AudioFileClip(denoised_file_name)
+    )
+    kwargs["audio_file_name"] = denoised_file_name
     return kwargs
+
+
+def snr_db(reference: np.ndarray, estimate: np.ndarray) -> float:
+    """
+    Signal-to-noise ratio of estimate against reference, in dB.
+    """
+    noise = np.sum((reference - estimate) ** 2)
+    if noise == 0:
+        return float("inf")
+    return float(10 * np.log10(np.sum(reference**2) / noise))
+
+
+def check_denoisers(
+    audio_path: str,
+    candidates: Sequence[Tuple[str, bool]],
+    sample_start: float = 0.0,
+    sample_seconds: float = DEFAULT_CHECK_SECONDS,
+    threads: Optional[int] = None,
+    repeats: int = DEFAULT_CHECK_REPEATS,
+) -> List[Dict[str, Any]]:
+    """
+    A/B check on a sample of audio_path: every (model, quantize) candidate is
+    timed on CPU against full-precision dns64 and its output compared to the dns64
+    output (SNR in dB, higher is closer). Every model, the reference included, gets
+    an untimed warm-up pass and is timed as the median of repeats passes.
+    """
+    torch = import_denoiser_libraries()[0]
+    from .transcript_store import read_audio_range  # 16 kHz mono
+
+    audio = read_audio_range(audio_path, sample_start, sample_start + sample_seconds)
+    if not len(audio):
+        raise ValueError(f"No audio to check in '{audio_path}'.")
+    wav = torch.from_numpy(audio.copy())[None]
+    duration = len(audio) / SAMPLE_RATE
+    set_denoise_threads(threads)
+
+    def run(model_name: str, quantize: bool) -> Tuple[np.ndarray, float]:
+        model = load_denoiser(model_name, quantize, "cpu")
+        denoised = denoise_waveform(model, wav)  # warm-up, allocator and first call
+        elapsed = []
+        for _ in range(max(1, repeats)):
+            started = time.perf_counter()
+            denoised = denoise_waveform(model, wav)
+            elapsed.append(time.perf_counter() - started)
+        return denoised.numpy().reshape(-1), float(np.median(elapsed))
+
+    reference, reference_time = run(DEFAULT_DENOISE_MODEL, False)
+    results = []
+    for model_name, quantize in candidates:
+        output, elapsed = run(model_name, quantize)
+        length = min(len(output), len(reference))
+        result = {
+            "model": model_name,
+            "quantize": quantize,
+            "rtf": elapsed / duration,
+            "speedup": reference_time / elapsed,
+            "snr_db": snr_db(reference[:length], output[:length]),
+        }
+        logger.info(
+            "%s%s: RTF %.3f, speedup x%.2f, SNR vs dns64 fp32 %.1f dB",
+            model_name,
+            " int8" if quantize else "",
+            result["rtf"],
+            result["speedup"],
+            result["snr_db"],
+        )
+        results.append(result)
+    return results
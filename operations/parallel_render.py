@@ -0,0 +1,355 @@
+"""
+Module to render MoviePy clips with several worker processes.
+
+MoviePy evaluates frame functions (shake, subtitles, composites...) in a single
+Python thread, the encoder threads only help ffmpeg. Two parallel modes are offered:
+
+- write_videofile_parallel: output frame indices are split in chunks across forked
+  worker processes. Workers write RGB frames into a shared-memory ring buffer and the
+  parent streams them, in order, to one ffmpeg stdin. Frame n may only be written
+  once frame n - ring_slots was streamed, so memory is bounded by the ring size and
+  slow writers back-pressure the workers. The ring holds one chunk per worker,
+  otherwise every worker but the one rendering the oldest chunk would wait.
+- write_videofile_in_parts: the timeline is split into time ranges aligned to the
+  keyframe interval, each range is rendered and encoded by its own process and the
+  parts are joined with the concat demuxer (stream copy). Audio is encoded once.
+"""
+
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+import numpy as np
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+from utils import reset_forked_readers
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_FRAMES = 8  # consecutive frames per task, keeps decoders moving forward
+WORKER_POLL_SECONDS = 1.0
+KEYFRAME_SECONDS = 2  # keyframe interval, parts start on a multiple of it
+
+# Clip being exported by write_videofile_in_parts, inherited by the forked pool
+_export_clip = None
+
+
+def can_render_in_parallel() -> bool:
+    """
+    Workers inherit the clip through fork, which is only available on POSIX.
+    """
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def get_pix_fmt_params(codec: str, width: int, height: int) -> List[str]:
+    """
+    yuv420p output under the condition FFMPEG_VideoWriter uses: libx264 rejects
+    it for odd sizes.
+    """
+    if codec == "libx264" and width % 2 == 0 and height % 2 == 0:
+        return ["-pix_fmt", "yuv420p"]
+    return []
+
+
+def _render_worker(
+    clip, fps, frame_indices, ring_name, ring_slots, frame_shape, streamed, ready, failed
+):
+    """
+    Worker process: render the assigned frames into the ring buffer.
+    """
+    reset_forked_readers()
+    ring = shared_memory.SharedMemory(name=ring_name)
+    try:
+        frames = np.ndarray((ring_slots,) + frame_shape, dtype=np.uint8, buffer=ring.buf)
+        for index in frame_indices:
+            slot = index % ring_slots
+            frame = clip.get_frame(index / fps)
+            with streamed.get_lock():
+                while index - streamed.value >= ring_slots:
+                    streamed.get_lock().wait()
+            frames[slot] = np.asarray(frame[:, :, :3], dtype=np.uint8)
+            ready[slot].release()
+        del frames
+    except Exception:
+        logger.exception("Frame render worker failed.")
+        failed.set()
+        raise
+    finally:
+        ring.close()
+
+
+def _split_frames(n_frames: int, workers: int, chunk_frames: int) -> List[List[int]]:
+    """
+    Deal chunks of consecutive frame indices to the workers, round robin.
+    """
+    assignments: List[List[int]] = [[] for _ in range(workers)]
+    for chunk, start in enumerate(range(0, n_frames, chunk_frames)):
+        stop = min(start + chunk_frames, n_frames)
+        assignments[chunk % workers].extend(range(start, stop))
+    return assignments
+
+
+def write_videofile_parallel(
+    clip,
+    output_path: str,
+    fps: float,
+    workers: Optional[int] = None,
+    codec: str = "libx264",
+    audio_codec: str = "aac",
+    preset: str = "medium",
+    threads: Optional[int] = None,
+    chunk_frames: int = DEFAULT_CHUNK_FRAMES,
+) -> None:
+    """
+    Render clip to output_path, generating frames in parallel worker processes.
+    Falls back to clip.write_videofile when fork is unavailable or workers <= 1.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or not can_render_in_parallel():
+        clip.write_videofile(
+            output_path,
+            fps=fps,
+            codec=codec,
+            audio_codec=audio_codec,
+            preset=preset,
+            threads=threads,
+        )
+        return
+
+    n_frames = len(np.arange(0, clip.duration, 1.0 / fps))
+    width, height = clip.size
+    frame_shape = (height, width, 3)
+    chunk_frames = max(1, chunk_frames)
+    ring_slots = workers * chunk_frames
+    ctx = multiprocessing.get_context("fork")
+    # Number of frames already streamed to ffmpeg, its lock is a condition
+    streamed = ctx.Value("q", 0, lock=ctx.Condition())
+    ready = [ctx.Semaphore(0) for _ in range(ring_slots)]
+    failed = ctx.Event()
+
+    audio_path = None
+    if clip.audio is not None:
+        handle, audio_path = tempfile.mkstemp(suffix=".m4a")
+        os.close(handle)
+        clip.audio.write_audiofile(audio_path, codec=audio_codec, logger=None)
+
+    command = [
+        get_setting("FFMPEG_BINARY"),
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-vcodec",
+        "rawvideo",
+        "-s",
+        f"{width}x{height}",
+        "-pix_fmt",
+        "rgb24",
+        "-r",
+        str(fps),
+        "-i",
+        "-",
+    ]
+    if audio_path:
+        command += ["-i", audio_path, "-map", "0:v", "-map", "1:a", "-c:a", "copy"]
+    command += ["-c:v", codec, "-preset", preset]
+    command += get_pix_fmt_params(codec, width, height)
+    if threads:
+        command += ["-threads", str(threads)]
+    command.append(output_path)
+
+    ring = shared_memory.SharedMemory(
+        create=True, size=ring_slots * int(np.prod(frame_shape))
+    )
+    processes = []
+    try:
+        for frame_indices in _split_frames(n_frames, workers, chunk_frames):
+            process = ctx.Process(
+                target=_render_worker,
+                args=(
+                    clip,
+                    fps,
+                    frame_indices,
+                    ring.name,
+                    ring_slots,
+                    frame_shape,
+                    streamed,
+                    ready,
+                    failed,
+                ),
+                daemon=True,
+            )
+            process.start()
+            processes.append(process)
+        logger.info(
+            "Rendering %d frames with %d worker processes into '%s'...",
+            n_frames,
+            workers,
+            output_path,
+        )
+
+        frames = np.ndarray((ring_slots,) + frame_shape, dtype=np.uint8, buffer=ring.buf)
+        with subprocess.Popen(command, stdin=subprocess.PIPE) as writer:
+            for index in range(n_frames):
+                slot = index % ring_slots
+                while not ready[slot].acquire(timeout=WORKER_POLL_SECONDS):
+                    if failed.is_set():
+                        writer.kill()
+                        raise RuntimeError("A frame render worker failed.")
+                writer.stdin.write(frames[slot].data)
+                with streamed.get_lock():
+                    streamed.value += 1
+                    streamed.get_lock().notify_all()
+            writer.stdin.close()
+            if writer.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed to write '{output_path}'.")
+        del frames
+    finally:
+        for process in processes:
+            process.join(timeout=WORKER_POLL_SECONDS)
+            if process.is_alive():
+                process.terminate()
+        ring.close()
+        ring.unlink()
+        if audio_path:
+            os.remove(audio_path)
+
+
+def _init_part_worker() -> None:
+    """
+    Pool initializer for write_videofile_in_parts.
+    """
+    reset_forked_readers()
+
+
+def _encode_part(part_path, start_frame, end_frame, fps, codec, preset, threads, gop):
+    """
+    Render and encode the frames [start_frame, end_frame) of the exported clip.
+    """
+    writer = FFMPEG_VideoWriter(
+        part_path,
+        _export_clip.size,
+        fps,
+        codec=codec,
+        preset=preset,
+        threads=threads,
+        # FFMPEG_VideoWriter adds yuv420p itself when both sides are even
+        ffmpeg_params=["-g", str(gop)],
+    )
+    try:
+        for index in range(start_frame, end_frame):
+            frame = _export_clip.get_frame(index / fps)
+            writer.write_frame(np.asarray(frame[:, :, :3], dtype=np.uint8))
+    finally:
+        writer.close()
+    return part_path
+
+
+def split_keyframe_ranges(n_frames: int, parts: int, gop: int) -> List[tuple]:
+    """
+    Split [0, n_frames) into at most `parts` ranges starting on multiples of gop.
+    """
+    frames_per_part = max(gop, math.ceil(n_frames / parts / gop) * gop)
+    return [
+        (start, min(start + frames_per_part, n_frames))
+        for start in range(0, n_frames, frames_per_part)
+    ]
+
+
+def write_videofile_in_parts(
+    clip,
+    output_path: str,
+    fps: float,
+    parts: int,
+    codec: str = "libx264",
+    audio_codec: str = "aac",
+    preset: str = "medium",
+    threads: Optional[int] = None,
+) -> None:
+    """
+    Render clip to output_path as `parts` time ranges encoded in parallel processes,
+    joined with stream copy. Falls back to clip.write_videofile when fork is
+    unavailable or parts <= 1.
+    """
+    global _export_clip
+
+    if parts <= 1 or not can_render_in_parallel():
+        clip.write_videofile(
+            output_path,
+            fps=fps,
+            codec=codec,
+            audio_codec=audio_codec,
+            preset=preset,
+            threads=threads,
+        )
+        return
+
+    n_frames = len(np.arange(0, clip.duration, 1.0 / fps))
+    gop = max(1, int(round(fps * KEYFRAME_SECONDS)))
+    ranges = split_keyframe_ranges(n_frames, parts, gop)
+    threads_per_part = max(1, (threads or os.cpu_count() or 1) // len(ranges))
+    work_dir = tempfile.mkdtemp(prefix="export_parts_")
+    try:
+        audio_path = None
+        if clip.audio is not None:
+            audio_path = os.path.join(work_dir, "audio.m4a")
+            clip.audio.write_audiofile(audio_path, codec=audio_codec, logger=None)
+
+        logger.info(
+            "Encoding %d frames of '%s' in %d parts...",
+            n_frames,
+            output_path,
+            len(ranges),
+        )
+        _export_clip = clip
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(len(ranges), initializer=_init_part_worker) as pool:
+            part_paths = pool.starmap(
+                _encode_part,
+                [
+                    (
+                        os.path.join(work_dir, f"part_{i:05d}.mp4"),
+                        start,
+                        end,
+                        fps,
+                        codec,
+                        preset,
+                        threads_per_part,
+                        gop,
+                    )
+                    for i, (start, end) in enumerate(ranges)
+                ],
+            )
+
+        list_path = os.path.join(work_dir, "parts.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for part_path in part_paths:
+                f.write(f"file '{os.path.basename(part_path)}'\n")
+        command = [
+            get_setting("FFMPEG_BINARY"),
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            list_path,
+        ]
+        if audio_path:
+            command += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+        command += ["-c", "copy", os.path.abspath(output_path)]
+        subprocess.run(command, check=True)
+    finally:
+        _export_clip = None
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,164 @@
+"""
+Module to run video_edit pipelines as a graph of steps.
+
+Every step declares the kwargs it reads and writes (STEP_SPECS). The linear
+pipeline is turned into a DAG: a step depends on the earlier steps that write
+something it reads. Steps whose inputs are ready run concurrently in threads, so
+the wall time of an edit is its critical path (e.g. transcript and
+trim_by_silence both only need the denoised source).
+
+The result is the same as the linear run. A step receives the values written
+by the steps before it in the pipeline, never by later ones, and the final
+kwargs hold the last value written for each key. This requires steps to
+return new clips instead of mutating the clip they receive. Steps decoding
+through the shared MoviePy readers hold the "reader" lock, as the readers are
+not thread safe.
+"""
+
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CLIP = "input_video_file_clip"
+SAVE_READS = (CLIP, "video_modified", "audio_file_name", "clips", "kept_ranges_clip")
+
+
+class StepSpec:
+    """
+    kwargs read and written by a pipeline step, None meaning all of them.
+    """
+
+    __slots__ = ("reads", "writes", "locks")
+
+    def __init__(
+        self,
+        reads: Optional[Sequence[str]],
+        writes: Optional[Sequence[str]],
+        locks: Sequence[str] = (),
+    ):
+        self.reads: Optional[FrozenSet[str]] = (
+            None if reads is None else frozenset(reads)
+        )
+        self.writes: Optional[FrozenSet[str]] = (
+            None if writes is None else frozenset(writes)
+        )
+        self.locks = tuple(sorted(locks))
+
+    def does_write(self, key: str) -> bool:
+        """Whether the step writes key."""
+        return self.writes is None or key in self.writes
+
+
+STEP_SPECS = {
+    "trim_by_silence": StepSpec(
+        [CLIP], ["kept_ranges", "kept_ranges_clip", "clips"], ["reader"]
+    ),
+    "denoise": StepSpec([CLIP], [CLIP, "audio_file_name"], ["reader"]),
+    "transcript": StepSpec([CLIP], ["transcript_file_name"]),
+    "transcript_divided": StepSpec([CLIP], ["transcript_file_name"]),
+    "subtitles": StepSpec([CLIP, "transcript_file_name"], [CLIP, "video_modified"]),
+    "set_vertical": StepSpec([CLIP], [CLIP, "shape", "video_modified"]),
+    "set_horizontal": StepSpec([CLIP], [CLIP, "shape", "video_modified"]),
+    "save_video": StepSpec(SAVE_READS, ["clips_name"], ["reader"]),
+    "save_join": StepSpec(SAVE_READS, ["clips_name"], ["reader"]),
+    "save_separated_video": StepSpec(SAVE_READS, ["clips_name"], ["reader"]),
+}
+# Steps without a spec run alone, after every earlier step
+DEFAULT_SPEC = StepSpec(None, None, ["reader"])
+
+
+def get_step_spec(step: str) -> StepSpec:
+    """
+    Declared reads and writes of a step.
+    """
+    return STEP_SPECS.get(step, DEFAULT_SPEC)
+
+
+def build_dependencies(pipeline: Sequence[str]) -> List[List[int]]:
+    """
+    For each step, the indices of the earlier steps it depends on.
+    """
+    specs = [get_step_spec(step) for step in pipeline]
+    dependencies = []
+    for i, spec in enumerate(specs):
+        dependencies.append(
+            [
+                j
+                for j in range(i)
+                if spec.reads is None
+                or specs[j].writes is None
+                or spec.reads & specs[j].writes
+            ]
+        )
+    return dependencies
+
+
+def describe_graph(pipeline: Sequence[str]) -> str:
+    """
+    Human readable dependencies of the pipeline steps.
+    """
+    lines = []
+    for i, dependencies in enumerate(build_dependencies(pipeline)):
+        after = ", ".join(f"{pipeline[j]}#{j}" for j in dependencies) or "source"
+        lines.append(f"  {pipeline[i]}#{i} <- {after}")
+    return "\n".join(lines)
+
+
+def run_pipeline_graph(
+    pipeline: Sequence[str],
+    kwargs: Dict[str, Any],
+    functions_dict: Dict[str, Callable],
+    workers: int = 2,
+) -> Dict[str, Any]:
+    """
+    Run the pipeline on the kwargs returned by get_video_data, independent steps
+    in parallel threads. Returns the kwargs a linear run would return.
+    """
+    specs = [get_step_spec(step) for step in pipeline]
+    dependencies = build_dependencies(pipeline)
+    outputs: Dict[int, Dict[str, Any]] = {}
+    locks = {name: threading.Lock() for spec in specs for name in spec.locks}
+
+    def resolve(index: int) -> Dict[str, Any]:
+        """kwargs of a step: the latest values written before it."""
+        step_kwargs = dict(kwargs)
+        for j in range(index):
+            if j in outputs:
+                step_kwargs.update(outputs[j])
+        return step_kwargs
+
+    def run(index: int) -> Dict[str, Any]:
+        step, spec = pipeline[index], specs[index]
+        step_kwargs = resolve(index)
+        for name in spec.locks:
+            locks[name].acquire()
+        try:
+            logger.info("Applying %s to %s", step, kwargs["video_path"])
+            result = functions_dict[step](**step_kwargs)
+        finally:
+            for name in reversed(spec.locks):
+                locks[name].release()
+        return {
+            key: value
+            for key, value in result.items()
+            if spec.does_write(key)
+            and (spec.writes is not None or step_kwargs.get(key) is not value)
+        }
+
+    logger.info("Pipeline graph:\n%s", describe_graph(pipeline))
+    pending = set(range(len(pipeline)))
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for index in sorted(pending):
+                if all(j in outputs for j in dependencies[index]):
+                    pending.discard(index)
+                    running[executor.submit(run, index)] = index
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                outputs[running.pop(future)] = future.result()
+    return resolve(len(pipeline))
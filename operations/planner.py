@@ -0,0 +1,334 @@
+"""
+Module to plan video_edit pipelines and run them as a single ffmpeg job.
+
+The steps are first recorded as a lazy plan: analysis and file-producing steps
+(transcripts, denoise, silence detection) run eagerly, frame operations (scale,
+subtitle burn, trim ranges, audio replace) are only described. When every step of
+the pipeline can be expressed, the frame operations are compiled into one ffmpeg
+filtergraph per output, so the frames never go through Python. Otherwise the
+pipeline runs with MoviePy as usual.
+
+The recorded plan keeps the MoviePy semantics: trim_by_silence snapshots the
+operations applied so far (its subclips do not see later steps), save_join uses
+that snapshot when present and save_video always uses the main chain.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from moviepy.config import get_setting
+from PIL import ImageColor
+
+from .save import remux_video
+from .trim import get_kept_ranges
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OUTPUT_FPS = 24  # same frame rate the MoviePy save steps write
+ASS_PLAY_RES_Y = 288  # libass script height used for SRT files
+
+# Steps run as usual while planning, they only read the input or write side files
+EAGER_STEPS = ("transcript", "transcript_divided", "denoise")
+OUTPUT_STEPS = ("save_video", "save_join")
+FRAME_STEPS = ("set_vertical", "set_horizontal", "subtitles", "trim_by_silence")
+
+
+class PlanNode:
+    """
+    One recorded pipeline step.
+    """
+
+    __slots__ = ("step", "kind")
+
+    def __init__(self, step: str, kind: str):
+        self.step = step
+        # "eager", "frame" or "output"
+        self.kind = kind
+
+
+class Plan:
+    """
+    A recorded video_edit pipeline.
+    """
+
+    def __init__(self, nodes: List[PlanNode], fallback_reason: Optional[str] = None):
+        self.nodes = nodes
+        self.fallback_reason = fallback_reason
+
+    @property
+    def fusible(self) -> bool:
+        """Whether the whole pipeline can run as ffmpeg jobs."""
+        return self.fallback_reason is None
+
+    def explain(self) -> str:
+        """
+        Human readable description of how the pipeline will run.
+        """
+        if not self.fusible:
+            return (
+                f"MoviePy execution ({self.fallback_reason}):\n"
+                + "\n".join(f"  {node.step}" for node in self.nodes)
+            )
+        lines = ["Fused execution:"]
+        pending: List[str] = []
+        snapshot: Optional[List[str]] = None
+        for node in self.nodes:
+            if node.kind == "eager":
+                lines.append(f"  run {node.step} (eager, side files only)")
+                if node.step == "denoise":
+                    pending.append("replace audio with the denoised track")
+            elif node.step == "trim_by_silence":
+                lines.append("  detect silences (eager, loudness index)")
+                snapshot = pending + ["keep non-silent ranges (select/aselect)"]
+            elif node.kind == "frame":
+                pending.append(_FRAME_DESCRIPTIONS[node.step])
+            else:
+                ops = snapshot if node.step == "save_join" and snapshot else pending
+                video_ops = [op for op in ops if not op.startswith("replace audio")]
+                if not video_ops:
+                    lines.append(f"  {node.step}: remux, video stream copied")
+                    lines.extend(f"    {op}" for op in ops)
+                    continue
+                lines.append(f"  {node.step}: one ffmpeg filtergraph")
+                lines.extend(f"    {op}" for op in ops)
+                lines.append(f"    fps={OUTPUT_FPS}, libx264/aac encode")
+        return "\n".join(lines)
+
+
+_FRAME_DESCRIPTIONS = {
+    "set_vertical": "scale to vertical (swap width/height if landscape)",
+    "set_horizontal": "scale to horizontal (swap width/height if portrait)",
+    "subtitles": "burn subtitles (libass)",
+}
+
+
+@lru_cache(maxsize=None)
+def ffmpeg_has_filter(name: str) -> bool:
+    """
+    Whether the ffmpeg binary was built with the given filter.
+    """
+    result = subprocess.run(
+        [get_setting("FFMPEG_BINARY"), "-hide_banner", "-filters"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    return any(
+        len(parts) > 1 and parts[1] == name
+        for parts in (line.split() for line in result.stdout.splitlines())
+    )
+
+
+def build_plan(pipeline: Sequence[str]) -> Plan:
+    """
+    Record the pipeline steps. The plan falls back to MoviePy if a step cannot
+    be expressed as ffmpeg filters.
+    """
+    nodes: List[PlanNode] = []
+    fallback_reason = None
+    for step in pipeline:
+        if step in EAGER_STEPS:
+            nodes.append(PlanNode(step, "eager"))
+        elif step in FRAME_STEPS:
+            nodes.append(PlanNode(step, "frame"))
+        elif step in OUTPUT_STEPS:
+            nodes.append(PlanNode(step, "output"))
+        else:
+            nodes.append(PlanNode(step, "unsupported"))
+            fallback_reason = fallback_reason or f"step '{step}' cannot be fused"
+    if "subtitles" in pipeline and not ffmpeg_has_filter("subtitles"):
+        fallback_reason = fallback_reason or "ffmpeg has no subtitles filter"
+    if not any(node.kind == "output" for node in nodes):
+        fallback_reason = fallback_reason or "the pipeline saves no video"
+    return Plan(nodes, fallback_reason)
+
+
+def escape_filter_value(value: str) -> str:
+    """
+    Escape a value (e.g. a file path) used inside a quoted filter option.
+    """
+    return str(value).replace("\\", "/").replace(":", "\\:").replace("'", "'\\''")
+
+
+def ass_colour(color: Optional[str]) -> Optional[str]:
+    """
+    Convert a color name to the ASS &HAABBGGRR format, None if transparent.
+    """
+    if not color or color == "transparent":
+        return None
+    red, green, blue = ImageColor.getrgb(color)[:3]
+    return f"&H00{blue:02X}{green:02X}{red:02X}"
+
+
+def subtitles_filter(
+    subtitles_path: str, config_data: Dict[str, Any], height: int
+) -> str:
+    """
+    Build the subtitles filter mirroring the TextClip style of add_subtitles.
+    Sizes are converted to libass script units (PlayResY=288).
+    """
+    clip_config = config_data.get("subtitles_clip_config", {})
+    position = config_data.get("subtitles_position", {})
+    scale = ASS_PLAY_RES_Y / height
+    fontsize = clip_config.get("fontsize") or 24
+    # add_subtitles places the text top at h + offset
+    margin_v = max(0, -position.get("text_position_y_offset", 0) - fontsize)
+    style = [
+        "Alignment=2",
+        f"Fontsize={round(fontsize * scale)}",
+        f"MarginV={round(margin_v * scale)}",
+    ]
+    if clip_config.get("font"):
+        style.append(f"Fontname={clip_config['font']}")
+    primary = ass_colour(clip_config.get("color"))
+    if primary:
+        style.append(f"PrimaryColour={primary}")
+    background = ass_colour(clip_config.get("bg_color"))
+    if background:
+        style += ["BorderStyle=3", f"BackColour={background}", "Outline=0"]
+    return (
+        f"subtitles=filename='{escape_filter_value(subtitles_path)}'"
+        f":force_style='{','.join(style)}'"
+    )
+
+
+def ranges_expression(kept_ranges: Sequence[Tuple[float, float]]) -> str:
+    """
+    select/aselect expression keeping the frames inside the (disjoint) ranges.
+    """
+    return "+".join(
+        f"gte(t,{start:.6f})*lt(t,{end:.6f})" for start, end in kept_ranges
+    )
+
+
+def build_fused_command(
+    video_path: str,
+    audio_path: Optional[str],
+    video_filters: List[str],
+    kept_ranges: Optional[Sequence[Tuple[float, float]]],
+    output_path: str,
+    work_dir: str,
+    threads: Optional[int] = None,
+) -> List[str]:
+    """
+    Compile the frame operations of one output into an ffmpeg command.
+    """
+    video_chain = [f"fps={OUTPUT_FPS}"] + list(video_filters)
+    audio_chain: List[str] = []
+    if kept_ranges is not None:
+        expression = ranges_expression(kept_ranges)
+        video_chain += [f"select='{expression}'", f"setpts=N/{OUTPUT_FPS}/TB"]
+        audio_chain += [f"aselect='{expression}'", "asetpts=N/SR/TB"]
+    filters = [f"[0:v]{','.join(video_chain)}[outv]"]
+    command = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error"]
+    command += ["-i", video_path]
+    if audio_path:
+        audio_input = 0 if audio_path == video_path else 1
+        if audio_input:
+            command += ["-i", audio_path]
+        filters.append(f"[{audio_input}:a]{','.join(audio_chain or ['anull'])}[outa]")
+
+    script_path = os.path.join(work_dir, "filtergraph.txt")
+    with open(script_path, "w", encoding="utf-8") as f:
+        f.write(";\n".join(filters))
+    command += ["-filter_complex_script", script_path, "-map", "[outv]"]
+    if audio_path:
+        command += ["-map", "[outa]", "-c:a", "aac"]
+    command += ["-r", str(OUTPUT_FPS), "-c:v", "libx264", "-preset", "medium"]
+    command += ["-pix_fmt", "yuv420p"]
+    if threads:
+        command += ["-threads", str(threads)]
+    command.append(output_path)
+    return command
+
+
+def execute_plan(
+    plan: Plan, kwargs: Dict[str, Any], functions_dict: Dict[str, Callable]
+) -> Dict[str, Any]:
+    """
+    Run a fusible plan on the kwargs returned by get_video_data.
+    """
+    video_path = kwargs["video_path"]
+    clip = kwargs["input_video_file_clip"]
+    audio_path = video_path if clip.audio is not None else None
+    size = tuple(clip.size)
+    video_filters: List[str] = []
+    snapshot = None  # (video filters, audio path) when trim_by_silence ran
+
+    for node in plan.nodes:
+        if node.kind == "eager":
+            logger.info("Applying %s to %s", node.step, video_path)
+            kwargs = functions_dict[node.step](**kwargs)
+            if node.step == "denoise" and kwargs.get("audio_file_name"):
+                audio_path = kwargs["audio_file_name"]
+        elif node.step in ("set_vertical", "set_horizontal"):
+            width, height = size
+            if (node.step == "set_vertical" and width > height) or (
+                node.step == "set_horizontal" and width < height
+            ):
+                size = (height, width)
+                video_filters.append(f"scale={height}:{width},setsar=1")
+        elif node.step == "subtitles":
+            subtitles_path = kwargs.get(
+                "transcript_file_name", f"{kwargs['filename']}_transcript.srt"
+            )
+            if not os.path.exists(subtitles_path):
+                subtitles_path = f"{kwargs['filename']}_transcript.srt"
+            video_filters.append(
+                subtitles_filter(
+                    subtitles_path, kwargs.get("config_data", {}), size[1]
+                )
+            )
+        elif node.step == "trim_by_silence":
+            logger.info("Detecting silences in %s", video_path)
+            kwargs["kept_ranges"] = get_kept_ranges(
+                kwargs["input_video_file_clip"], kwargs
+            )
+            snapshot = (list(video_filters), audio_path)
+        else:
+            kwargs = _write_output(
+                node.step, kwargs, video_filters, audio_path, snapshot
+            )
+    return kwargs
+
+
+def _write_output(
+    step: str,
+    kwargs: Dict[str, Any],
+    video_filters: List[str],
+    audio_path: Optional[str],
+    snapshot: Optional[Tuple[List[str], Optional[str]]],
+) -> Dict[str, Any]:
+    """
+    Write the output of a save step with one ffmpeg job (or a remux).
+    """
+    video_path = kwargs["video_path"]
+    clip_name = f"{kwargs['filename']}_EDITED.mp4"
+    kept_ranges = None
+    if step == "save_join" and snapshot is not None:
+        video_filters, audio_path = snapshot
+        kept_ranges = kwargs["kept_ranges"]
+
+    if not video_filters and kept_ranges is None:
+        logger.info("Video stream unmodified, remuxing into '%s'...", clip_name)
+        if remux_video(video_path, audio_path or video_path, clip_name):
+            kwargs["clips_name"] = clip_name
+            return kwargs
+
+    work_dir = tempfile.mkdtemp(prefix="fused_pipeline_")
+    try:
+        command = build_fused_command(
+            video_path, audio_path, video_filters, kept_ranges, clip_name, work_dir, 8
+        )
+        logger.info("Writing '%s' with one ffmpeg filtergraph...", clip_name)
+        subprocess.run(command, check=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    kwargs["clips_name"] = clip_name
+    return kwargs
@@ -2,18 +2,101 @@
 Module to save video clips using moviepy.
 """
 
+import logging
+import subprocess
+
 from moviepy import editor
+from moviepy.config import get_setting
+
+from .parallel_render import write_videofile_in_parts, write_videofile_parallel
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def write_clip(clip, clip_name, render_workers=1, export_parts=1, **write_kwargs):
+    """
+    Write a clip to a file. With export_parts > 1 the timeline is encoded as that
+    many keyframe-aligned parts in parallel and joined with stream copy; with
+    render_workers > 1 the frames are generated in that many worker processes
+    (see parallel_render.py).
+    """
+    if export_parts and export_parts > 1:
+        write_videofile_in_parts(
+            clip,
+            clip_name,
+            fps=write_kwargs.get("fps") or clip.fps,
+            parts=export_parts,
+            codec=write_kwargs.get("codec", "libx264"),
+            audio_codec=write_kwargs.get("audio_codec", "aac"),
+            threads=write_kwargs.get("threads"),
+        )
+        return
+    if render_workers and render_workers > 1:
+        write_videofile_parallel(
+            clip,
+            clip_name,
+            fps=write_kwargs.get("fps") or clip.fps,
+            workers=render_workers,
+            codec=write_kwargs.get("codec", "libx264"),
+            audio_codec=write_kwargs.get("audio_codec", "aac"),
+            threads=write_kwargs.get("threads"),
+        )
+        return
+    clip.write_videofile(clip_name, **write_kwargs)
+
+
+def remux_video(video_path, audio_path, clip_name, audio_codec="aac"):
+    """
+    Write clip_name with the video stream of video_path copied untouched and the
+    audio of audio_path. Returns False if ffmpeg could not remux the streams.
+    """
+    command = [
+        get_setting("FFMPEG_BINARY"),
+        "-y",
+        "-loglevel",
+        "error",
+        "-i",
+        video_path,
+        "-i",
+        audio_path,
+        "-map",
+        "0:v:0",
+        "-map",
+        "1:a:0?",
+        "-c:v",
+        "copy",
+        "-c:a",
+        audio_codec,
+        clip_name,
+    ]
+    try:
+        subprocess.run(command, check=True)
+    except subprocess.CalledProcessError as e:
+        logger.warning("Could not remux '%s' (%s), re-encoding.", video_path, e)
+        return False
+    return True
 
 
 def save_video(**kwargs):
     """
-    Save a video clip to a file.
+    Save a video clip to a file. When no step changed the frames, the original
+    video stream is copied and only the (possibly processed) audio is encoded.
     """
     filename = kwargs["filename"]
     input_video_file_clip = kwargs["input_video_file_clip"]
     clip_name = f"{filename}_EDITED.mp4"
-    input_video_file_clip.write_videofile(
+    if kwargs.get("video_modified") is False and kwargs.get("video_path"):
+        audio_path = kwargs.get("audio_file_name") or kwargs["video_path"]
+        logger.info("Video stream unmodified, remuxing into '%s'...", clip_name)
+        if remux_video(kwargs["video_path"], audio_path, clip_name):
+            kwargs["clips_name"] = clip_name
+            return kwargs
+    write_clip(
+        input_video_file_clip,
         clip_name,
+        kwargs.get("render_workers", 1),
+        kwargs.get("export_parts", 1),
         audio_codec="aac",
         threads=8,
         fps=24,
@@ -32,16 +115,28 @@ def save_joined_video(**kwargs):
     clips = kwargs["clips"]
     clip_name = f"{filename}_EDITED.mp4"
     if isinstance(clips, list):
-        concat_clip = editor.concatenate_videoclips(clips)
-        concat_clip.write_videofile(
+        # The kept ranges timeline decodes the source in one forward pass
+        concat_clip = kwargs.get("kept_ranges_clip") or editor.concatenate_videoclips(
+            clips
+        )
+        write_clip(
+            concat_clip,
             clip_name,
+            kwargs.get("render_workers", 1),
+            kwargs.get("export_parts", 1),
             audio_codec="aac",
             threads=8,
             fps=24,
         )
         kwargs["clips_name"] = clip_name
         return kwargs
-    clips.write_videofile(clip_name, audio_codec="aac")
+    write_clip(
+        clips,
+        clip_name,
+        kwargs.get("render_workers", 1),
+        kwargs.get("export_parts", 1),
+        audio_codec="aac",
+    )
     kwargs["clips_name"] = clip_name
     return kwargs
 
@@ -57,6 +152,11 @@ def save_separated_video(**kwargs):
     clips_format = f"{filename}_EDITED_{{i}}.mp4"
     for i, clip in enumerate(clips):
         pad_i = str(i).zfill(5)
-        clip.write_videofile(clips_format.format(i=pad_i), audio_codec="aac")
+        write_clip(
+            clip,
+            clips_format.format(i=pad_i),
+            kwargs.get("render_workers", 1),
+            audio_codec="aac",
+        )
     kwargs["clips_name"] = clips_format.format(i="{i}")
     return kwargs
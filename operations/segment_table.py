@@ -0,0 +1,248 @@
+"""
+Module with the compact segment store used by the avatar video generation.
+
+Segments are kept as a struct-of-arrays table (start/end/volume float arrays and
+emotion codes into a label table) and cached in a versioned binary .npz file.
+Run `python operations/segment_table.py <cache.npz>` to print a cache as JSON.
+"""
+
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+SEGMENT_CACHE_VERSION = 1
+# Never '<stem>_segments.json', the legacy cache name still read by the loader
+EXPORT_SUFFIX = "_export.json"
+
+
+class SegmentData:
+    """
+    Simple container for a single transcript segment's metadata.
+    """
+
+    __slots__ = ("start", "end", "emotion", "volume", "envelope")
+
+    def __init__(
+        self,
+        start: float,
+        end: float,
+        emotion: str,
+        volume: float,
+        envelope: Optional[np.ndarray] = None,
+    ):
+        self.start = start
+        self.end = end
+        self.emotion = emotion
+        self.volume = volume
+        # Optional per-frame volume (sampled at DEFAULT_FPS) used for the shake
+        self.envelope = envelope
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Transform SegmentData to Dict
+        """
+        return {
+            "start": self.start,
+            "end": self.end,
+            "emotion": self.emotion,
+            "volume": self.volume,
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "SegmentData":
+        """
+        Transform dict to SegmentData
+        """
+        return SegmentData(
+            start=data["start"],
+            end=data["end"],
+            emotion=data["emotion"],
+            volume=data["volume"],
+        )
+
+
+class SegmentRow:
+    """
+    Read-only view of one row of a SegmentTable, with the SegmentData attributes.
+    """
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: "SegmentTable", index: int):
+        self._table = table
+        self._index = index
+
+    @property
+    def start(self) -> float:
+        """Start time in seconds."""
+        return float(self._table.starts[self._index])
+
+    @property
+    def end(self) -> float:
+        """End time in seconds."""
+        return float(self._table.ends[self._index])
+
+    @property
+    def volume(self) -> float:
+        """Segment volume."""
+        return float(self._table.volumes[self._index])
+
+    @property
+    def emotion(self) -> str:
+        """Emotion label."""
+        return self._table.labels[int(self._table.emotion_codes[self._index])]
+
+    @property
+    def envelope(self) -> None:
+        """Rows never carry a volume envelope, see compact_segments."""
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Transform the row to Dict
+        """
+        return {
+            "start": self.start,
+            "end": self.end,
+            "emotion": self.emotion,
+            "volume": self.volume,
+        }
+
+
+class SegmentTable:
+    """
+    Struct-of-arrays segment store. Indexing returns SegmentRow views.
+    """
+
+    def __init__(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        volumes: np.ndarray,
+        emotion_codes: np.ndarray,
+        labels: List[str],
+    ):
+        self.starts = starts
+        self.ends = ends
+        self.volumes = volumes
+        self.emotion_codes = emotion_codes
+        self.labels = labels
+
+    @classmethod
+    def from_segments(
+        cls, segments: Sequence[Any], labels: Optional[List[str]] = None
+    ) -> "SegmentTable":
+        """
+        Build a table from SegmentData-like objects.
+        """
+        labels = list(labels or [])
+        for seg in segments:
+            if seg.emotion not in labels:
+                labels.append(seg.emotion)
+        code_of = {label: code for code, label in enumerate(labels)}
+        return cls(
+            starts=np.array([seg.start for seg in segments], dtype=np.float64),
+            ends=np.array([seg.end for seg in segments], dtype=np.float64),
+            volumes=np.array([seg.volume for seg in segments], dtype=np.float64),
+            emotion_codes=np.array(
+                [code_of[seg.emotion] for seg in segments],
+                dtype=np.min_scalar_type(max(len(labels) - 1, 0)),
+            ),
+            labels=labels,
+        )
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [SegmentRow(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        return SegmentRow(self, index)
+
+    def __iter__(self) -> Iterator[SegmentRow]:
+        return (SegmentRow(self, i) for i in range(len(self)))
+
+    def to_segments(self) -> List[SegmentData]:
+        """
+        Materialise the table as a list of SegmentData.
+        """
+        return [SegmentData.from_dict(row.to_dict()) for row in self]
+
+    def save(self, path: Path, global_avg_volume: float) -> None:
+        """
+        Write the table to a versioned binary .npz cache.
+        """
+        with Path(path).open("wb") as f:
+            np.savez(
+                f,
+                version=SEGMENT_CACHE_VERSION,
+                starts=self.starts,
+                ends=self.ends,
+                volumes=self.volumes,
+                emotion_codes=self.emotion_codes,
+                labels=np.array(self.labels, dtype=str),
+                global_avg_volume=global_avg_volume,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> Tuple["SegmentTable", float]:
+        """
+        Read a table written by save(). Raises ValueError on a version mismatch.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != SEGMENT_CACHE_VERSION:
+                raise ValueError(f"Unsupported segment cache version {data['version']}")
+            table = cls(
+                starts=data["starts"],
+                ends=data["ends"],
+                volumes=data["volumes"],
+                emotion_codes=data["emotion_codes"],
+                labels=[str(label) for label in data["labels"]],
+            )
+            return table, float(data["global_avg_volume"])
+
+    def to_json_data(self, global_avg_volume: float) -> Dict[str, Any]:
+        """
+        JSON-friendly representation, same layout as the legacy JSON cache.
+        """
+        return {
+            "segments": [row.to_dict() for row in self],
+            "global_avg_volume": global_avg_volume,
+        }
+
+    @classmethod
+    def from_json_data(cls, data: Dict[str, Any]) -> Tuple["SegmentTable", float]:
+        """
+        Build a table from the JSON layout (legacy cache or an export).
+        """
+        segments = [SegmentData.from_dict(item) for item in data.get("segments", [])]
+        return cls.from_segments(segments), float(data.get("global_avg_volume", 0.0))
+
+
+def export_segments_json(cache_path: Path, json_path: Optional[Path] = None) -> Path:
+    """
+    Export a binary segment cache as pretty-printed JSON for human inspection,
+    by default to '<stem>_segments_export.json'.
+    """
+    table, global_avg_volume = SegmentTable.load(cache_path)
+    cache_path = Path(cache_path)
+    json_path = json_path or cache_path.with_name(cache_path.stem + EXPORT_SUFFIX)
+    with Path(json_path).open("w", encoding="utf-8") as f:
+        json.dump(table.to_json_data(global_avg_volume), f, ensure_ascii=False, indent=2)
+    return Path(json_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python segment_table.py <segments_cache.npz>")
+        sys.exit(1)
+    _table, _avg = SegmentTable.load(Path(sys.argv[1]))
+    print(json.dumps(_table.to_json_data(_avg), ensure_ascii=False, indent=2))
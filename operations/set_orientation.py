@@ -12,6 +12,7 @@ def set_vertical(**kwargs):
     if width > height:
         new_size = (height, width)
         input_video_file_clip = input_video_file_clip.resize(new_size)
+        kwargs["video_modified"] = True
     kwargs["shape"] = input_video_file_clip.size
     kwargs["input_video_file_clip"] = input_video_file_clip
     return kwargs
@@ -26,6 +27,7 @@ def set_horizontal(**kwargs):
     if width < height:
         new_size = (height, width)
         input_video_file_clip = input_video_file_clip.resize(new_size)
+        kwargs["video_modified"] = True
     kwargs["shape"] = input_video_file_clip.size
     kwargs["input_video_file_clip"] = input_video_file_clip
     return kwargs
@@ -37,4 +37,5 @@ def add_subtitles(**kwargs):
     ]
     video_with_subs = CompositeVideoClip(video_list)
     kwargs["input_video_file_clip"] = video_with_subs
+    kwargs["video_modified"] = True
     return kwargs
@@ -0,0 +1,136 @@
+"""
+Module with a virtual timeline over the kept ranges of a video.
+
+Concatenating the subclips returned by trim_by_silence makes the shared ffmpeg
+reader seek at every subclip boundary (moviepy reopens the reader on any jump of
+more than 100 frames). KeptRangesClip maps output time to source time through a
+sorted range table and decodes the source strictly forward with its own reader,
+discarded ranges are read and thrown away instead of reopening ffmpeg.
+"""
+
+import types
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from moviepy.audio.AudioClip import AudioClip
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+from moviepy.video.io.VideoFileClip import VideoFileClip
+from moviepy.video.VideoClip import VideoClip
+
+# Code of the make_frame lambdas VideoFileClip sets to read from its reader
+READER_MAKE_FRAME_CODES = tuple(
+    const
+    for const in VideoFileClip.__init__.__code__.co_consts
+    if isinstance(const, types.CodeType) and "reader" in const.co_names
+)
+
+
+def get_reader_filename(clip) -> Optional[str]:
+    """
+    File of clip when its frames come straight from its reader: an untouched
+    VideoFileClip or a copy of one (set_audio...). None for any other clip, as
+    fl based transforms (crop, resize, fl_image) keep the reader of the source
+    but change make_frame.
+    """
+    if not isinstance(clip, VideoFileClip) or getattr(clip, "reader", None) is None:
+        return None
+    if getattr(clip.make_frame, "__code__", None) not in READER_MAKE_FRAME_CODES:
+        return None
+    return clip.filename
+
+
+class KeptRangesClip(VideoClip):
+    """
+    Clip playing the kept (start, end) ranges of source_clip back to back.
+
+    When source_clip is an untransformed VideoFileClip the frames come from a
+    dedicated forward reader, otherwise (a cropped, resized... clip) they are
+    requested from source_clip in time order.
+    """
+
+    def __init__(self, source_clip, kept_ranges: Sequence[Tuple[float, float]]):
+        ranges = np.asarray(sorted(kept_ranges), dtype=float).reshape(-1, 2)
+        self.source_clip = source_clip
+        self.range_starts = ranges[:, 0]
+        self.range_ends = ranges[:, 1]
+        lengths = self.range_ends - self.range_starts
+        # Output time at which every range starts
+        self.range_offsets = np.concatenate([[0.0], np.cumsum(lengths)[:-1]])
+        self._reader: Optional[FFMPEG_VideoReader] = None
+        self._filename = get_reader_filename(source_clip)
+
+        VideoClip.__init__(self, make_frame=self._make_frame)
+        self.duration = self.end = float(lengths.sum())
+        self.size = source_clip.size
+        self.fps = source_clip.fps
+        if source_clip.audio is not None:
+            self.audio = AudioClip(
+                make_frame=self._make_audio_frame, duration=self.duration
+            )
+            self.audio.fps = source_clip.audio.fps
+            self.audio.nchannels = source_clip.audio.nchannels
+
+    def range_index(self, t):
+        """
+        Index of the kept range containing output time t (scalar or array).
+        """
+        index = np.searchsorted(self.range_offsets, t, side="right") - 1
+        return np.clip(index, 0, len(self.range_offsets) - 1)
+
+    def source_time(self, t):
+        """
+        Map output time t (scalar or array) to source time.
+        """
+        index = self.range_index(t)
+        source_t = self.range_starts[index] + (t - self.range_offsets[index])
+        return np.minimum(source_t, self.range_ends[index])
+
+    def _read_forward(self, source_t: float) -> np.ndarray:
+        """
+        Read the source frame at source_t, skipping frames to move forward and only
+        reopening ffmpeg to go back.
+        """
+        if self._reader is None:
+            self._reader = FFMPEG_VideoReader(self._filename)
+        reader = self._reader
+        pos = int(reader.fps * source_t + 0.00001) + 1
+        if not reader.proc or pos < reader.pos:
+            reader.initialize(source_t)
+            reader.pos = pos
+            reader.lastread = reader.read_frame()
+        elif pos > reader.pos:
+            reader.skip_frames(pos - reader.pos - 1)
+            reader.lastread = reader.read_frame()
+            reader.pos = pos
+        return reader.lastread
+
+    def _make_frame(self, t):
+        source_t = float(self.source_time(t))
+        if self._filename is None:
+            return self.source_clip.get_frame(source_t)
+        return self._read_forward(source_t)
+
+    def _make_audio_frame(self, t):
+        source_audio = self.source_clip.audio
+        if np.isscalar(t):
+            return source_audio.get_frame(float(self.source_time(t)))
+        # Read each kept range separately, a chunk spanning a cut maps to source
+        # times further apart than the audio reader buffer
+        t = np.asarray(t)
+        index = self.range_index(t)
+        source_t = self.source_time(t)
+        result = np.zeros((len(t), source_audio.nchannels))
+        for value in np.unique(index):
+            selected = index == value
+            result[selected] = source_audio.get_frame(source_t[selected]).reshape(
+                -1, source_audio.nchannels
+            )
+        return result
+
+    def close(self):
+        """
+        Close the dedicated reader, the source clip is left open.
+        """
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
@@ -2,68 +2,138 @@
 This module contains functions to generate transcripts from video files.
 """
 
-from faster_whisper import WhisperModel
-from utils import get_audio, float_to_srt_time
+import os
+
+from utils import get_audio
+from .transcript_store import (
+    get_source_loudness_index,
+    hash_speech_map,
+    transcribe_segments,
+)
+from .trim import DEFAULT_HYSTERESIS, DEFAULT_MIN_SILENCE, detect_speech_ranges
+from .transcript_writer import TranscriptWriter
+from .word_store import WordTable, get_word_store_path, save_word_store
 
 
 MODEL_SIZE = "turbo"
+MIN_MODEL_SIZE = "turbo"  # stored transcripts from at least this model are reused
+
+
+def get_transcript_source(input_video_file_clip, filename):
+    """
+    Get the audio file to transcribe: the file the clip audio is read from,
+    or a WAV extracted from the clip when it has no such file.
+    """
+    source = getattr(input_video_file_clip.audio, "filename", None)
+    if source and os.path.exists(source):
+        return source
+    return get_audio(input_video_file_clip, filename)
+
+
+def get_transcribe_options(audio_file_name, kwargs):
+    """
+    Transcription options of the video_edit pipeline. vad="silence" feeds only the
+    speech map of the silence detector to Whisper, vad="whisper" enables the
+    faster-whisper VAD. draft_model enables the cascade mode, with the thresholds
+    of config.json "cascade_thresholds". The speech map is only computed when no
+    stored transcript made with the same detector parameters fits.
+    """
+    options = {
+        "workers": kwargs.get("transcribe_workers", 1),
+        "cpu_threads": kwargs.get("cpu_threads", 0),
+    }
+    if kwargs.get("draft_model"):
+        options["draft_model_size"] = kwargs["draft_model"]
+        options["cascade_thresholds"] = kwargs.get("config_data", {}).get(
+            "cascade_thresholds"
+        )
+    vad = kwargs.get("vad")
+    if vad == "whisper":
+        options["vad_filter"] = True
+    elif vad == "silence":
+        parameters = (
+            kwargs.get("clip_interval", 2),
+            kwargs.get("sound_threshold", 0.01),
+            kwargs.get("min_silence", DEFAULT_MIN_SILENCE),
+            kwargs.get("hysteresis", DEFAULT_HYSTERESIS),
+        )
+
+        def speech_ranges():
+            loudness_index = get_source_loudness_index(audio_file_name)
+            return detect_speech_ranges(
+                loudness_index, loudness_index.duration, *parameters
+            )
+
+        options["speech_ranges"] = speech_ranges
+        options["speech_map_hash"] = hash_speech_map(
+            ["detect_speech_ranges", *parameters]
+        )
+    return options
+
+
+def get_transcript_formats(kwargs):
+    """
+    Transcript files to write. The SRT is always written, the subtitles step
+    reads it.
+    """
+    return ["srt"] + list(kwargs.get("transcript_formats") or [])
 
 
 def generate_transcript(**kwargs):
     """
-    Generates a transcript from the input video file and saves it as an SRT file.
+    Generates a transcript from the input video file and saves it as an SRT file
+    (and the other transcript_formats), cue by cue as Whisper decodes.
     """
     input_video_file_clip, filename = (
         kwargs["input_video_file_clip"],
         kwargs["filename"],
     )
-    audio_file_name = get_audio(input_video_file_clip, filename)
+    audio_file_name = get_transcript_source(input_video_file_clip, filename)
     if not audio_file_name:
         return kwargs
-    model = WhisperModel(MODEL_SIZE, num_workers=4, compute_type="int8")
-    segments, _ = model.transcribe(audio_file_name, multilingual=True)
-    transcript = ""
-    for segment in segments:
-        start_time = float_to_srt_time(segment.start)
-        end_time = float_to_srt_time(segment.end)
-        text_data = segment.text.strip()
-        transcript += f"{segment.id + 1}\n{start_time} --> {end_time}\n{text_data}\n\n"
-    transcript_file_name = f"{filename}_transcript.srt"
-    with open(transcript_file_name, "w", encoding="utf-8") as file:
-        file.write(transcript)
-    kwargs["transcript_file_name"] = transcript_file_name
+    segments = transcribe_segments(
+        audio_file_name,
+        MODEL_SIZE,
+        MIN_MODEL_SIZE,
+        **get_transcribe_options(audio_file_name, kwargs),
+    )
+    base_name = f"{filename}_transcript"
+    with TranscriptWriter(base_name, get_transcript_formats(kwargs)) as writer:
+        for segment in segments:
+            writer.write_cue(segment.start, segment.end, segment.text)
+    # The words of a previous transcript_divided do not match this SRT
+    get_word_store_path(writer.paths["srt"]).unlink(missing_ok=True)
+    kwargs["transcript_file_name"] = writer.paths["srt"]
     return kwargs
 
 
 def generate_transcript_divided(**kwargs):
     """
     Generates a transcript from the input video file and saves it as an SRT file.
-    The transcript is divided into segments based on word timestamps.
+    The transcript is divided into segments based on word timestamps, the word
+    timings are also kept next to the SRT for split_str.
     """
     input_video_file_clip, filename = (
         kwargs["input_video_file_clip"],
         kwargs["filename"],
     )
-    audio_file_name = get_audio(input_video_file_clip, filename)
+    audio_file_name = get_transcript_source(input_video_file_clip, filename)
     if not audio_file_name:
         return kwargs
-    model = WhisperModel(MODEL_SIZE, num_workers=4, compute_type="int8")
-    segments, _ = model.transcribe(
-        audio_file_name, multilingual=True, word_timestamps=True
+    segments = transcribe_segments(
+        audio_file_name,
+        MODEL_SIZE,
+        MIN_MODEL_SIZE,
+        word_timestamps=True,
+        **get_transcribe_options(audio_file_name, kwargs),
     )
-    transcript = ""
-    segment_id = 1
-
-    for segment in segments:
-        for word in segment.words:
-            start_time = float_to_srt_time(word.start)
-            end_time = float_to_srt_time(word.end)
-            text_data = word.word.strip()
-            segment_id += 1
-            transcript += f"{segment_id}\n{start_time} --> {end_time}\n{text_data}\n\n"
-
-    transcript_file_name = f"{filename}_transcript.srt"
-    with open(transcript_file_name, "w", encoding="utf-8") as file:
-        file.write(transcript)
-    kwargs["transcript_file_name"] = transcript_file_name
+    collected = []
+    base_name = f"{filename}_transcript"
+    with TranscriptWriter(base_name, get_transcript_formats(kwargs)) as writer:
+        for segment in segments:
+            collected.append(segment)
+            for word in segment.words or []:
+                writer.write_cue(word.start, word.end, word.word, word.probability)
+    save_word_store(writer.paths["srt"], WordTable.from_segments(collected))
+    kwargs["transcript_file_name"] = writer.paths["srt"]
     return kwargs
@@ -0,0 +1,1028 @@
+"""
+Module with a shared store of Whisper transcripts.
+
+Every transcript of a source file (segments, timestamps, word timings and the model
+used) is kept in '<stem>_transcripts.json' next to it, so the avatar, subtitle,
+translation and title-generation paths transcribe each input at most once per model.
+Consumers state the minimum model quality they accept and reuse any stored
+transcript that is at least that good. Transcripts made with a VAD (a speech map
+from the silence detector or the faster-whisper vad_filter) skip the silent
+stretches, they are only reused by consumers asking for the same VAD and speech
+map; a full transcript satisfies any consumer.
+
+Long files can be transcribed in parallel: the audio is split at its quietest
+points into roughly equal chunks, every chunk is decoded by a worker process with
+its own cpu_threads budget and the segments are merged back with their offsets.
+
+In cascade mode a small draft model transcribes everything and only the segments
+whose confidence falls below the thresholds are decoded again with the large model.
+Cascade transcripts are stored as '<draft>><final>' (e.g. 'small>large-v3').
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from faster_whisper import WhisperModel
+from moviepy.audio.io.AudioFileClip import AudioFileClip
+from moviepy.config import get_setting
+
+from utils import LoudnessIndex, file_fingerprint, load_or_build_loudness_index
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STORE_SUFFIX = "_transcripts.json"
+STORE_VERSION = 2
+
+# Relative quality of the Whisper models, higher is better
+MODEL_QUALITY = {
+    "tiny": 0,
+    "tiny.en": 0,
+    "base": 1,
+    "base.en": 1,
+    "small": 2,
+    "small.en": 2,
+    "distil-small.en": 2,
+    "medium": 3,
+    "medium.en": 3,
+    "distil-medium.en": 3,
+    "turbo": 4,
+    "large-v3-turbo": 4,
+    "distil-large-v2": 4,
+    "distil-large-v3": 4,
+    "large-v1": 5,
+    "large-v2": 5,
+    "large": 6,
+    "large-v3": 6,
+}
+
+WHISPER_SAMPLE_RATE = 16000
+MIN_CHUNK_SECONDS = 60  # shorter chunks are not worth a worker process
+SPLIT_SEARCH_SECONDS = 30  # a split point is searched this far around the ideal cut
+SPLIT_WINDOW_SECONDS = 0.5
+SPEECH_PAD_SECONDS = 0.2  # kept around every speech range of a speech map
+READ_BLOCK_SECONDS = 30
+
+# A draft segment is decoded again with the large model when any threshold is hit
+DEFAULT_CASCADE_THRESHOLDS = {
+    "min_avg_logprob": -0.8,
+    "max_no_speech_prob": 0.6,
+    "max_compression_ratio": 2.4,
+}
+REDO_PAD_SECONDS = 0.5
+CASCADE_SEPARATOR = ">"
+
+# Whisper settings of this machine, written by the tune command
+WHISPER_PROFILE_PATH = Path(
+    os.getenv("WHISPER_PROFILE_PATH") or Path.home() / ".whisper_profile.json"
+)
+WHISPER_PROFILE_VERSION = 1
+DEFAULT_WHISPER_SETTINGS = {"compute_type": "int8", "num_workers": 4, "cpu_threads": 0}
+
+_store_lock = threading.Lock()
+
+SpeechRanges = Sequence[Tuple[float, float]]
+
+
+def model_quality(model_size: str) -> int:
+    """
+    Quality rank of a Whisper model, unknown models (e.g. local paths) rank lowest.
+    A cascade ranks as its draft model, the quality it guarantees everywhere.
+    """
+    draft_model_size = model_size.split(CASCADE_SEPARATOR)[0]
+    return MODEL_QUALITY.get(draft_model_size, -1)
+
+
+def get_machine_key() -> str:
+    """
+    Key of this machine in the Whisper profile (a profile may be shared by
+    several machines through a network home).
+    """
+    return f"{platform.node()}-{os.cpu_count()}cpu"
+
+
+def load_whisper_profile() -> Dict[str, Any]:
+    """
+    Tuned settings of this machine, by model size.
+    """
+    if not WHISPER_PROFILE_PATH.exists():
+        return {}
+    try:
+        with WHISPER_PROFILE_PATH.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error("Failed to load Whisper profile '%s': %s", WHISPER_PROFILE_PATH, e)
+        return {}
+    if data.get("version") != WHISPER_PROFILE_VERSION:
+        return {}
+    return data.get("machines", {}).get(get_machine_key(), {})
+
+
+def save_whisper_profile(model_size: str, settings: Dict[str, Any]) -> None:
+    """
+    Store the tuned settings of model_size for this machine.
+    """
+    data: Dict[str, Any] = {"version": WHISPER_PROFILE_VERSION, "machines": {}}
+    if WHISPER_PROFILE_PATH.exists():
+        with WHISPER_PROFILE_PATH.open("r", encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("version") == WHISPER_PROFILE_VERSION:
+            data = stored
+    data["machines"].setdefault(get_machine_key(), {})[model_size] = settings
+    with WHISPER_PROFILE_PATH.open("w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    logger.info(
+        "Saved '%s' Whisper settings to '%s'.", model_size, WHISPER_PROFILE_PATH
+    )
+
+
+def get_whisper_settings(model_size: str) -> Dict[str, Any]:
+    """
+    Settings of model_size on this machine: the tuned profile over the defaults.
+    """
+    settings = dict(DEFAULT_WHISPER_SETTINGS)
+    settings.update(load_whisper_profile().get(model_size, {}))
+    return settings
+
+
+def get_decode_options(model_size: str, transcribe_options: Dict[str, Any]) -> dict:
+    """
+    transcribe() options: the tuned beam_size unless the caller sets one.
+    """
+    options = {}
+    beam_size = get_whisper_settings(model_size).get("beam_size")
+    if beam_size:
+        options["beam_size"] = beam_size
+    options.update(transcribe_options)
+    return options
+
+
+@lru_cache(maxsize=None)
+def get_whisper_model(model_size: str, cpu_threads: int = 0) -> WhisperModel:
+    """
+    Load a Whisper model once per process and share it between all transcript paths.
+    compute_type, num_workers and cpu_threads come from the machine profile (see
+    the tune command), an explicit cpu_threads wins over the profile and 0 lets
+    CTranslate2 pick the thread count.
+    """
+    settings = get_whisper_settings(model_size)
+    cpu_threads = cpu_threads or settings["cpu_threads"]
+    logger.info(
+        "Loading Whisper model (size='%s', compute_type='%s', cpu_threads=%d)...",
+        model_size,
+        settings["compute_type"],
+        cpu_threads,
+    )
+    return WhisperModel(
+        model_size,
+        num_workers=settings["num_workers"],
+        compute_type=settings["compute_type"],
+        cpu_threads=cpu_threads,
+    )
+
+
+class TranscriptWord:
+    """
+    A single word with its timings.
+    """
+
+    __slots__ = ("start", "end", "word", "probability")
+
+    def __init__(self, start: float, end: float, word: str, probability: float = 0.0):
+        self.start = start
+        self.end = end
+        self.word = word
+        self.probability = probability
+
+    def to_list(self) -> list:
+        """
+        Compact list representation used in the store file.
+        """
+        return [self.start, self.end, self.word, self.probability]
+
+
+class TranscriptSegment:
+    """
+    A transcript segment, with the same attributes as a faster-whisper Segment.
+    """
+
+    __slots__ = (
+        "id",
+        "start",
+        "end",
+        "text",
+        "words",
+        "avg_logprob",
+        "no_speech_prob",
+        "compression_ratio",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        start: float,
+        end: float,
+        text: str,
+        words: Optional[List[TranscriptWord]] = None,
+        avg_logprob: float = 0.0,
+        no_speech_prob: float = 0.0,
+        compression_ratio: float = 0.0,
+    ):
+        self.id = id
+        self.start = start
+        self.end = end
+        self.text = text
+        self.words = words
+        self.avg_logprob = avg_logprob
+        self.no_speech_prob = no_speech_prob
+        self.compression_ratio = compression_ratio
+
+    @staticmethod
+    def from_whisper(segment: Any) -> "TranscriptSegment":
+        """
+        Copy a faster-whisper Segment.
+        """
+        words = None
+        if getattr(segment, "words", None):
+            words = [
+                TranscriptWord(w.start, w.end, w.word, w.probability)
+                for w in segment.words
+            ]
+        return TranscriptSegment(
+            id=segment.id,
+            start=segment.start,
+            end=segment.end,
+            text=segment.text,
+            words=words,
+            avg_logprob=segment.avg_logprob,
+            no_speech_prob=segment.no_speech_prob,
+            compression_ratio=segment.compression_ratio,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Transform the segment to Dict
+        """
+        data = {
+            "id": self.id,
+            "start": self.start,
+            "end": self.end,
+            "text": self.text,
+            "avg_logprob": self.avg_logprob,
+            "no_speech_prob": self.no_speech_prob,
+            "compression_ratio": self.compression_ratio,
+        }
+        if self.words is not None:
+            data["words"] = [word.to_list() for word in self.words]
+        return data
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "TranscriptSegment":
+        """
+        Transform dict to TranscriptSegment
+        """
+        words = None
+        if "words" in data:
+            words = [TranscriptWord(*item) for item in data["words"]]
+        return TranscriptSegment(
+            id=data["id"],
+            start=data["start"],
+            end=data["end"],
+            text=data["text"],
+            words=words,
+            avg_logprob=data.get("avg_logprob", 0.0),
+            no_speech_prob=data.get("no_speech_prob", 0.0),
+            compression_ratio=data.get("compression_ratio", 0.0),
+        )
+
+
+class Transcript:
+    """
+    A full transcript of a source file and how it was produced.
+    """
+
+    def __init__(
+        self,
+        model_size: str,
+        language: Optional[str],
+        word_timestamps: bool,
+        segments: List[TranscriptSegment],
+        vad: Optional[str] = None,
+        speech_map_hash: Optional[str] = None,
+    ):
+        self.model_size = model_size
+        self.language = language
+        self.word_timestamps = word_timestamps
+        self.segments = segments
+        # "silence" (speech map), "whisper" (vad_filter) or None for a full transcript
+        self.vad = vad
+        self.speech_map_hash = speech_map_hash
+
+    def satisfies(
+        self,
+        min_model_size: str,
+        word_timestamps: bool,
+        language: Optional[str],
+        vad: Optional[str] = None,
+        speech_map_hash: Optional[str] = None,
+    ) -> bool:
+        """
+        Whether this transcript can be reused by a consumer with these requirements.
+        A VAD transcript is only reused with the same VAD (and speech map).
+        """
+        if model_quality(self.model_size) < model_quality(min_model_size):
+            return False
+        if word_timestamps and not self.word_timestamps:
+            return False
+        if self.vad is not None and (
+            (self.vad, self.speech_map_hash) != (vad, speech_map_hash)
+        ):
+            return False
+        return language is None or language == self.language
+
+    def store_key(self) -> tuple:
+        """
+        Transcripts with the same key replace each other in the store.
+        """
+        return (
+            self.model_size,
+            self.language,
+            self.word_timestamps,
+            self.vad,
+            self.speech_map_hash,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Transform the transcript to Dict
+        """
+        return {
+            "model_size": self.model_size,
+            "language": self.language,
+            "word_timestamps": self.word_timestamps,
+            "vad": self.vad,
+            "speech_map_hash": self.speech_map_hash,
+            "segments": [segment.to_dict() for segment in self.segments],
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Transcript":
+        """
+        Transform dict to Transcript
+        """
+        return Transcript(
+            model_size=data["model_size"],
+            language=data.get("language"),
+            word_timestamps=data.get("word_timestamps", False),
+            segments=[TranscriptSegment.from_dict(item) for item in data["segments"]],
+            vad=data.get("vad"),
+            speech_map_hash=data.get("speech_map_hash"),
+        )
+
+
+def get_store_path(source_path: str) -> Path:
+    """
+    Path of the transcript store of a source file.
+    """
+    source = Path(source_path)
+    return source.with_name(source.stem + STORE_SUFFIX)
+
+
+def load_transcripts(source_path: str) -> List[Transcript]:
+    """
+    Load every stored transcript of source_path, ignoring a store made for an
+    older version of the file.
+    """
+    store_path = get_store_path(source_path)
+    if not store_path.exists():
+        return []
+    try:
+        with store_path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != STORE_VERSION or data.get("fingerprint") != list(
+            file_fingerprint(source_path)
+        ):
+            logger.info("Transcript store '%s' is outdated. Ignoring it.", store_path)
+            return []
+        return [Transcript.from_dict(item) for item in data.get("transcripts", [])]
+    except (OSError, ValueError, KeyError) as e:
+        logger.error("Failed to load transcript store '%s': %s", store_path, e)
+        return []
+
+
+def save_transcript(source_path: str, transcript: Transcript) -> None:
+    """
+    Add (or replace) the transcript made with the same model and options.
+    """
+    with _store_lock:
+        transcripts = [
+            item
+            for item in load_transcripts(source_path)
+            if item.store_key() != transcript.store_key()
+        ]
+        transcripts.append(transcript)
+        store_path = get_store_path(source_path)
+        data = {
+            "version": STORE_VERSION,
+            "fingerprint": list(file_fingerprint(source_path)),
+            "transcripts": [item.to_dict() for item in transcripts],
+        }
+        with store_path.open("w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+    logger.info(
+        "Saved '%s' transcript of '%s' to '%s'.",
+        transcript.model_size,
+        source_path,
+        store_path,
+    )
+
+
+def find_transcript(
+    source_path: str,
+    min_model_size: str,
+    word_timestamps: bool = False,
+    language: Optional[str] = None,
+    vad: Optional[str] = None,
+    speech_map_hash: Optional[str] = None,
+) -> Optional[Transcript]:
+    """
+    Return the best stored transcript that satisfies the consumer, if any. Full
+    transcripts win over VAD ones of the same quality.
+    """
+    candidates = [
+        item
+        for item in load_transcripts(source_path)
+        if item.satisfies(
+            min_model_size, word_timestamps, language, vad, speech_map_hash
+        )
+    ]
+    if not candidates:
+        return None
+    return max(
+        candidates,
+        key=lambda item: (model_quality(item.model_size), item.vad is None),
+    )
+
+
+def hash_speech_map(value: Any) -> str:
+    """
+    Key of a speech map: sha256 of the JSON of the ranges, or of the detector
+    parameters producing them for the stored source.
+    """
+    data = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_vad_mode(
+    speech_ranges: Optional[Any], transcribe_options: Dict[str, Any]
+) -> Optional[str]:
+    """
+    VAD a transcription runs with: "silence", "whisper" or None.
+    """
+    if speech_ranges is not None:
+        return "silence"
+    if transcribe_options.get("vad_filter"):
+        return "whisper"
+    return None
+
+
+def find_split_points(
+    loudness_index: LoudnessIndex, duration: float, chunks: int
+) -> List[float]:
+    """
+    Cut [0, duration] into `chunks` roughly equal parts, moving every cut to the
+    quietest window within SPLIT_SEARCH_SECONDS of the ideal position.
+    """
+    points = []
+    for k in range(1, chunks):
+        ideal = duration * k / chunks
+        starts = np.arange(
+            max(0.0, ideal - SPLIT_SEARCH_SECONDS),
+            min(duration, ideal + SPLIT_SEARCH_SECONDS) - SPLIT_WINDOW_SECONDS,
+            SPLIT_WINDOW_SECONDS / 2,
+        )
+        if not len(starts):
+            points.append(ideal)
+            continue
+        volumes = loudness_index.rms_many(starts, starts + SPLIT_WINDOW_SECONDS)
+        points.append(float(starts[np.argmin(volumes)] + SPLIT_WINDOW_SECONDS / 2))
+    return points
+
+
+def read_audio_range(source_path: str, start: float, end: float) -> np.ndarray:
+    """
+    Decode [start, end] of source_path as 16 kHz mono float32, Whisper's input.
+    """
+    command = get_decode_command(source_path, start, end)
+    result = subprocess.run(command, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def get_decode_command(source_path: str, start: float, end: float) -> List[str]:
+    """
+    ffmpeg command writing [start, end] of source_path as 16 kHz mono float32.
+    """
+    return [
+        get_setting("FFMPEG_BINARY"),
+        "-loglevel",
+        "error",
+        "-ss",
+        f"{start:.3f}",
+        "-t",
+        f"{end - start:.3f}",
+        "-i",
+        str(source_path),
+        "-f",
+        "f32le",
+        "-ac",
+        "1",
+        "-ar",
+        str(WHISPER_SAMPLE_RATE),
+        "-",
+    ]
+
+
+class TimeMap:
+    """
+    Maps times of an audio made of source ranges played back to back to source
+    times.
+    """
+
+    def __init__(self, ranges: Sequence[Tuple[float, float]]):
+        ranges = np.asarray(ranges, dtype=float).reshape(-1, 2)
+        self.starts = ranges[:, 0]
+        self.ends = ranges[:, 1]
+        lengths = self.ends - self.starts
+        self.offsets = np.concatenate([[0.0], np.cumsum(lengths)[:-1]])
+
+    def to_source(self, t: float, at_end: bool = False) -> float:
+        """
+        Source time of t. With at_end a time on a join belongs to the range before.
+        """
+        index = np.searchsorted(self.offsets, t, side="left" if at_end else "right")
+        index = int(np.clip(index - 1, 0, len(self.offsets) - 1))
+        return float(min(self.starts[index] + t - self.offsets[index], self.ends[index]))
+
+
+def pad_speech_ranges(
+    speech_ranges: Sequence[Tuple[float, float]],
+    start: float = 0.0,
+    end: float = float("inf"),
+    pad: float = SPEECH_PAD_SECONDS,
+) -> List[Tuple[float, float]]:
+    """
+    Widen the speech ranges by pad, merge the overlapping ones and clip them to
+    [start, end].
+    """
+    padded: List[Tuple[float, float]] = []
+    for range_start, range_end in sorted(speech_ranges):
+        range_start = max(start, range_start - pad)
+        range_end = min(end, range_end + pad)
+        if range_end <= range_start:
+            continue
+        if padded and range_start <= padded[-1][1]:
+            padded[-1] = (padded[-1][0], max(padded[-1][1], range_end))
+        else:
+            padded.append((range_start, range_end))
+    return padded
+
+
+def read_speech_audio(
+    source_path: str, speech_ranges: Sequence[Tuple[float, float]]
+) -> Tuple[np.ndarray, TimeMap]:
+    """
+    Decode only the speech ranges of source_path, back to back, as Whisper input.
+    The file is decoded in one forward pass and silent samples are dropped block
+    by block, so memory holds the speech only.
+    """
+    ranges = np.asarray(speech_ranges, dtype=float).reshape(-1, 2)
+    if not len(ranges):
+        return np.zeros(0, dtype=np.float32), TimeMap(ranges)
+    first, last = float(ranges[0, 0]), float(ranges[-1, 1])
+    block_bytes = READ_BLOCK_SECONDS * WHISPER_SAMPLE_RATE * 4
+    kept: List[np.ndarray] = []
+    position = 0
+    with subprocess.Popen(
+        get_decode_command(source_path, first, last), stdout=subprocess.PIPE
+    ) as process:
+        while True:
+            block = process.stdout.read(block_bytes)
+            if not block:
+                break
+            samples = np.frombuffer(block[: len(block) // 4 * 4], dtype=np.float32)
+            times = first + (position + np.arange(len(samples))) / WHISPER_SAMPLE_RATE
+            index = np.searchsorted(ranges[:, 0], times, side="right") - 1
+            inside = (index >= 0) & (times < ranges[np.maximum(index, 0), 1])
+            kept.append(samples[inside])
+            position += len(samples)
+    return np.concatenate(kept) if kept else np.zeros(0, np.float32), TimeMap(ranges)
+
+
+def remap_segment(segment: TranscriptSegment, time_map: TimeMap) -> TranscriptSegment:
+    """
+    Move the timestamps of a segment (and its words) to the source timeline.
+    """
+    segment.start = time_map.to_source(segment.start)
+    segment.end = time_map.to_source(segment.end, at_end=True)
+    for word in segment.words or []:
+        word.start = time_map.to_source(word.start)
+        word.end = time_map.to_source(word.end, at_end=True)
+    return segment
+
+
+def _transcribe_range(
+    source_path: str,
+    start: float,
+    end: float,
+    model_size: str,
+    cpu_threads: int,
+    word_timestamps: bool,
+    language: Optional[str],
+    transcribe_options: Dict[str, Any],
+    speech_ranges: Optional[Sequence[Tuple[float, float]]] = None,
+) -> Tuple[List[TranscriptSegment], Optional[str]]:
+    """
+    Worker process: transcribe [start, end] of source_path (only its speech
+    ranges when given), with source timestamps.
+    """
+    if speech_ranges is None:
+        audio = read_audio_range(source_path, start, end)
+        time_map = TimeMap([(start, end)])
+    else:
+        audio, time_map = read_speech_audio(
+            source_path, pad_speech_ranges(speech_ranges, start, end, pad=0.0)
+        )
+    if not len(audio):
+        return [], language
+    model = get_whisper_model(model_size, cpu_threads)
+    segments, info = model.transcribe(
+        audio,
+        language=language,
+        word_timestamps=word_timestamps,
+        multilingual=True,
+        **get_decode_options(model_size, transcribe_options),
+    )
+    collected = [
+        remap_segment(TranscriptSegment.from_whisper(segment), time_map)
+        for segment in segments
+    ]
+    return collected, info.language
+
+
+def get_source_loudness_index(source_path: str) -> LoudnessIndex:
+    """
+    Loudness index of source_path, cached next to it.
+    """
+
+    def build_index() -> LoudnessIndex:
+        audio_clip = AudioFileClip(str(source_path))
+        try:
+            return LoudnessIndex.from_audio_clip(audio_clip)
+        finally:
+            audio_clip.close()
+
+    return load_or_build_loudness_index(str(source_path), build_index)
+
+
+def transcribe_in_chunks(
+    source_path: str,
+    model_size: str,
+    workers: int,
+    cpu_threads: int = 0,
+    word_timestamps: bool = False,
+    language: Optional[str] = None,
+    speech_ranges: Optional[SpeechRanges] = None,
+    speech_map_hash: Optional[str] = None,
+    **transcribe_options,
+) -> Iterator[TranscriptSegment]:
+    """
+    Transcribe source_path split at silences into chunks decoded concurrently by
+    `workers` processes, each with cpu_threads threads (default: the cores split
+    between the workers). Segments are yielded in order with source timestamps
+    and consecutive ids, then stored. With speech_ranges only those ranges are
+    decoded.
+    """
+    cpu_threads = cpu_threads or max(1, (os.cpu_count() or 1) // workers)
+    loudness_index = get_source_loudness_index(source_path)
+    duration = loudness_index.duration
+    chunks = max(1, min(workers, int(duration // MIN_CHUNK_SECONDS)))
+    bounds = [0.0] + find_split_points(loudness_index, duration, chunks) + [duration]
+    logger.info(
+        "Transcribing '%s' in %d chunks with %d workers (cpu_threads=%d)...",
+        source_path,
+        chunks,
+        workers,
+        cpu_threads,
+    )
+    collected: List[TranscriptSegment] = []
+    detected_language = language
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, chunks), mp_context=ctx) as pool:
+        futures = [
+            pool.submit(
+                _transcribe_range,
+                str(source_path),
+                start,
+                end,
+                model_size,
+                cpu_threads,
+                word_timestamps,
+                language,
+                transcribe_options,
+                speech_ranges,
+            )
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+        for future in futures:
+            segments, chunk_language = future.result()
+            detected_language = detected_language or chunk_language
+            for segment in segments:
+                segment.id = len(collected)
+                collected.append(segment)
+                yield segment
+    save_transcript(
+        source_path,
+        Transcript(
+            model_size,
+            detected_language,
+            word_timestamps,
+            collected,
+            get_vad_mode(speech_ranges, transcribe_options),
+            speech_map_hash,
+        ),
+    )
+
+
+def is_low_confidence(
+    segment: TranscriptSegment, thresholds: Dict[str, float]
+) -> bool:
+    """
+    Whether a draft segment should be decoded again with the large model.
+    """
+    return (
+        segment.avg_logprob < thresholds["min_avg_logprob"]
+        or segment.no_speech_prob > thresholds["max_no_speech_prob"]
+        or segment.compression_ratio > thresholds["max_compression_ratio"]
+    )
+
+
+def get_redo_ranges(
+    segments: List[TranscriptSegment], flagged: List[bool]
+) -> List[Tuple[float, float, int, int]]:
+    """
+    Group consecutive flagged segments into (start, end, first, last) ranges to
+    decode again. Ranges are padded, without reaching into the kept neighbours.
+    """
+    groups: List[List[int]] = []
+    for i, is_flagged in enumerate(flagged):
+        if not is_flagged:
+            continue
+        if groups and groups[-1][1] == i - 1:
+            groups[-1][1] = i
+        else:
+            groups.append([i, i])
+    ranges = []
+    for first, last in groups:
+        lower = segments[first - 1].end if first > 0 else 0.0
+        upper = segments[last + 1].start if last + 1 < len(segments) else float("inf")
+        start = max(lower, segments[first].start - REDO_PAD_SECONDS)
+        end = min(upper, segments[last].end + REDO_PAD_SECONDS)
+        ranges.append((start, max(end, segments[last].end), first, last))
+    return ranges
+
+
+def transcribe_cascade(
+    source_path: str,
+    draft_model_size: str,
+    model_size: str,
+    thresholds: Optional[Dict[str, float]] = None,
+    word_timestamps: bool = False,
+    language: Optional[str] = None,
+    workers: int = 1,
+    cpu_threads: int = 0,
+    speech_ranges: Optional[SpeechRanges] = None,
+    speech_map_hash: Optional[str] = None,
+    **transcribe_options,
+) -> Iterator[TranscriptSegment]:
+    """
+    Transcribe source_path with draft_model_size, then decode again with
+    model_size only the low-confidence segments and splice the results in.
+    """
+    cascade_name = f"{draft_model_size}{CASCADE_SEPARATOR}{model_size}"
+    thresholds = {**DEFAULT_CASCADE_THRESHOLDS, **(thresholds or {})}
+    vad = get_vad_mode(speech_ranges, transcribe_options)
+    stored = find_transcript(
+        source_path, model_size, word_timestamps, language, vad, speech_map_hash
+    )
+    if stored is None:
+        stored = next(
+            (
+                item
+                for item in load_transcripts(source_path)
+                if item.model_size == cascade_name
+                and item.satisfies(
+                    cascade_name, word_timestamps, language, vad, speech_map_hash
+                )
+            ),
+            None,
+        )
+    if stored:
+        logger.info("Reusing '%s' transcript of '%s'.", stored.model_size, source_path)
+        yield from stored.segments
+        return
+
+    draft = list(
+        transcribe_segments(
+            source_path,
+            draft_model_size,
+            word_timestamps=word_timestamps,
+            language=language,
+            workers=workers,
+            cpu_threads=cpu_threads,
+            speech_ranges=speech_ranges,
+            speech_map_hash=speech_map_hash,
+            **transcribe_options,
+        )
+    )
+    draft_transcript = find_transcript(
+        source_path, draft_model_size, word_timestamps, language, vad, speech_map_hash
+    )
+    language = language or (draft_transcript.language if draft_transcript else None)
+    flagged = [is_low_confidence(segment, thresholds) for segment in draft]
+    redo_ranges = get_redo_ranges(draft, flagged)
+    logger.info(
+        "Cascade: %d of %d draft segments of '%s' decoded again with '%s'.",
+        sum(flagged),
+        len(draft),
+        source_path,
+        model_size,
+    )
+
+    model = get_whisper_model(model_size, cpu_threads) if redo_ranges else None
+    collected: List[TranscriptSegment] = []
+    cursor = 0
+    for start, end, first, last in redo_ranges:
+        for segment in draft[cursor:first]:
+            segment.id = len(collected)
+            collected.append(segment)
+            yield segment
+        segments, _ = model.transcribe(
+            read_audio_range(source_path, start, end),
+            language=language,
+            word_timestamps=word_timestamps,
+            **get_decode_options(model_size, transcribe_options),
+        )
+        time_map = TimeMap([(start, end)])
+        for segment in segments:
+            redone = remap_segment(TranscriptSegment.from_whisper(segment), time_map)
+            redone.id = len(collected)
+            collected.append(redone)
+            yield redone
+        cursor = last + 1
+    for segment in draft[cursor:]:
+        segment.id = len(collected)
+        collected.append(segment)
+        yield segment
+    save_transcript(
+        source_path,
+        Transcript(
+            cascade_name, language, word_timestamps, collected, vad, speech_map_hash
+        ),
+    )
+
+
+def transcribe_segments(
+    source_path: str,
+    model_size: str,
+    min_model_size: Optional[str] = None,
+    word_timestamps: bool = False,
+    language: Optional[str] = None,
+    workers: int = 1,
+    cpu_threads: int = 0,
+    speech_ranges: Union[SpeechRanges, Callable[[], SpeechRanges], None] = None,
+    speech_map_hash: Optional[str] = None,
+    draft_model_size: Optional[str] = None,
+    cascade_thresholds: Optional[Dict[str, float]] = None,
+    **transcribe_options,
+) -> Iterator[TranscriptSegment]:
+    """
+    Yield the transcript segments of source_path.
+
+    A stored transcript of at least min_model_size quality (default: model_size)
+    is reused. Otherwise the file is transcribed with model_size, segments are
+    yielded as Whisper decodes them and the result is stored once complete.
+    With workers > 1 long files are transcribed in parallel chunks, see
+    transcribe_in_chunks. With speech_ranges (a speech map, e.g. from the
+    silence detector) only those ranges are fed to Whisper and the timestamps
+    are mapped back to the source timeline. speech_ranges may be a function,
+    called only when no stored transcript fits; speech_map_hash then identifies
+    the map (e.g. a hash of the detector parameters). With draft_model_size the
+    file is transcribed in cascade mode, see transcribe_cascade.
+    """
+    if callable(speech_ranges) and speech_map_hash is None:
+        speech_ranges = speech_ranges()
+    if speech_ranges is not None and speech_map_hash is None:
+        speech_map_hash = hash_speech_map([list(item) for item in speech_ranges])
+    vad = get_vad_mode(speech_ranges, transcribe_options)
+    stored = find_transcript(
+        source_path,
+        min_model_size or model_size,
+        word_timestamps,
+        language,
+        vad,
+        speech_map_hash,
+    )
+    if stored:
+        logger.info(
+            "Reusing '%s' transcript of '%s' (needs at least '%s').",
+            stored.model_size,
+            source_path,
+            min_model_size or model_size,
+        )
+        yield from stored.segments
+        return
+
+    if callable(speech_ranges):
+        speech_ranges = speech_ranges()
+    if draft_model_size and draft_model_size != model_size:
+        yield from transcribe_cascade(
+            source_path,
+            draft_model_size,
+            model_size,
+            cascade_thresholds,
+            word_timestamps,
+            language,
+            workers,
+            cpu_threads,
+            speech_ranges,
+            speech_map_hash,
+            **transcribe_options,
+        )
+        return
+
+    if speech_ranges is not None:
+        speech_ranges = pad_speech_ranges(speech_ranges)
+    if workers > 1:
+        yield from transcribe_in_chunks(
+            source_path,
+            model_size,
+            workers,
+            cpu_threads,
+            word_timestamps,
+            language,
+            speech_ranges,
+            speech_map_hash,
+            **transcribe_options,
+        )
+        return
+
+    if speech_ranges is not None and not speech_ranges:
+        logger.info("No speech found in '%s'.", source_path)
+        return
+
+    audio: Any = str(source_path)
+    time_map = None
+    if speech_ranges is not None:
+        audio, time_map = read_speech_audio(source_path, speech_ranges)
+        logger.info(
+            "Transcribing %.1f s of speech out of '%s'.",
+            len(audio) / WHISPER_SAMPLE_RATE,
+            source_path,
+        )
+    model = get_whisper_model(model_size, cpu_threads)
+    segments, info = model.transcribe(
+        audio,
+        language=language,
+        word_timestamps=word_timestamps,
+        multilingual=True,
+        **get_decode_options(model_size, transcribe_options),
+    )
+    collected: List[TranscriptSegment] = []
+    for segment in segments:
+        stored_segment = TranscriptSegment.from_whisper(segment)
+        if time_map is not None:
+            stored_segment = remap_segment(stored_segment, time_map)
+        collected.append(stored_segment)
+        yield stored_segment
+    save_transcript(
+        source_path,
+        Transcript(
+            model_size,
+            language or info.language,
+            word_timestamps,
+            collected,
+            vad,
+            speech_map_hash,
+        ),
+    )
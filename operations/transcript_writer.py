@@ -0,0 +1,103 @@
+"""
+Module with a streaming transcript writer.
+
+Cues are appended to every output file (SRT, WebVTT, JSON lines) as Whisper yields
+the segments, so a long transcription can be followed with `tail -f` and no
+transcript string is built in memory. The files are flushed every FLUSH_SECONDS
+and when the writer is closed.
+"""
+
+import json
+import logging
+import time
+from typing import Dict, Iterable, Optional, TextIO
+
+from .word_store import VTT_HEADER, format_srt_cue, format_vtt_cue
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_FORMATS = ("srt", "vtt", "jsonl")
+FLUSH_SECONDS = 2.0
+
+
+class TranscriptWriter:
+    """
+    Write transcript cues to '<base_name>.<format>' for each format, in one pass.
+    Use as a context manager.
+    """
+
+    def __init__(
+        self,
+        base_name: str,
+        formats: Iterable[str] = ("srt",),
+        flush_seconds: float = FLUSH_SECONDS,
+    ):
+        self.paths = {
+            output_format: f"{base_name}.{output_format}"
+            for output_format in dict.fromkeys(formats)
+        }
+        unknown = set(self.paths) - set(TRANSCRIPT_FORMATS)
+        if unknown:
+            raise ValueError(f"Unsupported transcript formats: {sorted(unknown)}")
+        self.flush_seconds = flush_seconds
+        self.count = 0
+        self._files: Dict[str, TextIO] = {}
+        self._last_flush = 0.0
+
+    def __enter__(self) -> "TranscriptWriter":
+        for output_format, path in self.paths.items():
+            self._files[output_format] = open(path, "w", encoding="utf-8")
+        if "vtt" in self._files:
+            self._files["vtt"].write(VTT_HEADER)
+        self._last_flush = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write_cue(
+        self,
+        start: float,
+        end: float,
+        text: str,
+        probability: Optional[float] = None,
+    ) -> None:
+        """
+        Append one cue to every output, flushing if FLUSH_SECONDS have passed.
+        """
+        self.count += 1
+        text = text.strip()
+        for output_format, file in self._files.items():
+            if output_format == "srt":
+                file.write(format_srt_cue(self.count, start, end, text))
+            elif output_format == "vtt":
+                file.write(format_vtt_cue(start, end, text))
+            else:
+                cue = {"id": self.count, "start": start, "end": end, "text": text}
+                if probability is not None:
+                    cue["probability"] = probability
+                file.write(json.dumps(cue, ensure_ascii=False) + "\n")
+        if time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Flush the cues written so far to disk.
+        """
+        for file in self._files.values():
+            file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        """
+        Flush and close every output.
+        """
+        for file in self._files.values():
+            file.close()
+        self._files = {}
+        logger.info(
+            "Transcript with %d cues saved to: %s",
+            self.count,
+            ", ".join(self.paths.values()),
+        )
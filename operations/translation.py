@@ -5,21 +5,22 @@ Module for video translation and audio generation.
 import os
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from faster_whisper import WhisperModel
-from kokoro import KPipeline
-from transformers import pipeline
+from typing import Dict, List, Optional
 import soundfile as sf
 from moviepy.editor import AudioFileClip, CompositeAudioClip, VideoFileClip
 from pydub import AudioSegment
 
-from utils import get_audio
+from .transcript_store import transcribe_segments
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 MODEL_SIZE = "turbo"
+MIN_MODEL_SIZE = "turbo"  # stored transcripts from at least this model are reused
 MAX_PAUSE = 1.0
+TRANSLATION_BATCH_SIZE = 16  # phrases per translation pipeline call
 
 
 def process_transcript(segments):
@@ -98,57 +99,109 @@ def process_transcript(segments):
     return audio_info
 
 
-def video_translation(
-    video_path: str,
-    translate_data: str = "Helsinki-NLP/opus-mt-es-en",
-    language: str = "en",
-):
+def get_audio_info_path(video_path: str, target: Optional[str] = None) -> str:
     """
-    Transcribe and translate the audio from a video file.
+    Audio-info file of a video, one per target language in multi-target mode.
     """
-    translator = None
-    if translate_data:
-        translator = pipeline("translation", translate_data)
-
     video_stem = Path(video_path).stem
-    input_video_file_clip = VideoFileClip(video_path)
-    audio_path = get_audio(input_video_file_clip, video_stem)
-    if not audio_path:
-        return
+    if target:
+        return f"{video_stem}_{target}_audio_info.json"
+    return f"{video_stem}_audio_info.json"
+
+
+def transcribe_phrases(video_path: str, language: str):
+    """
+    Transcribe the video and group its words into phrases, None if it has no audio.
+    """
+    with VideoFileClip(video_path) as input_video_file_clip:
+        if input_video_file_clip.audio is None:
+            return None
+
+    results = transcribe_segments(
+        video_path,
+        MODEL_SIZE,
+        MIN_MODEL_SIZE,
+        word_timestamps=True,
+        language=language,
+        temperature=0.2,
+    )
+    return process_transcript(results)
 
-    whisper_model = WhisperModel(MODEL_SIZE, num_workers=4, compute_type="int8")
-    transcribe_params = {
-        "audio": audio_path,
-        "language": language,
-        "multilingual": True,
-        "temperature": 0.2,
-        "word_timestamps": True,
-    }
-    results, _ = whisper_model.transcribe(**transcribe_params)
-    audio_info = process_transcript(results)
-
-    if translator:
-        for segment in audio_info:
-            segment["text"] = translator(segment["original_text"])[0][
-                "translation_text"
-            ]
-            logger.info(
-                "Translating: %s | %s",
-                segment["original_text"].strip(),
-                segment["text"].strip(),
-            )
 
+def translate_phrases(audio_info: List[dict], translate_data: str) -> List[dict]:
+    """
+    Return a copy of audio_info with the phrases translated by translate_data
+    (or copied as is when no model is given).
+    """
+    texts = [segment["original_text"] for segment in audio_info]
+    if translate_data:
+        from transformers import pipeline
+
+        translator = pipeline("translation", translate_data)
+        translations = [
+            item["translation_text"]
+            for item in translator(texts, batch_size=TRANSLATION_BATCH_SIZE)
+        ]
     else:
-        for segment in audio_info:
-            segment["text"] = segment["original_text"]
+        translations = texts
+    translated = []
+    for segment, text in zip(audio_info, translations):
+        logger.info("Translating: %s | %s", segment["original_text"].strip(), text)
+        translated.append(dict(segment, text=text))
+    return translated
 
-    json_file = f"{video_stem}_audio_info.json"
 
+def save_audio_info(audio_info: List[dict], json_file: str) -> None:
+    """
+    Write an audio-info file for audio_generator.
+    """
     with open(json_file, "w", encoding="utf-8") as f:
         json.dump(audio_info, f, ensure_ascii=False, indent=4)
     logger.info("Audio info saved in: %s. Check it before generating audio.", json_file)
 
 
+def video_translation(
+    video_path: str,
+    translate_data: str = "Helsinki-NLP/opus-mt-es-en",
+    language: str = "en",
+):
+    """
+    Transcribe and translate the audio from a video file.
+    """
+    audio_info = transcribe_phrases(video_path, language)
+    if audio_info is None:
+        return
+    save_audio_info(
+        translate_phrases(audio_info, translate_data), get_audio_info_path(video_path)
+    )
+
+
+def video_translation_multi(
+    video_path: str,
+    targets: Dict[str, str],
+    language: str = "en",
+    max_workers: Optional[int] = None,
+) -> Dict[str, str]:
+    """
+    Transcribe and group the phrases once, then translate them to every target
+    concurrently. targets maps a language code to its translation model, each one
+    gets its own '<stem>_<code>_audio_info.json'. Returns the files by code.
+    """
+    audio_info = transcribe_phrases(video_path, language)
+    if audio_info is None:
+        return {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(targets)) as executor:
+        futures = {
+            target: executor.submit(translate_phrases, audio_info, translate_data)
+            for target, translate_data in targets.items()
+        }
+        json_files = {}
+        for target, future in futures.items():
+            json_files[target] = get_audio_info_path(video_path, target)
+            save_audio_info(future.result(), json_files[target])
+    return json_files
+
+
 def change_audio_speed(audio_file: str, speed: float) -> str:
     """
     Change the speed of an audio file and save it as a new file.
@@ -167,16 +220,23 @@ def change_audio_speed(audio_file: str, speed: float) -> str:
     return output_file
 
 
-def audio_generator(video_path: str, voice_info: str = "en-us/af_heart"):
+def audio_generator(
+    video_path: str, voice_info: str = "en-us/af_heart", target: Optional[str] = None
+):
     """
-    Generate audio for a video using the specified voice.
+    Generate audio for a video using the specified voice. target selects the
+    audio-info file of a multi-target translation.
     """
+    from kokoro import KPipeline
+
     lang_code = voice_info.split("/")[0]
     voice = voice_info.split("/")[1]
     vpipeline = KPipeline(lang_code=lang_code)
 
     video_stem = Path(video_path).stem
-    json_file = f"{video_stem}_audio_info.json"
+    json_file = get_audio_info_path(video_path, target)
+    if target:
+        video_stem = f"{video_stem}_{target}"
     with open(json_file, "r", encoding="utf-8") as openfile:
         audio_clips = json.load(openfile)
     for segment in audio_clips:
@@ -3,46 +3,232 @@ Module to trim a video by silence.
 """
 
 import logging
+from typing import List, Tuple
+
 import numpy as np
 
-from utils import get_subclip_volume
+from utils import LoudnessIndex, load_or_build_loudness_index
+
+from .timeline import KeptRangesClip
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FINE_WINDOW = 0.01  # RMS window of the fine boundary search, in seconds
+DEFAULT_MIN_SILENCE = 0.3
+DEFAULT_HYSTERESIS = 0.7  # speech ends below sound_threshold * hysteresis
 
-def trim_by_silence(**kwargs):
+
+def get_clip_loudness_index(input_video_file_clip) -> LoudnessIndex:
     """
-    Function to trim a video by silence.
+    Get the loudness index of the clip audio. The index is cached next to the
+    audio source file (the video itself, or the denoised track if it was replaced).
     """
-    input_video_file_clip = kwargs["input_video_file_clip"]
-    clip_interval = kwargs["clip_interval"]
-    sound_threshold = kwargs["sound_threshold"]
-    discard_silence = kwargs["discard_silence"]
-    logger.info("Chunking video...")
-    volumes = []
-    for i in np.arange(0, input_video_file_clip.duration, clip_interval):
-        if input_video_file_clip.duration <= i + clip_interval:
-            continue
-        logger.info("Processing chunk %s/%s", i, input_video_file_clip.duration)
+    audio = input_video_file_clip.audio
+    source_path = getattr(audio, "filename", None)
+    return load_or_build_loudness_index(
+        source_path, lambda: LoudnessIndex.from_audio_clip(audio)
+    )
+
 
-        volumes.append(get_subclip_volume(input_video_file_clip, i, clip_interval))
+def compute_kept_ranges(
+    loudness_index: LoudnessIndex,
+    duration: float,
+    clip_interval: float,
+    sound_threshold: float,
+    discard_silence: bool,
+) -> List[Tuple[float, float]]:
+    """
+    Split [0, duration] into alternating loud/silent ranges of clip_interval
+    windows, dropping the silent ones when discard_silence is set.
+    """
+    starts = np.arange(0, duration, clip_interval)
+    starts = starts[starts + clip_interval < duration]
+    volumes = loudness_index.rms_many(starts, starts + clip_interval)
     logger.info("Processing silences...")
-    volumes = np.array(volumes)
     volumes_binary = volumes > sound_threshold
     change_times = [0]
     for i in range(1, len(volumes_binary)):
         if volumes_binary[i] != volumes_binary[i - 1]:
             change_times.append(i * clip_interval)
-    change_times.append(input_video_file_clip.duration)
-    logger.info("Subclipping...")
-    first_piece_silence = 1 if volumes_binary[0] else 0
-    clips = []
+    change_times.append(duration)
+    first_piece_silence = 1 if len(volumes_binary) and volumes_binary[0] else 0
+    kept_ranges = []
     for i in range(1, len(change_times)):
         if discard_silence and i % 2 != first_piece_silence:
             continue
-        new_clip = input_video_file_clip.subclip(change_times[i - 1], change_times[i])
-        clips.append(new_clip)
+        kept_ranges.append((change_times[i - 1], change_times[i]))
+    return kept_ranges
+
+
+def classify_with_hysteresis(
+    volumes: np.ndarray, high_threshold: float, low_threshold: float
+) -> np.ndarray:
+    """
+    Speech starts above high_threshold and only ends below low_threshold.
+    """
+    speech = np.zeros(len(volumes), dtype=bool)
+    active = False
+    for i, volume in enumerate(volumes):
+        active = volume > (low_threshold if active else high_threshold)
+        speech[i] = active
+    return speech
+
+
+def refine_boundary(
+    loudness_index: LoudnessIndex,
+    boundary: float,
+    search_radius: float,
+    threshold: float,
+    onset: bool,
+    duration: float,
+) -> float:
+    """
+    Place a coarse speech boundary at millisecond resolution. Onsets move to the
+    first fine window above threshold, offsets to the end of the last one.
+    """
+    step = 1.0 / loudness_index.rate
+    starts = np.arange(
+        max(0.0, boundary - search_radius),
+        min(duration, boundary + search_radius),
+        step,
+    )
+    if not len(starts):
+        return boundary
+    volumes = loudness_index.rms_many(starts, starts + FINE_WINDOW)
+    loud = np.flatnonzero(volumes > threshold)
+    if not len(loud):
+        return boundary
+    if onset:
+        return float(starts[loud[0]])
+    return float(min(starts[loud[-1]] + FINE_WINDOW, duration))
+
+
+def detect_speech_ranges(
+    loudness_index: LoudnessIndex,
+    duration: float,
+    coarse_interval: float,
+    sound_threshold: float,
+    min_silence: float = DEFAULT_MIN_SILENCE,
+    hysteresis: float = DEFAULT_HYSTERESIS,
+) -> List[Tuple[float, float]]:
+    """
+    Two-stage speech detection: a coarse pass over coarse_interval windows with
+    hysteresis, then a fine pass around every transition to place it exactly.
+    Silences shorter than min_silence are merged into the surrounding speech.
+    The coarse windows are at most min_silence / 2 long, so every silence worth
+    cutting fully covers at least one of them.
+    """
+    if min_silence > 0:
+        coarse_interval = min(coarse_interval, min_silence / 2)
+    low_threshold = sound_threshold * hysteresis
+    starts = np.arange(0, duration, coarse_interval)
+    ends = np.minimum(starts + coarse_interval, duration)
+    volumes = loudness_index.rms_many(starts, ends)
+    speech = classify_with_hysteresis(volumes, sound_threshold, low_threshold)
+
+    ranges: List[Tuple[float, float]] = []
+    onset = None
+    for i, active in enumerate(speech):
+        if active == (onset is not None):
+            continue
+        boundary = refine_boundary(
+            loudness_index, starts[i], coarse_interval, low_threshold, active, duration
+        )
+        if active:
+            onset = 0.0 if i == 0 else boundary
+        else:
+            ranges.append((onset, max(boundary, onset)))
+            onset = None
+    if onset is not None:
+        ranges.append((onset, duration))
+
+    merged: List[Tuple[float, float]] = []
+    for start, end in ranges:
+        if merged and start - merged[-1][1] < min_silence:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def compute_refined_kept_ranges(
+    loudness_index: LoudnessIndex,
+    duration: float,
+    coarse_interval: float,
+    sound_threshold: float,
+    discard_silence: bool,
+    min_silence: float = DEFAULT_MIN_SILENCE,
+    hysteresis: float = DEFAULT_HYSTERESIS,
+) -> List[Tuple[float, float]]:
+    """
+    Same output as compute_kept_ranges (alternating speech/silence pieces, or only
+    speech with discard_silence) with boundaries from detect_speech_ranges.
+    """
+    speech_ranges = detect_speech_ranges(
+        loudness_index,
+        duration,
+        coarse_interval,
+        sound_threshold,
+        min_silence,
+        hysteresis,
+    )
+    if discard_silence:
+        return speech_ranges
+    pieces = []
+    cursor = 0.0
+    for start, end in speech_ranges:
+        if start > cursor:
+            pieces.append((cursor, start))
+        pieces.append((start, end))
+        cursor = end
+    if cursor < duration:
+        pieces.append((cursor, duration))
+    return pieces
+
+
+def get_kept_ranges(input_video_file_clip, kwargs) -> List[Tuple[float, float]]:
+    """
+    Kept ranges of the clip for the trim options of the video_edit pipeline.
+    """
+    loudness_index = get_clip_loudness_index(input_video_file_clip)
+    if kwargs.get("refine_boundaries"):
+        return compute_refined_kept_ranges(
+            loudness_index,
+            input_video_file_clip.duration,
+            kwargs["clip_interval"],
+            kwargs["sound_threshold"],
+            kwargs["discard_silence"],
+            kwargs.get("min_silence", DEFAULT_MIN_SILENCE),
+            kwargs.get("hysteresis", DEFAULT_HYSTERESIS),
+        )
+    return compute_kept_ranges(
+        loudness_index,
+        input_video_file_clip.duration,
+        kwargs["clip_interval"],
+        kwargs["sound_threshold"],
+        kwargs["discard_silence"],
+    )
+
+
+def trim_by_silence(**kwargs):
+    """
+    Function to trim a video by silence.
+    """
+    logger.info("Chunking video...")
+    kept_ranges = get_kept_ranges(kwargs["input_video_file_clip"], kwargs)
+    return set_kept_ranges(kwargs, kept_ranges)
+
+
+def set_kept_ranges(kwargs, kept_ranges: List[Tuple[float, float]]):
+    """
+    Set the subclips of the kept ranges of the clip (and their timeline).
+    """
+    input_video_file_clip = kwargs["input_video_file_clip"]
+    logger.info("Subclipping...")
+    clips = [input_video_file_clip.subclip(start, end) for start, end in kept_ranges]
+    kwargs["kept_ranges"] = kept_ranges
+    kwargs["kept_ranges_clip"] = KeptRangesClip(input_video_file_clip, kept_ranges)
     kwargs["clips"] = clips
     return kwargs
@@ -0,0 +1,176 @@
+"""
+Module to tune the Whisper settings of this machine.
+
+Candidate configurations (compute_type, cpu_threads, num_workers, beam_size) are
+timed on a short sample of real audio and compared by real-time factor (seconds of
+compute per second of audio). A configuration whose text differs too much from the
+most accurate one (float32, largest beam) is rejected, so the tuner never trades
+transcript quality for speed. The fastest remaining configuration is saved to the
+machine profile read by get_whisper_model.
+
+The transcript paths call transcribe() from a single thread, so num_workers > 1
+only adds memory there; it is kept as a candidate for callers sharing a model
+between threads.
+"""
+
+import difflib
+import itertools
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from faster_whisper import WhisperModel
+
+from .transcript_store import (
+    WHISPER_SAMPLE_RATE,
+    read_audio_range,
+    save_whisper_profile,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_SECONDS = 30
+DEFAULT_COMPUTE_TYPES = ("int8", "float32")
+DEFAULT_NUM_WORKERS = (1,)
+DEFAULT_BEAM_SIZES = (1, 5)
+MIN_AGREEMENT = 0.9  # word agreement with the reference transcript
+WARMUP_SECONDS = 5  # untimed transcription run on every loaded model
+
+
+def get_thread_candidates(cpu_count: Optional[int] = None) -> List[int]:
+    """
+    cpu_threads values worth trying: a quarter, half and all of the cores.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return sorted({max(1, cpu_count // 4), max(1, cpu_count // 2), cpu_count})
+
+
+def word_agreement(text: str, reference: str) -> float:
+    """
+    Similarity of the words of text and reference, 1.0 when identical.
+    """
+    return difflib.SequenceMatcher(
+        None, text.lower().split(), reference.lower().split()
+    ).ratio()
+
+
+def benchmark_config(
+    audio: np.ndarray,
+    model_size: str,
+    compute_type: str,
+    cpu_threads: int,
+    num_workers: int,
+    beam_size: int,
+) -> Dict[str, Any]:
+    """
+    Transcribe audio with one configuration, returning its real-time factor and
+    text. The model load and a warm-up transcription of the first WARMUP_SECONDS
+    are not timed, so the first configuration is not charged for the cold start.
+    """
+    model = WhisperModel(
+        model_size,
+        compute_type=compute_type,
+        cpu_threads=cpu_threads,
+        num_workers=num_workers,
+    )
+    warmup, _ = model.transcribe(
+        audio[: WARMUP_SECONDS * WHISPER_SAMPLE_RATE], beam_size=beam_size
+    )
+    for _ in warmup:  # segments are decoded lazily
+        pass
+    started = time.perf_counter()
+    segments, _ = model.transcribe(audio, beam_size=beam_size)
+    text = " ".join(segment.text.strip() for segment in segments)
+    elapsed = time.perf_counter() - started
+    return {
+        "compute_type": compute_type,
+        "cpu_threads": cpu_threads,
+        "num_workers": num_workers,
+        "beam_size": beam_size,
+        "rtf": elapsed / (len(audio) / WHISPER_SAMPLE_RATE),
+        "text": text,
+    }
+
+
+def tune_model(
+    audio: np.ndarray,
+    model_size: str,
+    compute_types: Sequence[str] = DEFAULT_COMPUTE_TYPES,
+    thread_counts: Optional[Sequence[int]] = None,
+    num_workers: Sequence[int] = DEFAULT_NUM_WORKERS,
+    beam_sizes: Sequence[int] = DEFAULT_BEAM_SIZES,
+) -> Dict[str, Any]:
+    """
+    Benchmark every candidate configuration of model_size on audio and return the
+    fastest one that agrees with the reference transcript.
+    """
+    thread_counts = thread_counts or get_thread_candidates()
+    # Most accurate configuration first, its text is the reference
+    candidates = sorted(
+        itertools.product(compute_types, thread_counts, num_workers, beam_sizes),
+        key=lambda config: (config[0] != "float32", -config[3], -config[1]),
+    )
+    results = []
+    reference = None
+    for compute_type, cpu_threads, workers, beam_size in candidates:
+        result = benchmark_config(
+            audio, model_size, compute_type, cpu_threads, workers, beam_size
+        )
+        reference = result["text"] if reference is None else reference
+        result["agreement"] = word_agreement(result["text"], reference)
+        logger.info(
+            "%s compute_type=%s cpu_threads=%d num_workers=%d beam_size=%d: "
+            "RTF %.3f, agreement %.2f",
+            model_size,
+            compute_type,
+            cpu_threads,
+            workers,
+            beam_size,
+            result["rtf"],
+            result["agreement"],
+        )
+        results.append(result)
+    accepted = [item for item in results if item["agreement"] >= MIN_AGREEMENT]
+    # Ties go to the lighter configuration
+    return min(
+        accepted,
+        key=lambda item: (
+            round(item["rtf"], 3),
+            item["num_workers"],
+            item["cpu_threads"],
+        ),
+    )
+
+
+def tune_whisper(
+    sample_path: str,
+    model_sizes: Sequence[str],
+    sample_start: float = 0.0,
+    sample_seconds: float = DEFAULT_SAMPLE_SECONDS,
+    compute_types: Sequence[str] = DEFAULT_COMPUTE_TYPES,
+    thread_counts: Optional[Sequence[int]] = None,
+    num_workers: Sequence[int] = DEFAULT_NUM_WORKERS,
+    beam_sizes: Sequence[int] = DEFAULT_BEAM_SIZES,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Tune every model size on a sample of sample_path and save the best settings
+    to the machine profile. Returns the saved settings (with their RTF) by model.
+    """
+    audio = read_audio_range(sample_path, sample_start, sample_start + sample_seconds)
+    if not len(audio):
+        raise ValueError(f"No audio to tune on in '{sample_path}'.")
+    best = {}
+    for model_size in model_sizes:
+        result = tune_model(
+            audio, model_size, compute_types, thread_counts, num_workers, beam_sizes
+        )
+        settings = {
+            key: result[key]
+            for key in ("compute_type", "cpu_threads", "num_workers", "beam_size")
+        }
+        save_whisper_profile(model_size, settings)
+        best[model_size] = dict(settings, rtf=result["rtf"])
+    return best
@@ -0,0 +1,302 @@
+"""
+Module with the word-level transcript store used to re-segment subtitles.
+
+transcript_divided keeps every word timing in '<stem>_transcript_words.npz' next to
+the SRT: start/end/probability columns, the segment each word belongs to and the
+words as one UTF-8 blob with offsets. split_str rebuilds SRT/VTT cues at any
+words-per-cue or max-duration setting from it without running Whisper again.
+The store records the fingerprint of the SRT it was written with; once the SRT
+is rewritten or corrected by hand, split_str works from the SRT text instead.
+"""
+
+import logging
+import re
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utils import file_fingerprint, float_to_srt_time, float_to_vtt_time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WORD_STORE_VERSION = 2
+WORD_STORE_SUFFIX = "_words.npz"
+VTT_HEADER = "WEBVTT\n\n"
+
+Cue = Tuple[float, float, str]
+
+_SRT_TIME = re.compile(r"(\d+):(\d+):(\d+)[,.](\d+)")
+
+
+class WordTable:
+    """
+    Columnar word store. Words are kept as a UTF-8 blob sliced by offsets.
+    """
+
+    def __init__(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        probabilities: np.ndarray,
+        segment_ids: np.ndarray,
+        text_blob: bytes,
+        text_offsets: np.ndarray,
+        srt_fingerprint: Optional[Tuple[float, float]] = None,
+    ):
+        self.starts = starts
+        self.ends = ends
+        self.probabilities = probabilities
+        self.segment_ids = segment_ids
+        self.text_blob = text_blob
+        self.text_offsets = text_offsets
+        # file_fingerprint of the SRT written with these words
+        self.srt_fingerprint = srt_fingerprint
+
+    @classmethod
+    def from_words(
+        cls, words: List[Tuple[float, float, str, float, int]]
+    ) -> "WordTable":
+        """
+        Build the table from (start, end, word, probability, segment id) tuples.
+        """
+        texts = [word[2].encode("utf-8") for word in words]
+        lengths = np.array([len(text) for text in texts], dtype=np.int64)
+        return cls(
+            starts=np.array([word[0] for word in words], dtype=np.float64),
+            ends=np.array([word[1] for word in words], dtype=np.float64),
+            probabilities=np.array([word[3] for word in words], dtype=np.float32),
+            segment_ids=np.array([word[4] for word in words], dtype=np.int32),
+            text_blob=b"".join(texts),
+            text_offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        )
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Any]) -> "WordTable":
+        """
+        Build the table from transcript segments with word timestamps.
+        """
+        return cls.from_words(
+            [
+                (word.start, word.end, word.word, word.probability, segment_id)
+                for segment_id, segment in enumerate(segments)
+                for word in segment.words or []
+            ]
+        )
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def word(self, index: int) -> str:
+        """
+        Text of the word at index.
+        """
+        start, end = self.text_offsets[index], self.text_offsets[index + 1]
+        return self.text_blob[start:end].decode("utf-8")
+
+    def save(self, path: Path) -> None:
+        """
+        Write the table to a versioned .npz file.
+        """
+        with Path(path).open("wb") as f:
+            np.savez(
+                f,
+                version=WORD_STORE_VERSION,
+                srt_fingerprint=np.array(self.srt_fingerprint or (), dtype=np.float64),
+                starts=self.starts,
+                ends=self.ends,
+                probabilities=self.probabilities,
+                segment_ids=self.segment_ids,
+                text_blob=np.frombuffer(self.text_blob, dtype=np.uint8),
+                text_offsets=self.text_offsets,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "WordTable":
+        """
+        Read a table written by save(). Raises ValueError on a version mismatch.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != WORD_STORE_VERSION:
+                raise ValueError(f"Unsupported word store version {data['version']}")
+            return cls(
+                starts=data["starts"],
+                ends=data["ends"],
+                probabilities=data["probabilities"],
+                segment_ids=data["segment_ids"],
+                text_blob=data["text_blob"].tobytes(),
+                text_offsets=data["text_offsets"],
+                srt_fingerprint=tuple(data["srt_fingerprint"].tolist()) or None,
+            )
+
+
+def get_word_store_path(srt_path: str) -> Path:
+    """
+    Path of the word store kept next to an SRT file.
+    """
+    path = Path(srt_path)
+    return path.with_name(path.stem + WORD_STORE_SUFFIX)
+
+
+def save_word_store(srt_path: str, table: WordTable) -> None:
+    """
+    Save the words of the SRT just written at srt_path next to it.
+    """
+    table.srt_fingerprint = file_fingerprint(srt_path)
+    table.save(get_word_store_path(srt_path))
+
+
+def load_word_store(srt_path: str) -> Optional[WordTable]:
+    """
+    Word store of srt_path, None when missing, unreadable or written for another
+    version of the SRT (rewritten by a transcript step or edited by hand).
+    """
+    store_path = get_word_store_path(srt_path)
+    if not store_path.exists():
+        return None
+    try:
+        table = WordTable.load(store_path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.info("Ignoring word store '%s': %s", store_path, e)
+        return None
+    if table.srt_fingerprint != file_fingerprint(srt_path):
+        logger.info("Word store '%s' does not match '%s'.", store_path, srt_path)
+        return None
+    return table
+
+
+def build_cues(
+    table: WordTable, words_per_cue: int, max_duration: Optional[float] = None
+) -> List[Cue]:
+    """
+    Group the words into cues of at most words_per_cue words and max_duration
+    seconds. Cues never span two transcript segments.
+    """
+    cues: List[Cue] = []
+    words: List[str] = []
+    cue_start = cue_end = 0.0
+    cue_segment = None
+    for i in range(len(table)):
+        start, end = float(table.starts[i]), float(table.ends[i])
+        segment_id = int(table.segment_ids[i])
+        if words and (
+            len(words) >= words_per_cue
+            or segment_id != cue_segment
+            or (max_duration and end - cue_start > max_duration)
+        ):
+            cues.append((cue_start, cue_end, "".join(words).strip()))
+            words = []
+        if not words:
+            cue_start, cue_segment = start, segment_id
+        words.append(table.word(i))
+        cue_end = end
+    if words:
+        cues.append((cue_start, cue_end, "".join(words).strip()))
+    return cues
+
+
+def split_cues(
+    cues: Iterable[Cue], words_per_cue: int, max_duration: Optional[float] = None
+) -> List[Cue]:
+    """
+    Re-split existing cues by words when no word store exists. Word times are
+    spread over each cue in proportion to the word lengths. Every input cue is its
+    own segment, so new cues never bridge the gaps between the original ones.
+    """
+    words = []
+    for segment_id, (start, end, text) in enumerate(cues):
+        tokens = text.split()
+        weights = np.cumsum([0] + [len(token) + 1 for token in tokens], dtype=float)
+        times = start + (end - start) * weights / max(weights[-1], 1.0)
+        for token, token_start, token_end in zip(tokens, times[:-1], times[1:]):
+            words.append((token_start, token_end, " " + token, 1.0, segment_id))
+    return build_cues(WordTable.from_words(words), words_per_cue, max_duration)
+
+
+def parse_srt_time(value: str) -> float:
+    """
+    Convert an SRT (or VTT) timestamp to seconds.
+    """
+    hours, minutes, seconds, milliseconds = _SRT_TIME.match(value.strip()).groups()
+    return (
+        int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(milliseconds) / 1000
+    )
+
+
+def read_srt(path: str) -> List[Cue]:
+    """
+    Read the cues of an SRT file.
+    """
+    cues = []
+    with open(path, "r", encoding="utf-8") as f:
+        blocks = f.read().strip().split("\n\n")
+    for block in blocks:
+        lines = block.strip().splitlines()
+        timing = next((i for i, line in enumerate(lines) if "-->" in line), None)
+        if timing is None:
+            continue
+        start, end = lines[timing].split("-->")
+        text = " ".join(lines[timing + 1 :])
+        cues.append((parse_srt_time(start), parse_srt_time(end), text))
+    return cues
+
+
+def format_srt_cue(index: int, start: float, end: float, text: str) -> str:
+    """
+    Render one SRT cue.
+    """
+    timing = f"{float_to_srt_time(start)} --> {float_to_srt_time(end)}"
+    return f"{index}\n{timing}\n{text}\n\n"
+
+
+def format_vtt_cue(start: float, end: float, text: str) -> str:
+    """
+    Render one WebVTT cue.
+    """
+    return f"{float_to_vtt_time(start)} --> {float_to_vtt_time(end)}\n{text}\n\n"
+
+
+def format_srt(cues: Iterable[Cue]) -> str:
+    """
+    Render cues as SRT.
+    """
+    return "".join(
+        format_srt_cue(i, start, end, text)
+        for i, (start, end, text) in enumerate(cues, start=1)
+    )
+
+
+def format_vtt(cues: Iterable[Cue]) -> str:
+    """
+    Render cues as WebVTT.
+    """
+    return VTT_HEADER + "".join(
+        format_vtt_cue(start, end, text) for start, end, text in cues
+    )
+
+
+def resegment_subtitles(
+    srt_path: str,
+    words_per_cue: int,
+    max_duration: Optional[float] = None,
+    output_format: str = "srt",
+    output_path: Optional[str] = None,
+) -> str:
+    """
+    Write the subtitles of srt_path with a new cue granularity, from the word
+    store when it matches the SRT (exact word timings) or from the SRT text
+    otherwise.
+    """
+    table = load_word_store(srt_path)
+    if table is not None:
+        cues = build_cues(table, words_per_cue, max_duration)
+    else:
+        cues = split_cues(read_srt(srt_path), words_per_cue, max_duration)
+    output_path = output_path or str(
+        Path(srt_path).with_name(f"{Path(srt_path).stem}_split.{output_format}")
+    )
+    content = format_vtt(cues) if output_format == "vtt" else format_srt(cues)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return output_path
@@ -1,166 +1,174 @@
 #!/usr/bin/env python3
 """
 This script provides a command line interface for various video processing tasks.
+
+Recipes are declared as data (RECIPES) and run inside this process: every step
+calls main.main or an agent module directly instead of spawning
+`python main.py ...`, so torch, transformers and MoviePy are imported once and the
+Whisper (and denoise) models loaded by one step are reused by the next ones.
+
+A step is a dict with one action:
+- "main": main.py arguments
+- "agent": agents module name, "args": its arguments
+- "rename": [source, destination]
+- "print": message
+and the optional keys:
+- "unless_exists": skip the step when this file exists
+- "on_error": "stop" to end the recipe quietly, or the name of a recipe to run
+  instead of the remaining steps. Without it the error is raised.
+Arguments are formatted with {video} and {base_name} (video without extension).
 """
-import subprocess
-import sys
 import os
-
-
-def transcribe_video(video: str):
-    """
-    Transcribes the video using the 'video_transcription' pipeline.
-    Command:
-    python main.py video_edit {video} --pipeline transcript
-    """
-
-    command = f"python main.py video_edit {video} --pipeline transcript"
-    subprocess.run(command, shell=True, check=True)
-
-
-def separate_video(video: str):
-    """
-    Separates the video using the 'trim_by_silence' pipeline.
-    Command:
-    python main.py video_edit {video} --pipeline \
-        trim_by_silence save_separated_video -c 0.25 -s 0.01 -d True
-    """
-    command = f"python main.py video_edit {video} --pipeline \
-        trim_by_silence save_separated_video -c 0.25 -s 0.01 -d True"
-    subprocess.run(command, shell=True, check=True)
-
-
-def generate_avatar(video: str):
-    """
-    Generates the video avatar.
-    Command:
-    python main.py avatar_video_generation {video} avatar_config/config.json
-    """
-    command = (
-        f"python main.py avatar_video_generation {video} avatar_config/config.json"
-    )
-    subprocess.run(command, shell=True, check=True)
-
-
-def subtitle_video(video: str):
-    """
-    Generate subtitles and add them to the video
-    """
+import runpy
+import sys
+from typing import Any, Dict, List
+
+RECIPES: Dict[str, List[Dict[str, Any]]] = {
+    "transcribe_video": [
+        {"main": ["video_edit", "{video}", "--pipeline", "transcript"]},
+    ],
+    "separate_video": [
+        {
+            "main": [
+                "video_edit",
+                "{video}",
+                "--pipeline",
+                "trim_by_silence",
+                "save_separated_video",
+                "-c",
+                "0.25",
+                "-s",
+                "0.01",
+                "-d",
+                "True",
+            ]
+        },
+    ],
+    "generate_avatar": [
+        {"main": ["avatar_video_generation", "{video}", "avatar_config/config.json"]},
+    ],
+    "subtitle_video": [
+        {
+            "main": ["video_edit", "{video}", "--pipeline", "transcript_divided"],
+            "on_error": "stop",
+        },
+        {"main": ["video_edit", "{video}", "--pipeline", "subtitles", "save_join"]},
+    ],
+    "generate_short_base": [
+        {
+            "main": ["video_edit", "{video}", "--pipeline", "transcript_divided"],
+            "on_error": "generate_short_base_without_subtitles",
+        },
+        {
+            "rename": [
+                "{base_name}_transcript.srt",
+                "output_{base_name}_transcript.srt",
+            ],
+            "on_error": "generate_short_base_without_subtitles",
+        },
+        {"main": ["generator", "{video}", "base"]},
+        {
+            "main": [
+                "video_edit",
+                "output_{video}",
+                "--pipeline",
+                "subtitles",
+                "save_join",
+            ]
+        },
+    ],
+    "generate_short_base_without_subtitles": [
+        {"main": ["generator", "{video}", "base"]},
+        {"main": ["video_edit", "output_{video}", "--pipeline", "save_join"]},
+    ],
+    "generate_video_ideas": [
+        {"print": "Remember to change the videos_to_compare.json"},
+        {"agent": "killer_video_idea", "args": ["{video}"]},
+    ],
+    "generate_video_title": [
+        {"print": "Remember to change the videos_to_compare.json"},
+        {
+            "main": ["video_edit", "{video}", "--pipeline", "transcript"],
+            "unless_exists": "{base_name}_transcript.srt",
+        },
+        {"agent": "killer_video_title_gen", "args": ["{base_name}_transcript.srt"]},
+        {"print": "Output saved on output.txt"},
+    ],
+}
+
+# Recipes only used as fallbacks, not listed in the usage
+INTERNAL_RECIPES = ("generate_short_base_without_subtitles",)
+
+
+def run_agent(module_name: str, args: List[str]):
+    """
+    Run an agents script as __main__ in this process.
+    """
+    argv = sys.argv
+    sys.argv = [f"{module_name}.py"] + args
     try:
-        command = f"python main.py video_edit {video} --pipeline transcript_divided"
-        subprocess.run(command, shell=True, check=True)
-    except subprocess.CalledProcessError:
-        return
-
-    command = f"python main.py video_edit {video} --pipeline subtitles save_join"
-    subprocess.run(command, shell=True, check=True)
+        runpy.run_module(f"agents.{module_name}", run_name="__main__")
+    finally:
+        sys.argv = argv
 
 
-def generate_short_base(video: str):
+def run_step(step: Dict[str, Any], values: Dict[str, str]):
     """
-    Generates a short base from the video by chaining several commands:
-    1. Divides the transcript:
-       python main.py video_edit {video} --pipeline transcript_divided
-    2. Renames the subtitle file:
-       mv {base_name}_transcript.srt output_{base_name}_transcript.srt
-    3. Generates the base:
-       python main.py generator {video} base
-    4. Joins the subtitles:
-       python main.py video_edit {video} --pipeline subtitles save_join
+    Run one recipe step.
     """
-    # Get the base name of the video (without extension)
-    base_name = os.path.splitext(video)[0]
+    if "main" in step:
+        import main  # imported once, the first step pays the startup cost
 
-    try:
-        command = (
-            f"python main.py video_edit {video} --pipeline transcript_divided &&"
-            f"mv {base_name}_transcript.srt output_{base_name}_transcript.srt"
-        )
-        subprocess.run(command, shell=True, check=True)
-    except subprocess.CalledProcessError:
-        command = f"python main.py generator {video} base && \
-            python main.py video_edit output_{video} --pipeline save_join"
-        subprocess.run(command, shell=True, check=True)
-        return
-    command = (
-        f"python main.py generator {video} base && "
-        f"python main.py video_edit output_{video} --pipeline subtitles save_join"
-    )
-    subprocess.run(command, shell=True, check=True)
-
-
-def generate_video_ideas(youtube_username: str):
-    """
-    Generate video ideas from a youtube channel username
-    """
-    print("Remember to change the videos_to_compare.json")
-    command = f"python agents/killer_video_idea.py {youtube_username}"
-    subprocess.run(command, shell=True, check=True)
+        main.main([arg.format(**values) for arg in step["main"]])
+    elif "agent" in step:
+        run_agent(step["agent"], [arg.format(**values) for arg in step["args"]])
+    elif "rename" in step:
+        source, destination = (path.format(**values) for path in step["rename"])
+        os.replace(source, destination)
+    elif "print" in step:
+        print(step["print"].format(**values))
+    else:
+        raise ValueError(f"Unknown recipe step: {step}")
 
 
-def generate_video_title(video: str):
+def run_recipe(name: str, video: str):
     """
-    Generate video title idea using the transcript
-    1. Check if {video}_transcript.srt exists
-    2 If exists, just return the response of:
-        python agents/killer_video_title_gen.py {video}_transcript.srt
-    3 If not
-    4. Generate video transcript
-    5. Generate titles with python agents/killer_video_title_gen.py {video}_transcript.srt
+    Run the steps of a recipe on a video (or channel name).
     """
-    print("Remember to change the videos_to_compare.json")
-
-    def killer_video_title(transcript_name):
-        command = f"python agents/killer_video_title_gen.py {transcript_name}"
-        subprocess.run(command, shell=True, check=True)
-        print("Output saved on output.txt")
-
-    base_name = os.path.splitext(video)[0]
-    transcript_name = f"{base_name}_transcript.srt"
-
-    if os.path.isfile(transcript_name):
-        killer_video_title(transcript_name)
-        return
-
-    transcribe_video(video)
-    killer_video_title(transcript_name)
+    values = {"video": video, "base_name": os.path.splitext(video)[0]}
+    for step in RECIPES[name]:
+        unless_exists = step.get("unless_exists")
+        if unless_exists and os.path.isfile(unless_exists.format(**values)):
+            continue
+        try:
+            run_step(step, values)
+        except (Exception, SystemExit) as e:
+            on_error = step.get("on_error")
+            if on_error is None:
+                raise
+            print(f"Step failed in {name}: {e!r}")
+            if on_error != "stop":
+                run_recipe(on_error, video)
+            return
 
 
 def main():
     """
     Main function to handle command line arguments and execute the appropriate function.
     """
+    commands = [name for name in RECIPES if name not in INTERNAL_RECIPES]
     if len(sys.argv) < 3:
         print("Usage: python recipes.py <command> <video>")
-        print(
-            "Available commands: "
-            "separate_video, generate_avatar, generate_short_base, "
-            "transcribe_video, subtitle_video, generate_video_ideas,"
-            "generate_video_title"
-        )
+        print("Available commands: " + ", ".join(commands))
         sys.exit(1)
 
     command = sys.argv[1]
     video = sys.argv[2]
 
-    if command == "separate_video":
-        separate_video(video)
-    elif command == "generate_avatar":
-        generate_avatar(video)
-    elif command == "generate_short_base":
-        generate_short_base(video)
-    elif command == "transcribe_video":
-        transcribe_video(video)
-    elif command == "subtitle_video":
-        subtitle_video(video)
-    elif command == "generate_video_ideas":
-        username = video
-        generate_video_ideas(username)
-    elif command == "generate_video_title":
-        generate_video_title(video)
-    else:
+    if command not in commands:
         print("Command not recognized.")
         sys.exit(1)
+    run_recipe(command, video)
 
 
 if __name__ == "__main__":
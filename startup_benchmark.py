@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Startup time benchmark for main.py.
+
+Runs `--help` and the light subcommands in fresh interpreters and fails when the
+median wall time of any of them goes over the target, so a module-level import
+of torch, transformers or MoviePy is caught before it ships. separate_audio and
+split_str really run, on a one-second video and a small SRT generated in a
+temporary directory. --importtime lists the slowest imports of each command
+(python -X importtime).
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN_PATH = os.path.join(REPO_DIR, "main.py")
+DEFAULT_TARGET = 1.0  # seconds
+# Arguments are formatted with the fixture paths
+COMMANDS = [
+    ["--help"],
+    ["video_edit", "--help"],
+    ["separate_audio", "--help"],
+    ["split_str", "--help"],
+    ["voice", "--help"],
+    ["separate_audio", "{video}"],
+    ["split_str", "{srt}", "3"],
+]
+FIXTURE_SRT = """1
+00:00:00,000 --> 00:00:01,000
+one two three four five six
+
+"""
+
+
+def make_fixtures(work_dir: str) -> Dict[str, str]:
+    """
+    Write the fixtures of the real invocations: a one-second video with audio and
+    an SRT file.
+    """
+    from moviepy.config import get_setting
+
+    video_path = os.path.join(work_dir, "fixture.mp4")
+    subprocess.run(
+        [
+            get_setting("FFMPEG_BINARY"),
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            "testsrc=size=64x64:rate=10",
+            "-f",
+            "lavfi",
+            "-i",
+            "sine=frequency=440",
+            "-t",
+            "1",
+            "-shortest",
+            "-pix_fmt",
+            "yuv420p",
+            video_path,
+        ],
+        check=True,
+    )
+    srt_path = os.path.join(work_dir, "fixture.srt")
+    with open(srt_path, "w", encoding="utf-8") as f:
+        f.write(FIXTURE_SRT)
+    return {"video": video_path, "srt": srt_path}
+
+
+def time_command(args: List[str], repeats: int) -> float:
+    """
+    Median wall time of `python main.py <args>` over repeats runs.
+    """
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, MAIN_PATH] + args,
+            cwd=REPO_DIR,  # config.json is read from the working directory
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def slowest_imports(args: List[str], top: int) -> List[Tuple[int, str]]:
+    """
+    The top imports of `python main.py <args>` by cumulative time, in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", MAIN_PATH] + args,
+        cwd=REPO_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit():
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark main.py startup time.")
+    parser.add_argument(
+        "--repeats", type=int, default=5, help="Runs per command (median is used)."
+    )
+    parser.add_argument(
+        "--target",
+        type=float,
+        default=DEFAULT_TARGET,
+        help="Maximum median startup time in seconds.",
+    )
+    parser.add_argument(
+        "--importtime",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Also list the N slowest imports of each command.",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    work_dir = tempfile.mkdtemp(prefix="startup_benchmark_")
+    try:
+        fixtures = make_fixtures(work_dir)
+        for command in COMMANDS:
+            command = [arg.format(**fixtures) for arg in command]
+            median = time_command(command, args.repeats)
+            status = "ok" if median <= args.target else "SLOW"
+            failed = failed or median > args.target
+            print(f"{status:4} {median:6.3f}s  main.py {' '.join(command)}")
+            if args.importtime:
+                for cumulative, name in slowest_imports(command, args.importtime):
+                    print(f"       {cumulative / 1e6:6.3f}s  {name}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if failed:
+        print(f"Startup over the {args.target:.2f}s target.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+KeptRangesClip against concatenate_videoclips of the kept subclips.
+"""
+
+import numpy as np
+import pytest
+from moviepy.editor import ColorClip, VideoFileClip, concatenate_videoclips
+from moviepy.video.fx.all import crop
+
+from operations.timeline import KeptRangesClip, get_reader_filename
+
+KEPT_RANGES = [(0.2, 0.6), (1.0, 1.4), (1.7, 2.0)]
+
+
+@pytest.fixture(scope="module")
+def video_path(tmp_path_factory):
+    """A 2 s video whose color changes every frame."""
+    path = str(tmp_path_factory.mktemp("timeline") / "source.mp4")
+    clip = ColorClip((160, 120), color=(0, 0, 0), duration=2).set_fps(10)
+    clip = clip.fl(lambda gf, t: np.full_like(gf(t), int(t * 10) * 12))
+    clip.write_videofile(path, codec="libx264", audio=False, logger=None)
+    return path
+
+
+def assert_matches_concatenation(source_clip):
+    timeline = KeptRangesClip(source_clip, KEPT_RANGES)
+    expected = concatenate_videoclips(
+        [source_clip.subclip(start, end) for start, end in KEPT_RANGES]
+    )
+    assert tuple(timeline.size) == tuple(expected.size)
+    assert timeline.duration == pytest.approx(expected.duration)
+    for t in np.arange(0, expected.duration - 0.05, 0.1):
+        frame = timeline.get_frame(t)
+        assert frame.shape == expected.get_frame(t).shape
+        assert np.abs(frame.astype(int) - expected.get_frame(t)).max() <= 2
+    timeline.close()
+
+
+def test_untouched_source_uses_forward_reader(video_path):
+    source_clip = VideoFileClip(video_path)
+    assert get_reader_filename(source_clip) == video_path
+    assert_matches_concatenation(source_clip)
+    source_clip.close()
+
+
+def test_transformed_source_keeps_transform(video_path):
+    source_clip = VideoFileClip(video_path)
+    cropped = crop(source_clip, x1=40, y1=0, width=80, height=120)
+    inverted = source_clip.fl_image(lambda frame: 255 - frame)
+    assert get_reader_filename(cropped) is None
+    assert get_reader_filename(inverted) is None
+    assert_matches_concatenation(cropped)
+    assert_matches_concatenation(inverted)
+    source_clip.close()
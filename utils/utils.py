@@ -2,12 +2,19 @@
 Module to handle video processing and audio extraction.
 """
 
+import gc
 import os
 import argparse
+import threading
 from pathlib import Path
 
 import numpy as np
-from moviepy.editor import VideoFileClip
+
+
+LOUDNESS_INDEX_SUFFIX = "_loudness.npz"
+LOUDNESS_INDEX_VERSION = 1
+LOUDNESS_INDEX_RATE = 1000  # energy bins per second (1 ms resolution)
+LOUDNESS_CHUNK_SECONDS = 2  # must fit in the moviepy audio reader buffer
 
 
 def str2bool(v):
@@ -23,22 +30,192 @@ def str2bool(v):
     raise argparse.ArgumentTypeError("Boolean value expected.")
 
 
-def get_subclip_volume(subclip, second, interval):
+def str2target(v):
+    """
+    Parse a 'code=model' translation target into a (code, model) pair.
+    """
+    code, separator, model = v.partition("=")
+    if not separator or not code.strip() or not model.strip():
+        raise argparse.ArgumentTypeError(
+            f"Expected code=model (e.g. pt=Helsinki-NLP/opus-mt-en-pt), got '{v}'."
+        )
+    return code.strip(), model.strip()
+
+
+class LoudnessIndex:
+    """
+    Cumulative sum of the mean squared sample per time bin, built once per audio file.
+    The RMS of any [start, end] range is then two lookups, samples are normalised
+    to [-1, 1] and averaged over channels.
+    """
+
+    def __init__(self, cumulative_energy: np.ndarray, rate: float, duration: float):
+        self.cumulative_energy = cumulative_energy
+        self.rate = rate
+        self.duration = duration
+
+    @classmethod
+    def from_chunks(cls, chunks, sample_rate: int, rate: float = LOUDNESS_INDEX_RATE):
+        """
+        Build the index from an iterable of sample arrays (frames or frames x channels).
+        """
+        block = max(1, int(round(sample_rate / rate)))
+        bins = []
+        total_samples = 0
+        remainder = np.empty(0)
+        for chunk in chunks:
+            power = np.square(np.asarray(chunk, dtype=np.float64))
+            if power.ndim > 1:
+                power = power.mean(axis=1)
+            total_samples += len(power)
+            power = np.concatenate([remainder, power])
+            usable = len(power) // block * block
+            if usable:
+                bins.append(power[:usable].reshape(-1, block).mean(axis=1))
+            remainder = power[usable:]
+        if len(remainder):
+            bins.append(np.array([remainder.mean()]))
+        mean_square = np.concatenate(bins) if bins else np.zeros(0)
+        cumulative_energy = np.concatenate([[0.0], np.cumsum(mean_square)])
+        return cls(cumulative_energy, sample_rate / block, total_samples / sample_rate)
+
+    @classmethod
+    def from_audio_segment(cls, audio_segment, rate: float = LOUDNESS_INDEX_RATE):
+        """
+        Build the index from a pydub AudioSegment.
+        """
+        samples = np.array(audio_segment.get_array_of_samples())
+        samples = samples.reshape(-1, audio_segment.channels)
+        scale = float(1 << (8 * audio_segment.sample_width - 1))
+        step = audio_segment.frame_rate * LOUDNESS_CHUNK_SECONDS
+        chunks = (samples[i : i + step] / scale for i in range(0, len(samples), step))
+        return cls.from_chunks(chunks, audio_segment.frame_rate, rate)
+
+    @classmethod
+    def from_audio_clip(
+        cls, audio_clip, fps: int = 44100, rate: float = LOUDNESS_INDEX_RATE
+    ):
+        """
+        Build the index from a moviepy audio clip, decoding it chunk by chunk.
+        """
+        chunks = audio_clip.iter_chunks(
+            chunk_duration=LOUDNESS_CHUNK_SECONDS, fps=fps, quantize=False
+        )
+        return cls.from_chunks(chunks, fps, rate)
+
+    def rms_many(self, starts, ends) -> np.ndarray:
+        """
+        Vectorised RMS for several [start, end] ranges given in seconds.
+        """
+        last_bin = len(self.cumulative_energy) - 1
+        first = np.clip(np.rint(np.asarray(starts) * self.rate), 0, last_bin)
+        last = np.clip(np.rint(np.asarray(ends) * self.rate), 0, last_bin)
+        first = first.astype(int)
+        last = np.maximum(last.astype(int), first + 1).clip(max=last_bin)
+        energy = self.cumulative_energy[last] - self.cumulative_energy[first]
+        return np.sqrt(np.maximum(energy, 0.0) / np.maximum(last - first, 1))
+
+    def rms(self, start: float, end: float) -> float:
+        """
+        RMS of the audio between start and end (seconds).
+        """
+        return float(self.rms_many([start], [end])[0])
+
+    def save(self, path, source_path=None) -> None:
+        """
+        Save the index as a .npz file, tagged with the source file fingerprint.
+        The file is written aside and moved in place, readers never see a partial
+        index.
+        """
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                np.savez(
+                    f,
+                    version=LOUDNESS_INDEX_VERSION,
+                    cumulative_energy=self.cumulative_energy,
+                    rate=self.rate,
+                    duration=self.duration,
+                    fingerprint=np.array(
+                        file_fingerprint(source_path) if source_path else []
+                    ),
+                )
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @classmethod
+    def load(cls, path, source_path=None):
+        """
+        Load an index saved with save(). Returns None if it is stale or unreadable.
+        """
+        try:
+            with np.load(path) as data:
+                if int(data["version"]) != LOUDNESS_INDEX_VERSION:
+                    return None
+                if source_path and list(data["fingerprint"]) != list(
+                    file_fingerprint(source_path)
+                ):
+                    return None
+                return cls(
+                    data["cumulative_energy"],
+                    float(data["rate"]),
+                    float(data["duration"]),
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def file_fingerprint(path) -> tuple:
+    """
+    Cheap identity of a file on disk: size and modification time.
+    """
+    stat = os.stat(path)
+    return (float(stat.st_size), float(stat.st_mtime))
+
+
+def get_loudness_index_path(source_path) -> Path:
+    """
+    Path of the loudness index stored next to the given audio/video file.
+    """
+    source = Path(source_path)
+    return source.with_name(source.stem + LOUDNESS_INDEX_SUFFIX)
+
+
+# One lock per index path: concurrent pipeline steps build an index only once
+_loudness_index_locks = {}
+_loudness_index_locks_lock = threading.Lock()
+
+
+def get_loudness_index_lock(index_path) -> threading.Lock:
     """
-    Get the volume of a subclip.
+    Lock guarding the build of the loudness index at index_path.
     """
-    cut = subclip.subclip(second, second + interval).audio.to_soundarray(fps=44100)
-    return np.sqrt(((1.0 * cut) ** 2).mean())
+    key = os.path.abspath(index_path)
+    with _loudness_index_locks_lock:
+        return _loudness_index_locks.setdefault(key, threading.Lock())
 
 
-def get_subclip_volume_segment(audio_segment, start: float, duration: float) -> float:
+def load_or_build_loudness_index(source_path, builder) -> LoudnessIndex:
     """
-    Get the volume of a segment of an audio file.
+    Load the cached loudness index of source_path or build it with builder() and
+    store it next to the source. Without a source path the index is not cached.
     """
-    start_ms = int(start * 1000)
-    end_ms = int((start + duration) * 1000)
-    segment = audio_segment[start_ms:end_ms]
-    return segment.rms
+    if not source_path or not os.path.exists(source_path):
+        return builder()
+    index_path = get_loudness_index_path(source_path)
+    with get_loudness_index_lock(index_path):
+        if index_path.exists():
+            index = LoudnessIndex.load(index_path, source_path)
+            if index is not None:
+                return index
+        index = builder()
+        try:
+            index.save(index_path, source_path)
+        except OSError:
+            pass
+    return index
 
 
 def float_to_srt_time(seconds: float) -> str:
@@ -52,6 +229,13 @@ def float_to_srt_time(seconds: float) -> str:
     return f"{hours:02d}:{minutes:02d}:{sec:02d},{milliseconds:03d}"
 
 
+def float_to_vtt_time(seconds: float) -> str:
+    """
+    Convert a float to WebVTT time format.
+    """
+    return float_to_srt_time(seconds).replace(",", ".")
+
+
 def get_audio(input_video_file_clip, filename: str) -> str | None:
     """
     Extract audio from a video file and save it as a WAV file.
@@ -72,25 +256,53 @@ def get_video_data(**kwargs):
     """
     Get video data from the input video file.
     """
+    from moviepy.editor import VideoFileClip  # imported when a video is opened
+
     video_path = kwargs["video_path"]
     filename = os.path.splitext(os.path.basename(video_path))[0]
     input_video_file_clip = VideoFileClip(video_path)
     kwargs["shape"] = input_video_file_clip.size
     kwargs["filename"] = filename
     kwargs["input_video_file_clip"] = input_video_file_clip
+    # Steps that change the frames set it, save_video then re-encodes the video
+    kwargs["video_modified"] = False
     return kwargs
 
 
-def apply_shake(clip, shake_intensity: float):
+def reset_forked_readers():
+    """
+    Call in a forked child process before reading frames. The child inherited the
+    parent's ffmpeg reader pipes, so video readers are detached and reopen their own
+    ffmpeg process on the next frame. Audio readers are only detached, so that the
+    child never terminates the parent's processes.
+    """
+    from moviepy.audio.io.readers import FFMPEG_AudioReader
+    from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+
+    for obj in gc.get_objects():
+        if isinstance(obj, (FFMPEG_VideoReader, FFMPEG_AudioReader)):
+            obj.proc = None
+
+
+def apply_shake(clip, shake_intensity, fps: float | None = None):
     """
     Apply shake effect to a clip.
     The image is randomly shifted in x and y according to the intensity.
+    shake_intensity is either a float or a per-frame envelope sampled at fps
+    (defaults to the clip fps).
     """
+    envelope = None
+    if np.ndim(shake_intensity):
+        envelope = np.asarray(shake_intensity, dtype=float)
+        fps = fps or clip.fps
 
     def shake_transform(get_frame, t):
         frame = get_frame(t)
-        dx = int(np.random.uniform(-shake_intensity, shake_intensity))
-        dy = int(np.random.uniform(-shake_intensity, shake_intensity))
+        intensity = shake_intensity
+        if envelope is not None:
+            intensity = envelope[min(int(t * fps), len(envelope) - 1)]
+        dx = int(np.random.uniform(-intensity, intensity))
+        dy = int(np.random.uniform(-intensity, intensity))
         shaken_frame = np.roll(frame, dx, axis=1)
         shaken_frame = np.roll(shaken_frame, dy, axis=0)
         return shaken_frame